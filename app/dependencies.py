@@ -6,6 +6,9 @@ Sigue el principio de Inversión de Dependencias (DIP)
 from functools import lru_cache
 from .repositories.property_repository import PropertyRepository, DatabaseConnection, IPropertyRepository
 from .services.property_service import PropertyService, IPropertyService
+from .services.llm_coordination_service import LLMService
+from .services.query_log_service import QueryLog
+from .services.warmup_service import WarmupService
 
 
 class DependencyContainer:
@@ -29,6 +32,9 @@ class DependencyContainer:
         self._db_connection = None
         self._property_repository = None
         self._property_service = None
+        self._query_log = None
+        self._llm_service = None
+        self._warmup_service = None
         self._initialized = True
     
     @property
@@ -51,6 +57,30 @@ class DependencyContainer:
         if self._property_service is None:
             self._property_service = PropertyService(self.property_repository)
         return self._property_service
+    
+    @property
+    def query_log(self) -> QueryLog:
+        """Obtener instancia del log de consultas"""
+        if self._query_log is None:
+            self._query_log = QueryLog()
+        return self._query_log
+    
+    @property
+    def llm_service(self) -> LLMService:
+        """
+        Obtener instancia compartida del servicio LLM
+        Se comparte entre requests para reutilizar caches y snapshot del catálogo
+        """
+        if self._llm_service is None:
+            self._llm_service = LLMService(query_log=self.query_log)
+        return self._llm_service
+    
+    @property
+    def warmup_service(self) -> WarmupService:
+        """Obtener instancia del servicio de calentamiento"""
+        if self._warmup_service is None:
+            self._warmup_service = WarmupService(self.llm_service)
+        return self._warmup_service
 
 
 # Instancia global del contenedor
@@ -69,3 +99,16 @@ def get_property_service() -> IPropertyService:
             return service.get_all_properties()
     """
     return _container.property_service
+
+
+def get_llm_service() -> LLMService:
+    """
+    Función de inyección de dependencias para FastAPI
+    Retorna el servicio LLM compartido
+    """
+    return _container.llm_service
+
+
+def get_warmup_service() -> WarmupService:
+    """Retorna el servicio de calentamiento usado por el lifespan de la app"""
+    return _container.warmup_service
@@ -1,9 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, JSONResponse
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
+import asyncio
 from pathlib import Path
 import logging
 
@@ -19,13 +21,55 @@ logger.info(f"Cargando .env desde: {env_path}")
 logger.info(f"OLLAMA_API_KEY configurada: {bool(os.getenv('OLLAMA_API_KEY'))}")
 logger.info(f"USE_OLLAMA_CLOUD: {os.getenv('USE_OLLAMA_CLOUD')}")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Ciclo de vida de la aplicación
+    Abre la sesión HTTP persistente hacia Ollama y lanza el calentamiento de caches
+    en segundo plano; /ready responde 503 hasta que termine
+    También lanza el heartbeat que mantiene cargados los modelos de Ollama local
+    """
+    app.state.ready = False
+    app.state.warmup_service = None
+    warmup_task = None
+    heartbeat_task = None
+    ollama_client = None
+
+    try:
+        from .dependencies import get_llm_service, get_warmup_service
+        ollama_client = get_llm_service().ollama_client
+        await ollama_client.open()
+
+        warmup_service = get_warmup_service()
+        app.state.warmup_service = warmup_service
+
+        async def run_warmup():
+            await warmup_service.warm()
+            app.state.ready = True
+
+        warmup_task = asyncio.create_task(run_warmup())
+        heartbeat_task = asyncio.create_task(ollama_client.keepalive.run_heartbeat(ollama_client))
+    except Exception as e:
+        # Sin servicio LLM no hay nada que calentar; no bloquear la readiness
+        logger.error(f"No se pudo iniciar el warm-up: {e}")
+        app.state.ready = True
+
+    yield
+
+    for task in (warmup_task, heartbeat_task):
+        if task and not task.done():
+            task.cancel()
+    if ollama_client is not None:
+        await ollama_client.close()
+
 # Crear la aplicación FastAPI con metadatos para Swagger
 app = FastAPI(
     title="API de Productos",
     description="API para gestionar productos con FastAPI",
     version="1.0.0",
     docs_url=None,  # Deshabilitamos la ruta por defecto
-    redoc_url=None  # Deshabilitamos la documentación ReDoc
+    redoc_url=None,  # Deshabilitamos la documentación ReDoc
+    lifespan=lifespan
 )
 
 # Configurar CORS para permitir las solicitudes del frontend
@@ -49,6 +93,17 @@ async def health_check():
     """
     return {"status": "ok", "service": "backend-api"}
 
+@app.get("/ready", include_in_schema=False)
+async def readiness_check():
+    """
+    Endpoint de readiness para el balanceador: 503 hasta terminar el warm-up
+    """
+    warmup_service = getattr(app.state, 'warmup_service', None)
+    warmup_status = warmup_service.status if warmup_service else None
+    if not getattr(app.state, 'ready', False):
+        return JSONResponse(status_code=503, content={"status": "warming", "warmup": warmup_status})
+    return {"status": "ready", "warmup": warmup_status}
+
 @app.get("/", include_in_schema=False)
 async def root():
     """
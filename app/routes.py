@@ -1,12 +1,52 @@
-﻿from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+﻿from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional
+import asyncio
+import json
 from .models import Product, SearchIARequest, SearchIAResponse, SearchRealStateRequest, SearchRealStateResponse
 from .services.property_service import IPropertyService
-from .dependencies import get_property_service
+from .dependencies import get_property_service, get_llm_service
 from .services.llm_coordination_service import LLMService
+from .services.ollama_client_service import LLMStreamError
+from .services.llm_admission_service import llm_priority, PRIORITY_INTERACTIVE, PRIORITY_SQL
+from .services.request_deadline_service import request_deadline, route_deadline
 
 router = APIRouter()
 
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Formatea un evento Server-Sent Events"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse_token_stream(tokens: AsyncIterator[str], query: str, budget: float) -> AsyncIterator[str]:
+    """
+    Reenvía los tokens del LLM como eventos SSE
+    El deadline se instala aquí (el cuerpo se itera después de que la ruta retorna) y
+    acota la espera de cada token; al vencer se corta el stream con un evento de error
+    Si el cliente se desconecta, Starlette cancela este generador y el cierre
+    se propaga al stream upstream, que corta la generación en Ollama
+    """
+    with request_deadline(budget) as deadline:
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(tokens.__anext__(), timeout=deadline.remaining())
+                except StopAsyncIteration:
+                    break
+                yield _sse_event({"token": token})
+            yield _sse_event({"query": query}, event="done")
+        except asyncio.TimeoutError:
+            deadline.mark_partial('llm_stream')
+            yield _sse_event({"error": "Tiempo de respuesta agotado", "partial": True}, event="error")
+        except LLMStreamError as e:
+            yield _sse_event({"error": str(e)}, event="error")
+        finally:
+            await tokens.aclose()
+
 @router.get("/api/products", tags=["Productos"])
 async def get_products(service: IPropertyService = Depends(get_property_service)):
     result = service.get_all_properties()
@@ -45,7 +85,7 @@ async def delete_product(product_id: int, service: IPropertyService = Depends(ge
 
 
 @router.post("/api/search-ia", tags=["IA"])
-async def search_con_ia(request: SearchIARequest):
+async def search_con_ia(request: SearchIARequest, http_request: Request, llm_service: LLMService = Depends(get_llm_service)):
     """
     Endpoint para consultas directas a la IA - Devuelve respuesta completa sin procesar.
     
@@ -59,10 +99,9 @@ async def search_con_ia(request: SearchIARequest):
         Respuesta directa y completa de la IA sin procesamiento adicional
     """
     try:
-        llm_service = LLMService()
-        
         # Usar el método search_ia del servicio
-        response = await llm_service.search_ia(request.query)
+        with request_deadline(route_deadline('search_ia', http_request.headers)):
+            response = await llm_service.search_ia(request.query)
         
         # Devolver respuesta completa de la IA
         return {
@@ -81,15 +120,45 @@ async def search_con_ia(request: SearchIARequest):
 
 
 @router.post("/api/ask-ai", tags=["IA"])
-async def ask_ai_endpoint(request: SearchIARequest):
+async def ask_ai_endpoint(request: SearchIARequest, http_request: Request, llm_service: LLMService = Depends(get_llm_service)):
     """Endpoint simple - devuelve exactamente lo que responde la IA"""
-    llm_service = LLMService()
-    response = await llm_service.ask_ai_direct(request.query)
+    with request_deadline(route_deadline('ask_ai', http_request.headers)):
+        response = await llm_service.ask_ai_direct(request.query)
     return {"response": response}
 
 
+@router.post("/api/search-ia/stream", tags=["IA"])
+async def search_con_ia_stream(request: SearchIARequest, http_request: Request, llm_service: LLMService = Depends(get_llm_service)):
+    """
+    Igual que /api/search-ia pero devuelve la respuesta token a token (text/event-stream).
+    
+    Eventos: `data: {"token": ...}` por cada fragmento, `event: done` al terminar
+    y `event: error` si la generación falla.
+    """
+    tokens = llm_service.stream_search_ia(request.query)
+    budget = route_deadline('search_ia', http_request.headers)
+    return StreamingResponse(_sse_token_stream(tokens, request.query, budget), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.post("/api/ask-ai/stream", tags=["IA"])
+async def ask_ai_stream_endpoint(request: SearchIARequest, http_request: Request, llm_service: LLMService = Depends(get_llm_service)):
+    """Igual que /api/ask-ai pero en streaming (Server-Sent Events)"""
+    tokens = llm_service.stream_ai_direct(request.query)
+    budget = route_deadline('ask_ai', http_request.headers)
+    return StreamingResponse(_sse_token_stream(tokens, request.query, budget), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/api/llm/stats", tags=["IA"])
+async def llm_stats_endpoint(llm_service: LLMService = Depends(get_llm_service)):
+    """
+    Estadísticas operativas del servicio LLM: reutilización de conexiones
+    hacia Ollama, cache de SQL y snapshot del catálogo.
+    """
+    return llm_service.get_stats()
+
+
 @router.post("/api/generate-sql", tags=["IA"])
-async def generate_sql_endpoint(request: SearchIARequest):
+async def generate_sql_endpoint(request: SearchIARequest, http_request: Request, llm_service: LLMService = Depends(get_llm_service)):
     """
     Genera consultas SQL basadas en lenguaje natural usando IA.
     
@@ -103,8 +172,8 @@ async def generate_sql_endpoint(request: SearchIARequest):
         Dict con el SQL generado, query original y metadatos
     """
     try:
-        llm_service = LLMService()
-        sql_result = await llm_service.generate_sql_async(request.query)
+        with llm_priority(PRIORITY_SQL), request_deadline(route_deadline('generate_sql', http_request.headers)):
+            sql_result = await llm_service.generate_sql_async(request.query)
         
         if sql_result.get('success'):
             return {
@@ -128,7 +197,7 @@ async def generate_sql_endpoint(request: SearchIARequest):
 
 
 @router.post("/api/search-ia-real-state", response_model=SearchRealStateResponse, tags=["IA"])
-async def search_ia_real_state(request: SearchRealStateRequest) -> SearchRealStateResponse:
+async def search_ia_real_state(request: SearchRealStateRequest, http_request: Request, llm_service: LLMService = Depends(get_llm_service)) -> SearchRealStateResponse:
     """
     Búsqueda inteligente de propiedades combinando IA con base de datos.
     
@@ -138,6 +207,9 @@ async def search_ia_real_state(request: SearchRealStateRequest) -> SearchRealSta
     3. Filtra propiedades usando LIKE con las keywords sugeridas
     4. Retorna resultados con análisis inteligente de la IA
     
+    El header opcional `X-Request-Timeout` (segundos) fija el presupuesto de la petición;
+    si se agota, las etapas pendientes se omiten y `metadata.partial` es true.
+    
     Args:
         request: SearchRealStateRequest con query y use_cloud
     
@@ -145,11 +217,11 @@ async def search_ia_real_state(request: SearchRealStateRequest) -> SearchRealSta
         SearchRealStateResponse con propiedades filtradas, keywords y análisis
     """
     try:
-        llm_service = LLMService()
-        result = await llm_service.search_ia_real_state(
-            query=request.query,
-            use_cloud=request.use_cloud
-        )
+        with llm_priority(PRIORITY_INTERACTIVE), request_deadline(route_deadline('search_real_state', http_request.headers)):
+            result = await llm_service.search_ia_real_state(
+                query=request.query,
+                use_cloud=request.use_cloud
+            )
         # Sanitizar propiedades para reducir tamaño del payload y memoria
         props = result.get('properties', []) or []
         sanitized = []
@@ -7,6 +7,26 @@ from .ollama_client_service import OllamaClient
 from .sql_validation_service import SQLService
 from .data_loader_service import DataLoader
 from .property_search_service import PropertySearchService
+from .catalog_snapshot_service import CatalogSnapshot
+from .query_log_service import QueryLog
+from .warmup_service import WarmupService
+from .fallback_store_service import JsonFallbackStore, products_fallback_store
+from .single_flight_service import SingleFlight
+from .llm_admission_service import AdmissionController, AdmissionRejected
+from .circuit_breaker_service import CircuitBreaker
+from .llm_router_service import LLMRouter, LLMBackend
+from .prompt_encoding_service import CandidateEncoder
+from .rerank_batcher_service import RerankBatcher
+from .model_policy_service import ModelPolicy
+from .model_keepalive_service import ModelKeepAlive
+from .request_deadline_service import Deadline
+from .llm_metrics_service import LLMMetrics
+from .columnar_index_service import ColumnarIndex
+from .text_index_service import TextIndex
+from .boost_plan_service import BoostPlan
+from .vector_index_service import VectorIndex
+from .gazetteer_service import Gazetteer
+from .sql_compiler_service import SQLCompiler
 
 __all__ = [
     'PropertyService', 
@@ -15,5 +35,28 @@ __all__ = [
     'OllamaClient',
     'SQLService',
     'DataLoader',
-    'PropertySearchService'
+    'PropertySearchService',
+    'CatalogSnapshot',
+    'QueryLog',
+    'WarmupService',
+    'JsonFallbackStore',
+    'products_fallback_store',
+    'SingleFlight',
+    'AdmissionController',
+    'AdmissionRejected',
+    'CircuitBreaker',
+    'LLMRouter',
+    'LLMBackend',
+    'CandidateEncoder',
+    'RerankBatcher',
+    'ModelPolicy',
+    'ModelKeepAlive',
+    'Deadline',
+    'LLMMetrics',
+    'ColumnarIndex',
+    'TextIndex',
+    'BoostPlan',
+    'VectorIndex',
+    'Gazetteer',
+    'SQLCompiler'
 ]
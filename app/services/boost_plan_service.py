@@ -0,0 +1,153 @@
+"""
+Plan de boost por consulta
+Las reglas que dependen solo de la consulta (precios, habitaciones, baños, áreas y ubicaciones
+del gazetteer con peso) se resuelven una vez; el plan se aplica como expresiones NumPy sobre las
+columnas del índice y produce un vector de puntajes
+"""
+import os
+import logging
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .columnar_index_service import ColumnarIndex
+from .gazetteer_service import default_gazetteer
+from .query_parser_service import normalize_query, parse_query
+
+logger = logging.getLogger(__name__)
+
+BOOST_PRICE = 15
+BOOST_HABITACIONES = 12
+BOOST_BANOS = 10
+BOOST_AREA = 8
+
+# Rangos razonables para considerar un número de la consulta
+PRICE_RANGE = (300000, 1000000)
+HABITACIONES_RANGE = (1, 6)
+BANOS_RANGE = (1, 5)
+AREA_RANGE = (50, 1000)
+
+PRICE_TOLERANCE = 0.10
+AREA_TOLERANCE = 0.15
+BANOS_TOLERANCE = 0.1
+
+
+class BoostPlan:
+    """Reglas de boost de una consulta; scores() para todas las filas, explain() para un registro"""
+
+    def __init__(self, query: str):
+        parsed = parse_query(query)
+        self.prices: Tuple[float, ...] = tuple(n for n in parsed.prices if PRICE_RANGE[0] <= n <= PRICE_RANGE[1])
+        self.habitaciones: Optional[int] = parsed.habitaciones if (
+            parsed.habitaciones is not None and HABITACIONES_RANGE[0] <= parsed.habitaciones <= HABITACIONES_RANGE[1]) else None
+        self.banos: Optional[float] = parsed.banos if (
+            parsed.banos is not None and BANOS_RANGE[0] <= parsed.banos <= BANOS_RANGE[1]) else None
+        self.areas: Tuple[float, ...] = tuple(n for n in parsed.areas if AREA_RANGE[0] <= n <= AREA_RANGE[1])
+        # (id, nombre, peso) de las ubicaciones con boost en el gazetteer, en el orden de la consulta;
+        # cuenta solo la primera que coincida
+        gazetteer = default_gazetteer()
+        entries = [gazetteer.get(location_id) for location_id in parsed.location_ids]
+        self.locations: Tuple[Tuple[str, str, int], ...] = tuple(
+            (entry.id, entry.name, entry.boost) for entry in entries if entry is not None and entry.boost
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.prices or self.habitaciones is not None or self.banos is not None
+                    or self.areas or self.locations)
+
+    def scores(self, index: ColumnarIndex, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Boost total por fila (todas las del índice, o solo `rows`, en ese orden)"""
+        size = index.size if rows is None else len(rows)
+        scores = np.zeros(size, dtype=np.float64)
+        if not self or not size:
+            return scores
+
+        def column(values: np.ndarray) -> np.ndarray:
+            return values if rows is None else values[rows]
+
+        # Las comparaciones con NaN (valores inválidos) son False: sin boost
+        with np.errstate(invalid='ignore'):
+            if self.prices:
+                precio = column(index.precio)
+                near = np.zeros(size, dtype=bool)
+                for price in self.prices:
+                    near |= np.abs(precio - price) / price <= PRICE_TOLERANCE
+                scores += BOOST_PRICE * near
+
+            if self.habitaciones is not None:
+                scores += BOOST_HABITACIONES * (np.trunc(column(index.habitaciones)) == self.habitaciones)
+
+            if self.banos is not None:
+                scores += BOOST_BANOS * (np.abs(column(index.banos) - self.banos) <= BANOS_TOLERANCE)
+
+            if self.areas:
+                area = column(index.area_m2)
+                near = np.zeros(size, dtype=bool)
+                for target in self.areas:
+                    near |= np.abs(area - target) / target <= AREA_TOLERANCE
+                scores += BOOST_AREA * near
+
+        if self.locations:
+            pending = np.ones(size, dtype=bool)
+            for location_id, _, boost in self.locations:
+                hit = index.location_id_mask(location_id, rows) & pending
+                scores += boost * hit
+                pending &= ~hit
+        return scores
+
+    def explain(self, prop: dict) -> dict:
+        """Boost y razones de un registro (para la página de resultados)"""
+        boost_info = {'total_boost': 0, 'reasons': []}
+        precio = _as_float(prop.get('precio', 0))
+        for price in self.prices:
+            if precio is not None and abs(precio - price) / price <= PRICE_TOLERANCE:
+                boost_info['total_boost'] += BOOST_PRICE
+                boost_info['reasons'].append(f"Precio cercano a Q{price:,.0f} (+{BOOST_PRICE})")
+                break
+
+        habitaciones = _as_float(prop.get('habitaciones', 0))
+        if self.habitaciones is not None and habitaciones is not None and int(habitaciones) == self.habitaciones:
+            boost_info['total_boost'] += BOOST_HABITACIONES
+            boost_info['reasons'].append(f"Habitaciones exactas: {self.habitaciones} (+{BOOST_HABITACIONES})")
+
+        banos = _as_float(prop.get('banos', 0))
+        if self.banos is not None and banos is not None and abs(banos - self.banos) <= BANOS_TOLERANCE:
+            boost_info['total_boost'] += BOOST_BANOS
+            boost_info['reasons'].append(f"Baños exactos: {self.banos} (+{BOOST_BANOS})")
+
+        area = _as_float(prop.get('area_m2', 0))
+        for target in self.areas:
+            if area is not None and abs(area - target) / target <= AREA_TOLERANCE:
+                boost_info['total_boost'] += BOOST_AREA
+                boost_info['reasons'].append(f"Área cercana a {target}m² (+{BOOST_AREA})")
+                break
+
+        ubicacion_ids = default_gazetteer().location_ids(prop.get('ubicacion') or '') if self.locations else ()
+        for location_id, name, boost in self.locations:
+            if location_id in ubicacion_ids:
+                boost_info['total_boost'] += boost
+                boost_info['reasons'].append(f"Ubicación específica: {name} (+{boost})")
+                break
+        return boost_info
+
+    def __repr__(self) -> str:
+        return (f"BoostPlan(prices={self.prices}, habitaciones={self.habitaciones}, banos={self.banos}, "
+                f"areas={self.areas}, locations={[location_id for location_id, _, _ in self.locations]})")
+
+
+def _as_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=int(os.getenv('BOOST_PLAN_CACHE_SIZE', 256)))
+def _plan_for(text: str) -> BoostPlan:
+    return BoostPlan(text)
+
+
+def boost_plan(query: Optional[str]) -> BoostPlan:
+    """Plan de boost memoizado por consulta normalizada"""
+    return _plan_for(normalize_query(query or ''))
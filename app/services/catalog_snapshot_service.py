@@ -0,0 +1,140 @@
+"""
+Snapshot en memoria del catálogo de propiedades
+"""
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+from .columnar_index_service import ColumnarIndex, IndexedRecords
+from .text_index_service import TextIndex
+from .vector_index_service import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogRecords(IndexedRecords):
+    """
+    Copia de la lista del catálogo que conserva sus índices (columnar y de texto)
+    Permite a los filtros usar los índices en vez de recorrer los dicts
+    """
+
+    def __init__(self, index: ColumnarIndex, text_index: Optional[TextIndex] = None):
+        super().__init__(index.records, index)
+        self.text_index = text_index
+
+
+class CatalogSnapshot:
+    """
+    Mantiene una copia en memoria del catálogo completo (DB o JSON)
+    Se recarga de forma perezosa cuando supera su TTL: una sola recarga aunque lleguen
+    varias peticiones a la vez, y tras un error no se reintenta hasta pasados retry_seconds
+    """
+
+    def __init__(self, loader: Callable[[], dict], ttl_seconds: Optional[int] = None,
+                 vector_index: Optional[VectorIndex] = None):
+        """
+        loader: función que retorna un dict con 'properties' y 'data_source'
+        vector_index: índice vectorial que se sincroniza en cada carga (embeddings persistidos)
+        """
+        self._loader = loader
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.getenv('CATALOG_SNAPSHOT_TTL', 300))
+        self.retry_seconds = float(os.getenv('CATALOG_SNAPSHOT_RETRY', 30))
+        self._properties: List[Dict] = []
+        self._lock = threading.Lock()
+        self.data_source: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.version = 0
+        self.failures = 0
+        # Si la última recarga falló, momento desde el que se puede volver a intentar
+        self._retry_at: Optional[float] = None
+        self.index: Optional[ColumnarIndex] = None
+        # El índice de texto persiste entre cargas y se actualiza solo con los cambios
+        self.text_index = TextIndex()
+        self.vector_index = vector_index
+
+    def load(self) -> int:
+        """Carga (o recarga) el catálogo completo y retorna el número de propiedades"""
+        with self._lock:
+            return self._load()
+
+    def _load(self) -> int:
+        """Carga el catálogo (requiere el lock); el snapshot anterior sigue vigente si el loader falla"""
+        started = time.perf_counter()
+        result = self._loader() or {}
+        properties = result.get('properties', []) or []
+        index = ColumnarIndex(properties, self.version + 1)
+        self._properties = properties
+        self.data_source = result.get('data_source', 'unknown')
+        self.loaded_at = time.time()
+        self.version += 1
+        self.index = index
+        self._retry_at = None
+        text_changes = self.text_index.sync(self._properties)
+        if self.vector_index is not None:
+            try:
+                self.vector_index.sync(self._properties)
+            except Exception as e:
+                logger.error(f"Error sincronizando índice vectorial: {e}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Snapshot de catálogo v{self.version}: {len(self._properties)} propiedades desde {self.data_source} ({elapsed_ms:.0f} ms), índice de texto: {text_changes}")
+        return len(self._properties)
+
+    def _should_reload(self) -> bool:
+        return self.is_stale() and (self._retry_at is None or time.time() >= self._retry_at)
+
+    def _reload_if_stale(self):
+        """Recarga perezosa con doble verificación: las peticiones que esperaban el lock no repiten la carga"""
+        if not self._should_reload():
+            return
+        with self._lock:
+            if not self._should_reload():
+                return
+            try:
+                self._load()
+            except Exception as e:
+                self.failures += 1
+                self._retry_at = time.time() + self.retry_seconds
+                logger.error(f"Error recargando snapshot de catálogo (reintento en {self.retry_seconds:.0f}s): {e}")
+
+    def is_loaded(self) -> bool:
+        """Indica si el snapshot ya fue cargado al menos una vez"""
+        return self.loaded_at is not None
+
+    def is_stale(self) -> bool:
+        """Indica si el snapshot superó su TTL"""
+        if not self.is_loaded():
+            return True
+        return self.ttl_seconds > 0 and (time.time() - self.loaded_at) > self.ttl_seconds
+
+    def get_properties(self) -> List[Dict]:
+        """
+        Retorna las propiedades del snapshot, recargando si está vencido
+        La lista es compartida: los llamadores no deben modificarla
+        """
+        self._reload_if_stale()
+        return self._properties
+
+    def get_records(self) -> CatalogRecords:
+        """Copia de las propiedades con su índice columnar, recargando si está vencido"""
+        self.get_properties()
+        index = self.index
+        if index is None:
+            return CatalogRecords(ColumnarIndex([]))
+        return CatalogRecords(index, self.text_index)
+
+    def get_stats(self) -> dict:
+        """Estado actual del snapshot"""
+        return {
+            'loaded': self.is_loaded(),
+            'size': len(self._properties),
+            'data_source': self.data_source,
+            'version': self.version,
+            'age_seconds': round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            'ttl_seconds': self.ttl_seconds,
+            'failures': self.failures,
+            'retry_in_seconds': round(max(0.0, self._retry_at - time.time()), 1) if self._retry_at else None,
+            'columnar_index': self.index.get_stats() if self.index is not None else None,
+            'text_index': self.text_index.get_stats(),
+            'vector_index': self.vector_index.get_stats() if self.vector_index is not None else None
+        }
@@ -0,0 +1,154 @@
+"""
+Circuit breaker para las llamadas al LLM
+Abre el circuito por tasa de error o por latencia p95 sobre una ventana deslizante
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+PERMIT_NORMAL = 'normal'
+PERMIT_PROBE = 'probe'
+
+
+class CircuitBreaker:
+    """
+    - closed: todas las llamadas pasan; se evalúa la ventana tras cada resultado
+    - open: las llamadas se rechazan hasta que pasa open_seconds
+    - half_open: se deja pasar una llamada de prueba; si va bien se cierra, si no se reabre
+    """
+
+    def __init__(self, window_size: Optional[int] = None, min_calls: Optional[int] = None,
+                 error_rate_threshold: Optional[float] = None, latency_slo_ms: Optional[float] = None,
+                 open_seconds: Optional[float] = None):
+        self.window_size = window_size or int(os.getenv('OLLAMA_BREAKER_WINDOW', 50))
+        self.min_calls = min_calls or int(os.getenv('OLLAMA_BREAKER_MIN_CALLS', 10))
+        self.error_rate_threshold = error_rate_threshold or float(os.getenv('OLLAMA_BREAKER_ERROR_RATE', 0.5))
+        self.latency_slo_ms = latency_slo_ms or float(os.getenv('OLLAMA_LATENCY_SLO_MS', 20000))
+        self.open_seconds = open_seconds or float(os.getenv('OLLAMA_BREAKER_OPEN_SECONDS', 30))
+        self.enabled = os.getenv('OLLAMA_BREAKER_ENABLED', 'true').lower() == 'true'
+        self._lock = threading.Lock()
+        self._window = deque(maxlen=self.window_size)  # (ok, latency_ms)
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {
+            'opened': 0,
+            'rejected': 0,
+            'probes': 0
+        }
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def acquire_permit(self) -> Optional[str]:
+        """
+        Decide si una llamada puede ir al upstream
+        Retorna None si se rechaza, PERMIT_PROBE si es la llamada de prueba de half-open
+        o PERMIT_NORMAL en otro caso; el permiso se devuelve en record_* o release
+        """
+        if not self.enabled:
+            return PERMIT_NORMAL
+        with self._lock:
+            if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = STATE_HALF_OPEN
+                logger.info("Circuit breaker LLM en half-open, enviando llamada de prueba")
+            if self._state == STATE_CLOSED:
+                return PERMIT_NORMAL
+            if self._state == STATE_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._stats['probes'] += 1
+                return PERMIT_PROBE
+            self._stats['rejected'] += 1
+            return None
+
+    def should_degrade(self) -> bool:
+        """
+        True si conviene saltar las etapas LLM sin intentar (circuito abierto o prueba en curso)
+        No reserva la llamada de prueba: al vencer open_seconds deja pasar tráfico para probar
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self._state == STATE_OPEN:
+                return time.monotonic() - self._opened_at < self.open_seconds
+            return self._state == STATE_HALF_OPEN and self._probe_in_flight
+
+    def record_success(self, permit: str, latency_ms: float):
+        """Registra una llamada exitosa con su latencia"""
+        self._record(permit, True, latency_ms)
+
+    def record_failure(self, permit: str, latency_ms: float):
+        """Registra una llamada fallida (timeout, 429, 5xx, error de transporte)"""
+        self._record(permit, False, latency_ms)
+
+    def release(self, permit: str):
+        """Devuelve el permiso de una llamada que terminó sin resultado de salud"""
+        if permit == PERMIT_PROBE:
+            with self._lock:
+                self._probe_in_flight = False
+
+    def _record(self, permit: str, ok: bool, latency_ms: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._window.append((ok, latency_ms))
+
+            if permit == PERMIT_PROBE:
+                self._probe_in_flight = False
+                if self._state != STATE_HALF_OPEN:
+                    return
+                if ok and latency_ms <= self.latency_slo_ms:
+                    self._state = STATE_CLOSED
+                    self._window.clear()
+                    logger.info("Circuit breaker LLM cerrado, modo IA restaurado")
+                else:
+                    self._open(f"prueba fallida ({latency_ms:.0f} ms)")
+                return
+
+            if self._state == STATE_CLOSED and len(self._window) >= self.min_calls:
+                error_rate = self._error_rate()
+                p95 = self._p95()
+                if error_rate >= self.error_rate_threshold:
+                    self._open(f"tasa de error {error_rate:.0%}")
+                elif p95 > self.latency_slo_ms:
+                    self._open(f"latencia p95 {p95:.0f} ms > SLO {self.latency_slo_ms:.0f} ms")
+
+    def _open(self, reason: str):
+        """Abre el circuito (requiere el lock)"""
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._stats['opened'] += 1
+        logger.warning(f"Circuit breaker LLM abierto por {reason}; degradando a búsqueda por reglas")
+
+    def _error_rate(self) -> float:
+        if not self._window:
+            return 0.0
+        return sum(1 for ok, _ in self._window if not ok) / len(self._window)
+
+    def _p95(self) -> float:
+        if not self._window:
+            return 0.0
+        latencies = sorted(latency for _, latency in self._window)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def get_stats(self) -> dict:
+        """Estado del circuit breaker"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self._state
+            stats['window_calls'] = len(self._window)
+            stats['error_rate'] = round(self._error_rate(), 3)
+            stats['p95_ms'] = round(self._p95(), 1)
+        stats['enabled'] = self.enabled
+        stats['latency_slo_ms'] = self.latency_slo_ms
+        return stats
@@ -0,0 +1,210 @@
+"""
+Índice columnar del catálogo (NumPy)
+Columnas numéricas y códigos categóricos para evaluar QueryFilters como máscaras
+booleanas sobre todo el catálogo, sin recorrer los dicts en Python
+"""
+import time
+import logging
+from typing import Dict, FrozenSet, List, Optional
+
+import numpy as np
+
+from .gazetteer_service import default_gazetteer
+from .query_parser_service import QueryFilters
+
+logger = logging.getLogger(__name__)
+
+
+def _to_float(value) -> float:
+    """Como float() de _matches_strict_filters; NaN si no es convertible (la fila no pasa los filtros de esa columna)"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def location_matches(ubicacion: str, term: str) -> bool:
+    """Misma regla que _matches_strict_filters: subcadena o al menos la mitad de las palabras"""
+    if term in ubicacion:
+        return True
+    words = term.split()
+    return sum(1 for word in words if word in ubicacion) >= len(words) / 2
+
+
+class ColumnarIndex:
+    """
+    Columnas del catálogo alineadas con `records` (fila i = records[i])
+    - precio, habitaciones, banos, area_m2: float64 (0 si falta el campo, NaN si es inválido)
+    - fecha_publicacion: datetime64[D] (NaT si falta)
+    - tipo y ubicación: códigos enteros sobre sus valores únicos; zona: número de zona (0 si no tiene)
+    - location_ids: ids del gazetteer de cada valor único de ubicación
+    """
+
+    def __init__(self, records: List[dict], version: int = 0):
+        started = time.perf_counter()
+        size = len(records)
+        self.records = records
+        self.version = version
+        self.size = size
+
+        self.ids = np.full(size, -1, dtype=np.int64)
+        self.precio = np.empty(size, dtype=np.float64)
+        self.habitaciones = np.empty(size, dtype=np.float64)
+        self.banos = np.empty(size, dtype=np.float64)
+        self.area_m2 = np.empty(size, dtype=np.float64)
+        self.fecha = np.full(size, np.datetime64('NaT'), dtype='datetime64[D]')
+        self.tipo = np.empty(size, dtype=np.int32)
+        self.ubicacion = np.empty(size, dtype=np.int32)
+        self.zona = np.zeros(size, dtype=np.int16)
+
+        self.tipo_codes: Dict[Optional[str], int] = {}
+        self.ubicacion_values: List[str] = []
+        ubicacion_codes: Dict[str, int] = {}
+
+        for row, record in enumerate(records):
+            record_id = record.get('id')
+            if isinstance(record_id, int):
+                self.ids[row] = record_id
+            self.precio[row] = _to_float(record.get('precio', 0))
+            self.habitaciones[row] = _to_float(record.get('habitaciones', 0))
+            self.banos[row] = _to_float(record.get('banos', 0))
+            self.area_m2[row] = _to_float(record.get('area_m2', 0))
+            fecha = record.get('fecha_publicacion')
+            if fecha:
+                try:
+                    self.fecha[row] = np.datetime64(str(fecha)[:10], 'D')
+                except ValueError:
+                    pass
+            self.tipo[row] = self.tipo_codes.setdefault(record.get('tipo'), len(self.tipo_codes))
+
+            ubicacion = (record.get('ubicacion') or '').lower()
+            code = ubicacion_codes.get(ubicacion)
+            if code is None:
+                code = ubicacion_codes[ubicacion] = len(self.ubicacion_values)
+                self.ubicacion_values.append(ubicacion)
+            self.ubicacion[row] = code
+
+        # Zona e ids del gazetteer por valor único de ubicación, luego a filas por código
+        gazetteer = default_gazetteer()
+        zones = np.zeros(max(len(self.ubicacion_values), 1), dtype=np.int16)
+        self.location_ids: List[FrozenSet[str]] = []
+        for code, ubicacion in enumerate(self.ubicacion_values):
+            zones[code] = gazetteer.zone_of(ubicacion)
+            self.location_ids.append(gazetteer.location_ids(ubicacion))
+        if size:
+            self.zona = zones[self.ubicacion]
+
+        # _matches_strict_filters convierte precio y área siempre: si no son válidos la fila no pasa
+        self.base_valid = ~(np.isnan(self.precio) | np.isnan(self.area_m2))
+        self._location_masks: Dict[str, np.ndarray] = {}
+        self._contains_masks: Dict[str, np.ndarray] = {}
+        self._location_id_masks: Dict[str, np.ndarray] = {}
+        self.build_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def location_mask(self, term: str) -> np.ndarray:
+        """Máscara por fila para ubicacion_incluye, evaluada una vez por valor único"""
+        term = term.lower()
+        unique_mask = self._location_masks.get(term)
+        if unique_mask is None:
+            unique_mask = np.fromiter((location_matches(u, term) for u in self.ubicacion_values),
+                                      dtype=bool, count=len(self.ubicacion_values))
+            self._location_masks[term] = unique_mask
+        return unique_mask[self.ubicacion] if self.size else np.zeros(0, dtype=bool)
+
+    def contains_mask(self, term: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Máscara de filas cuya ubicación contiene `term` (subcadena), por valor único"""
+        unique_mask = self._contains_masks.get(term)
+        if unique_mask is None:
+            unique_mask = np.fromiter((term in u for u in self.ubicacion_values),
+                                      dtype=bool, count=len(self.ubicacion_values))
+            self._contains_masks[term] = unique_mask
+        codes = self.ubicacion if rows is None else self.ubicacion[rows]
+        return unique_mask[codes] if len(codes) else np.zeros(0, dtype=bool)
+
+    def location_id_mask(self, location_id: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Máscara de filas cuya ubicación menciona el id canónico `location_id`"""
+        unique_mask = self._location_id_masks.get(location_id)
+        if unique_mask is None:
+            unique_mask = np.fromiter((location_id in ids for ids in self.location_ids),
+                                      dtype=bool, count=len(self.location_ids))
+            self._location_id_masks[location_id] = unique_mask
+        codes = self.ubicacion if rows is None else self.ubicacion[rows]
+        return unique_mask[codes] if len(codes) else np.zeros(0, dtype=bool)
+
+    def mask(self, filters: QueryFilters) -> np.ndarray:
+        """Filtros estrictos como expresión de máscaras (misma semántica que _matches_strict_filters)"""
+        mask = self.base_valid.copy()
+
+        if filters.tipo is not None:
+            mask &= self.tipo == self.tipo_codes.get(filters.tipo, -1)
+
+        precio = self.precio
+        if filters.precio_exacto is not None:
+            tolerance = filters.precio_tolerancia if filters.precio_tolerancia is not None else 0.05
+            mask &= (precio >= filters.precio_exacto * (1 - tolerance)) & (precio <= filters.precio_exacto * (1 + tolerance))
+        if filters.precio_min is not None:
+            mask &= precio >= filters.precio_min
+        if filters.precio_max is not None:
+            mask &= precio <= filters.precio_max
+
+        habitaciones = np.trunc(self.habitaciones)
+        if filters.habitaciones is not None:
+            mask &= habitaciones == filters.habitaciones
+        if filters.habitaciones_min is not None:
+            mask &= habitaciones >= filters.habitaciones_min
+        if filters.habitaciones_max is not None:
+            mask &= habitaciones <= filters.habitaciones_max
+
+        banos = self.banos
+        if filters.banos is not None:
+            mask &= np.abs(banos - float(filters.banos)) <= 0.01
+        if filters.banos_min is not None:
+            mask &= banos >= filters.banos_min
+        if filters.banos_max is not None:
+            mask &= banos <= filters.banos_max
+
+        area = self.area_m2
+        if filters.area_exacta is not None:
+            tolerance = filters.area_tolerancia if filters.area_tolerancia is not None else 0.05
+            mask &= (area >= filters.area_exacta * (1 - tolerance)) & (area <= filters.area_exacta * (1 + tolerance))
+        if filters.area_min is not None:
+            mask &= area >= filters.area_min
+        if filters.area_max is not None:
+            mask &= area <= filters.area_max
+
+        if filters.ubicacion_id is not None:
+            mask &= self.location_id_mask(filters.ubicacion_id)
+        elif filters.ubicacion_incluye is not None:
+            mask &= self.location_mask(filters.ubicacion_incluye)
+        return mask
+
+    def select(self, mask: np.ndarray) -> 'IndexedRecords':
+        """Registros de las filas marcadas, en el orden del catálogo (conservan sus filas)"""
+        rows = np.flatnonzero(mask)
+        records = self.records
+        return IndexedRecords([records[row] for row in rows], self, rows)
+
+    def get_stats(self) -> dict:
+        columns = (self.ids, self.precio, self.habitaciones, self.banos, self.area_m2,
+                   self.fecha, self.tipo, self.ubicacion, self.zona)
+        return {
+            'rows': self.size,
+            'version': self.version,
+            'build_ms': self.build_ms,
+            'tipos': len(self.tipo_codes),
+            'ubicaciones': len(self.ubicacion_values),
+            'ubicaciones_con_id': sum(1 for ids in self.location_ids if ids),
+            'memory_bytes': int(sum(column.nbytes for column in columns))
+        }
+
+
+class IndexedRecords(list):
+    """
+    Lista de registros con el índice columnar y las filas de donde salieron
+    (rows=None: el índice completo, en orden); permite calcular sobre las columnas
+    """
+
+    def __init__(self, records: List[dict], index: ColumnarIndex, rows: Optional[np.ndarray] = None):
+        super().__init__(records)
+        self.columnar_index = index
+        self.rows = rows
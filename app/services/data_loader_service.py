@@ -1,22 +1,37 @@
 """
 Servicio para carga de datos desde base de datos y JSON
 """
-import json
+import asyncio
 import logging
 import mysql.connector
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 import os
 from .sql_validation_service import SQLService
+from .sql_compiler_service import CompiledQuery, SQLCompiler, SQL_SOURCE_COMPILED, SQL_SOURCE_LLM
+from .catalog_snapshot_service import CatalogSnapshot
+from .vector_index_service import VectorIndex, create_embedder
+from .fallback_store_service import products_fallback_store
+from .request_deadline_service import current_deadline, min_stage_seconds
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# ER_QUERY_TIMEOUT: el query superó MAX_EXECUTION_TIME
+MAX_EXECUTION_TIME_EXCEEDED = 3024
+
 class DataLoader:
     def __init__(self, sql_service: SQLService):
         self.sql_service = sql_service
+        # SQL determinista para consultas que el parser cubre por completo (sin LLM)
+        self.sql_compiler = SQLCompiler()
+        # Snapshot del catálogo completo, usado como fallback en memoria
+        self.catalog = CatalogSnapshot(
+            self.load_properties_from_db_or_json_with_query,
+            vector_index=VectorIndex(create_embedder(sql_service.ollama_client))
+        )
 
     def load_properties_from_db_or_json_with_query(self) -> dict:
         """
@@ -47,15 +62,32 @@ class DataLoader:
 
     def load_properties_from_generated_query_with_info(self, user_query: str) -> dict:
         """
-        Genera SQL con IA y ejecuta query en base de datos
+        Wrapper síncrono de load_properties_from_generated_query_with_info_async
+        """
+        return self.sql_service.ollama_client.run_sync(
+            self.load_properties_from_generated_query_with_info_async(user_query)
+        )
+
+    async def load_properties_from_generated_query_with_info_async(self, user_query: str) -> dict:
+        """
+        Genera SQL con IA y ejecuta query en base de datos sin bloquear el event loop
+        Si el parser cubre toda la consulta el SQL se compila de los filtros y no se llama al LLM
         Retorna propiedades + información del query generado
         """
         try:
+            compiled = self.sql_compiler.plan(user_query)
+            if compiled is not None:
+                return await self._load_from_compiled_query(user_query, compiled)
+
             # Generar SQL con IA
-            sql_result = self.sql_service.generate_sql(user_query)
+            sql_result = await self.sql_service.generate_sql_async(user_query)
             
             if not sql_result['success']:
                 logger.warning(f"No se pudo generar SQL: {sql_result.get('error')}")
+                deadline = current_deadline()
+                if deadline is not None and not deadline.allows(min_stage_seconds()):
+                    # Falló por falta de presupuesto: la respuesta es parcial
+                    deadline.mark_partial('sql_generation')
                 return {
                     'properties': [],
                     'data_source': 'none',
@@ -68,51 +100,94 @@ class DataLoader:
             logger.info(f"SQL generado para '{user_query}': {generated_sql}")
             
             # Ejecutar query en base de datos
-            db_properties = self.execute_generated_query(generated_sql)
+            db_properties = await self.execute_generated_query_async(generated_sql)
             
             if db_properties is not None:
                 return {
                     'properties': db_properties,
                     'data_source': 'database',
                     'user_query': user_query,
-                    'generated_sql': generated_sql
+                    'generated_sql': generated_sql,
+                    'sql_source': SQL_SOURCE_LLM
                 }
             else:
-                # Fallback a método normal si falla la ejecución
+                # Fallback al snapshot del catálogo si falla la ejecución
                 logger.warning("Fallo ejecutando query generado, usando fallback")
                 return {
-                    'properties': self._load_from_json(),
-                    'data_source': 'json',
+                    'properties': await self.get_catalog_properties_async(),
+                    'data_source': self.catalog.data_source or 'json',
                     'user_query': user_query,
                     'generated_sql': generated_sql,
+                    'sql_source': SQL_SOURCE_LLM,
                     'fallback_reason': 'Error ejecutando query en DB'
                 }
                 
         except Exception as e:
             logger.error(f"Error en load_properties_from_generated_query_with_info: {e}")
             return {
-                'properties': self._load_from_json(),
-                'data_source': 'json',
+                'properties': await self.get_catalog_properties_async(),
+                'data_source': self.catalog.data_source or 'json',
                 'user_query': user_query,
                 'generated_sql': None,
                 'error': str(e)
             }
 
-    def execute_generated_query(self, sql: str) -> Optional[List[Dict]]:
+    async def _load_from_compiled_query(self, user_query: str, compiled: CompiledQuery) -> dict:
+        """Ejecuta el SQL compilado; si la DB falla responde con el snapshot del catálogo"""
+        db_properties = await self.execute_generated_query_async(compiled.sql, compiled.params)
+        result = {
+            'user_query': user_query,
+            'generated_sql': compiled.sql,
+            'sql_params': list(compiled.params),
+            'sql_source': SQL_SOURCE_COMPILED,
+            'sql_confidence': compiled.confidence
+        }
+        if db_properties is not None:
+            result.update(properties=compiled.refine(db_properties), data_source='database')
+        else:
+            logger.warning("Fallo ejecutando query compilado, usando fallback")
+            result.update(properties=await self.get_catalog_properties_async(),
+                          data_source=self.catalog.data_source or 'json',
+                          fallback_reason='Error ejecutando query en DB')
+        return result
+
+    async def execute_generated_query_async(self, sql: str, params: Optional[tuple] = None) -> Optional[List[Dict]]:
+        """
+        Ejecuta el query generado en un hilo del pool (mysql-connector es bloqueante)
+        """
+        return await asyncio.to_thread(self.execute_generated_query, sql, params)
+
+    async def get_catalog_properties_async(self) -> List[Dict]:
+        """
+        Copia de las propiedades del snapshot con su índice columnar (CatalogRecords)
+        La recarga (si vence) y la construcción del índice corren fuera del event loop
         """
-        Ejecuta un query SQL generado por IA en la base de datos
+        return await asyncio.to_thread(self.catalog.get_records)
+
+    def execute_generated_query(self, sql: str, params: Optional[tuple] = None) -> Optional[List[Dict]]:
+        """
+        Ejecuta un query SQL generado por IA (o compilado, con `params`) en la base de datos
+        Con deadline de petición el query se limita con MAX_EXECUTION_TIME al tiempo restante
         """
         if not self.sql_service.validate_sql(sql):
             logger.warning(f"SQL no válido o inseguro: {sql}")
             return None
         
+        deadline = current_deadline()
+        if deadline is not None and not deadline.allows(min_stage_seconds()):
+            deadline.mark_partial('database')
+            return None
+        
         try:
-            connection = self._get_db_connection()
+            connection = self._get_db_connection(timeout=deadline.remaining() if deadline is not None else None)
             if not connection:
                 return None
             
             cursor = connection.cursor(dictionary=True)
-            cursor.execute(sql)
+            if deadline is not None:
+                # Solo aplica a SELECT (el único tipo que pasa validate_sql)
+                cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {max(1, int(deadline.remaining() * 1000))}")
+            cursor.execute(sql, params)
             results = cursor.fetchall()
             
             # Convertir Decimal a float para JSON
@@ -133,6 +208,8 @@ class DataLoader:
             return processed_results
             
         except mysql.connector.Error as e:
+            if e.errno == MAX_EXECUTION_TIME_EXCEEDED and deadline is not None:
+                deadline.mark_partial('database')
             logger.error(f"Error ejecutando query generado: {e}")
             return None
         except Exception as e:
@@ -216,30 +293,20 @@ class DataLoader:
             return None
 
     def _load_from_json(self) -> List[Dict]:
-        """Carga propiedades desde archivo JSON"""
+        """Carga propiedades desde archivo JSON (parseado una sola vez por el almacén compartido)"""
         try:
-            json_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'products.json')
-            
-            with open(json_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                
-                # El JSON puede ser un array directamente o tener una clave 'propiedades'
-                if isinstance(data, list):
-                    properties = data
-                elif isinstance(data, dict) and 'propiedades' in data:
-                    properties = data['propiedades']
-                else:
-                    logger.error(f"Formato de JSON no reconocido: {type(data)}")
-                    return []
-                
-                logger.info(f"Cargadas {len(properties)} propiedades desde JSON")
-                return properties
+            properties = list(products_fallback_store.get_records())
+            logger.info(f"Cargadas {len(properties)} propiedades desde JSON")
+            return properties
         except Exception as e:
             logger.error(f"Error cargando desde JSON: {e}")
             return []
 
-    def _get_db_connection(self):
-        """Obtiene conexión a base de datos MySQL"""
+    def _get_db_connection(self, timeout: Optional[float] = None):
+        """Obtiene conexión a base de datos MySQL (timeout de conexión opcional, en segundos)"""
+        options = {}
+        if timeout is not None:
+            options['connection_timeout'] = max(1, int(timeout))
         try:
             connection = mysql.connector.connect(
                 host=os.getenv('DB_HOST', 'mysql'),
@@ -248,7 +315,8 @@ class DataLoader:
                 user=os.getenv('DB_USER', 'root'),
                 password=os.getenv('DB_PASSWORD', 'rootpassword'),
                 charset='utf8mb4',
-                collation='utf8mb4_unicode_ci'
+                collation='utf8mb4_unicode_ci',
+                **options
             )
             return connection
         except Exception as e:
@@ -0,0 +1,122 @@
+"""
+Almacén en memoria del archivo JSON de respaldo (app/data/products.json)
+"""
+import os
+import sys
+import json
+import marshal
+import logging
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRODUCTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'products.json')
+
+# El formato de marshal depende de la versión de Python
+_BINARY_FORMAT_TAG = f"products-v1-py{sys.version_info.major}.{sys.version_info.minor}"
+
+
+class JsonFallbackStore:
+    """
+    Parsea el JSON una sola vez y lo mantiene en memoria
+    Solo se recarga cuando cambia el mtime o el tamaño del archivo
+    Opcionalmente usa un archivo binario (marshal), más rápido de leer que el JSON en datasets grandes
+    """
+
+    def __init__(self, path: str = DEFAULT_PRODUCTS_PATH, use_binary_cache: Optional[bool] = None):
+        self.path = path
+        if use_binary_cache is None:
+            use_binary_cache = os.getenv('FALLBACK_BINARY_CACHE', 'false').lower() == 'true'
+        self.use_binary_cache = use_binary_cache
+        self.binary_path = f"{path}.bin"
+        self._records: List[Dict] = []
+        self._signature = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get_records(self) -> List[Dict]:
+        """
+        Retorna las propiedades del archivo, recargando solo si cambió
+        La lista es compartida: los llamadores no deben modificarla
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            logger.error(f"Archivo JSON de respaldo no disponible: {e}")
+            return []
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return self._records
+
+        with self._lock:
+            # Otro hilo pudo recargar mientras esperábamos el lock
+            if signature != self._signature:
+                self._records = self._load(signature)
+                self._signature = signature
+                self.loads += 1
+        return self._records
+
+    def _load(self, signature: tuple) -> List[Dict]:
+        """Carga desde el binario si está al día; si no, parsea el JSON"""
+        if self.use_binary_cache:
+            records = self._load_binary(signature)
+            if records is not None:
+                logger.info(f"Cargadas {len(records)} propiedades desde cache binario {self.binary_path}")
+                return records
+
+        with open(self.path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+
+        # El JSON puede ser un array directamente o tener una clave 'propiedades'
+        if isinstance(data, list):
+            records = data
+        elif isinstance(data, dict) and 'propiedades' in data:
+            records = data['propiedades']
+        else:
+            logger.error(f"Formato de JSON no reconocido: {type(data)}")
+            records = []
+
+        logger.info(f"Cargadas {len(records)} propiedades desde JSON {self.path}")
+        if self.use_binary_cache:
+            self._write_binary(signature, records)
+        return records
+
+    def _load_binary(self, signature: tuple) -> Optional[List[Dict]]:
+        """
+        Lee el binario; None si no existe o no corresponde al JSON actual
+        marshal deserializa todo el archivo de una vez, así que se lee directo (sin mmap)
+        """
+        try:
+            with open(self.binary_path, 'rb') as f:
+                tag, mtime_ns, size, records = marshal.load(f)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+
+        if tag != _BINARY_FORMAT_TAG or (mtime_ns, size) != signature:
+            return None
+        return records
+
+    def _write_binary(self, signature: tuple, records: List[Dict]):
+        """Escribe el binario de forma atómica (best-effort)"""
+        tmp_path = f"{self.binary_path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(marshal.dumps((_BINARY_FORMAT_TAG, signature[0], signature[1], records)))
+            os.replace(tmp_path, self.binary_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudo escribir el cache binario de respaldo: {e}")
+
+    def get_stats(self) -> dict:
+        """Estado del almacén"""
+        return {
+            'path': self.path,
+            'size': len(self._records),
+            'loads': self.loads,
+            'binary_cache': self.use_binary_cache
+        }
+
+
+# Instancia global compartida por PropertyService y DataLoader
+products_fallback_store = JsonFallbackStore()
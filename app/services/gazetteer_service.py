@@ -0,0 +1,211 @@
+"""
+Gazetteer de ubicaciones (zonas, municipios, barrios) desde app/data/gazetteer.json
+Nombres y alias se compilan en un autómata Aho-Corasick: una sola pasada por el texto
+encuentra todas las ubicaciones, respetando límites de palabra ('zona 1' no coincide
+dentro de 'zona 10'), y cada coincidencia se traduce a un id canónico
+"""
+import os
+import json
+import logging
+from collections import deque
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KIND_ZONE = 'zona'
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'gazetteer.json')
+
+_FOLD = str.maketrans('áéíóúü', 'aeiouu')
+
+
+def fold(word: str) -> str:
+    """Minúsculas sin tildes, para comparar 'más'/'mas', 'baño'/'bano'"""
+    return word.translate(_FOLD)
+
+
+def normalize_location_text(text: str) -> Tuple[str, List[int]]:
+    """
+    Texto para el autómata: minúsculas, sin tildes, puntuación como espacio y espacios colapsados
+    Retorna también la posición original de cada carácter (más una al final)
+    """
+    chars = []
+    offsets = []
+    for position, char in enumerate(fold(text.lower())):
+        if not char.isalnum():
+            if not chars or chars[-1] == ' ':
+                continue
+            char = ' '
+        chars.append(char)
+        offsets.append(position)
+    if chars and chars[-1] == ' ':
+        chars.pop()
+        offsets.pop()
+    offsets.append(offsets[-1] + 1 if offsets else 0)
+    return ''.join(chars), offsets
+
+
+class LocationEntry:
+    """Ubicación canónica del gazetteer"""
+
+    def __init__(self, data: dict):
+        self.id: str = data['id']
+        self.name: str = data['name']
+        self.kind: str = data.get('kind', 'barrio')
+        self.zone: Optional[int] = data.get('zone')
+        self.boost: Optional[int] = data.get('boost')
+        self.aliases: Tuple[str, ...] = tuple(data.get('aliases', ()))
+
+    def __repr__(self) -> str:
+        return f"LocationEntry({self.id})"
+
+
+class LocationMatch:
+    """Coincidencia en el texto original: [start, end) y su ubicación"""
+    __slots__ = ('start', 'end', 'entry')
+
+    def __init__(self, start: int, end: int, entry: LocationEntry):
+        self.start = start
+        self.end = end
+        self.entry = entry
+
+    def __repr__(self) -> str:
+        return f"LocationMatch({self.start}, {self.end}, {self.entry.id})"
+
+
+class _AhoCorasick:
+    """Autómata de coincidencias múltiples sobre caracteres"""
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+        for pattern_id, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = child
+                node = child
+            self.output[node].append(pattern_id)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def iter_matches(self, text: str):
+        """(fin exclusivo, id del patrón) de cada ocurrencia"""
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern_id in output[node]:
+                yield position + 1, pattern_id
+
+
+class Gazetteer:
+    """Ubicaciones canónicas y su autómata de nombres y alias"""
+
+    def __init__(self, entries: List[LocationEntry]):
+        self.entries: Dict[str, LocationEntry] = {entry.id: entry for entry in entries}
+        patterns: Dict[str, LocationEntry] = {}
+        for entry in entries:
+            for name in (entry.name,) + entry.aliases:
+                pattern = normalize_location_text(name)[0]
+                if pattern and pattern not in patterns:
+                    patterns[pattern] = entry
+        self._pattern_entries = list(patterns.values())
+        self._automaton = _AhoCorasick(list(patterns))
+        self._ids_cache: Dict[str, FrozenSet[str]] = {}
+        self._ids_cache_size = int(os.getenv('GAZETTEER_CACHE_SIZE', 4096))
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'Gazetteer':
+        path = path or os.getenv('GAZETTEER_PATH', DEFAULT_GAZETTEER_PATH)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            entries = [LocationEntry(item) for item in data.get('locations', [])]
+        except Exception as e:
+            logger.error(f"Error cargando gazetteer desde {path}: {e}")
+            entries = []
+        logger.info(f"Gazetteer con {len(entries)} ubicaciones")
+        return cls(entries)
+
+    def get(self, location_id: str) -> Optional[LocationEntry]:
+        return self.entries.get(location_id)
+
+    def find(self, text: str) -> List[LocationMatch]:
+        """
+        Ubicaciones del texto en una pasada, sin solapes (la más a la izquierda y más larga)
+        Solo cuentan coincidencias con límites de palabra a ambos lados
+        """
+        normalized, offsets = normalize_location_text(text)
+        candidates = []
+        patterns = self._automaton.patterns
+        for end, pattern_id in self._automaton.iter_matches(normalized):
+            start = end - len(patterns[pattern_id])
+            if start > 0 and normalized[start - 1] != ' ':
+                continue
+            if end < len(normalized) and normalized[end] != ' ':
+                continue
+            candidates.append((start, end, pattern_id))
+
+        candidates.sort(key=lambda match: (match[0], match[0] - match[1]))
+        matches = []
+        last_end = -1
+        for start, end, pattern_id in candidates:
+            if start >= last_end:
+                matches.append(LocationMatch(offsets[start], offsets[end - 1] + 1, self._pattern_entries[pattern_id]))
+                last_end = end
+        return matches
+
+    def location_ids(self, text: str) -> FrozenSet[str]:
+        """Ids canónicos mencionados en un texto (p. ej. la ubicación de una propiedad), cacheados"""
+        ids = self._ids_cache.get(text)
+        if ids is None:
+            ids = frozenset(match.entry.id for match in self.find(text))
+            if len(self._ids_cache) >= self._ids_cache_size:
+                self._ids_cache.clear()
+            self._ids_cache[text] = ids
+        return ids
+
+    def zone_of(self, text: str) -> int:
+        """Número de zona de un texto: la zona mencionada, si no la del barrio; 0 si no tiene"""
+        zone = 0
+        for match in self.find(text):
+            if match.entry.kind == KIND_ZONE:
+                return match.entry.zone or 0
+            if not zone and match.entry.zone:
+                zone = match.entry.zone
+        return zone
+
+    def get_stats(self) -> dict:
+        return {
+            'locations': len(self.entries),
+            'patterns': len(self._automaton.patterns),
+            'states': len(self._automaton.goto),
+            'cached_texts': len(self._ids_cache)
+        }
+
+
+@lru_cache(maxsize=1)
+def default_gazetteer() -> Gazetteer:
+    """Gazetteer compartido, cargado una vez desde GAZETTEER_PATH"""
+    return Gazetteer.load()
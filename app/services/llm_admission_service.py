@@ -0,0 +1,228 @@
+"""
+Control de admisión para llamadas al LLM
+Límite global de concurrencia con cola acotada por prioridad y descarte de carga
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from .request_deadline_service import timeout_for
+
+logger = logging.getLogger(__name__)
+
+# Prioridades (menor número = se atiende antes)
+PRIORITY_INTERACTIVE = 0    # /api/search-ia-real-state
+PRIORITY_CONVERSATIONAL = 1  # /api/search-ia, /api/ask-ai
+PRIORITY_SQL = 2            # /api/generate-sql
+PRIORITY_VALIDATION = 3     # validación de SQL con IA
+PRIORITY_BACKGROUND = 4     # warm-up y tareas internas
+
+_llm_priority: ContextVar[int] = ContextVar('llm_priority', default=PRIORITY_CONVERSATIONAL)
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """Fija la prioridad de las llamadas LLM hechas dentro del bloque"""
+    token = _llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        _llm_priority.reset(token)
+
+
+def current_llm_priority() -> int:
+    """Prioridad LLM del contexto actual"""
+    return _llm_priority.get()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Interpreta el header Retry-After (segundos o fecha HTTP)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdmissionRejected(Exception):
+    """La llamada fue descartada por el control de admisión"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Llamada LLM descartada: {reason}")
+        self.reason = reason
+
+
+class _Waiter:
+    """Entrada de la cola de espera"""
+
+    def __init__(self, priority: int, seq: int, loop: asyncio.AbstractEventLoop, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.loop = loop
+        self.future = future
+        self.granted = False
+        self.abandoned = False
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """
+    Semáforo global con cola de prioridad acotada
+    - Si la cola está llena o la espera supera el límite, se descarta (AdmissionRejected)
+    - Un 429 con Retry-After pausa las admisiones nuevas hasta que venza
+    Es seguro entre event loops (los wrappers síncronos usan loops temporales)
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None,
+                 queue_timeout: Optional[float] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv('OLLAMA_MAX_CONCURRENCY', 8))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv('OLLAMA_MAX_QUEUE', 64))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv('OLLAMA_QUEUE_TIMEOUT', 5))
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queue = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._stats = {
+            'admitted': 0,
+            'queued': 0,
+            'shed_queue_full': 0,
+            'shed_timeout': 0,
+            'rate_limited': 0
+        }
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None):
+        """Reserva un cupo de concurrencia durante el bloque"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: Optional[int] = None):
+        """Espera un cupo respetando prioridad; lanza AdmissionRejected si se descarta"""
+        if priority is None:
+            priority = current_llm_priority()
+        # La espera en cola tampoco excede el deadline de la petición
+        deadline = time.monotonic() + timeout_for(self.queue_timeout)
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            if self._active < self.max_concurrency and self._queued == 0:
+                self._active += 1
+                waiter = None
+            elif self._queued >= self.max_queue and not self._evict_lower_priority(priority):
+                self._stats['shed_queue_full'] += 1
+                raise AdmissionRejected('cola llena')
+            else:
+                waiter = _Waiter(priority, next(self._seq), loop, loop.create_future())
+                heapq.heappush(self._queue, waiter)
+                self._queued += 1
+                self._stats['queued'] += 1
+
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max(0.0, deadline - time.monotonic()))
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                with self._lock:
+                    granted = waiter.granted
+                    if not granted:
+                        waiter.abandoned = True
+                        self._queued -= 1
+                if granted:
+                    # El cupo llegó justo al vencer la espera: devolverlo
+                    self.release()
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self._stats['shed_timeout'] += 1
+                raise AdmissionRejected('tiempo de espera en cola agotado')
+
+        # Respetar la pausa por rate limit (Retry-After) sin soltar el cupo
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            if time.monotonic() + pause > deadline:
+                self.release()
+                self._stats['shed_timeout'] += 1
+                raise AdmissionRejected('upstream con rate limit')
+            try:
+                await asyncio.sleep(pause)
+            except BaseException:
+                # Cancelada durante la pausa: slot() aún no tomó el cupo, devolverlo aquí
+                self.release()
+                raise
+
+        self._stats['admitted'] += 1
+
+    def release(self):
+        """Libera un cupo, entregándolo directamente al siguiente en la cola si lo hay"""
+        with self._lock:
+            while self._queue:
+                waiter = heapq.heappop(self._queue)
+                if waiter.abandoned:
+                    continue
+                waiter.granted = True
+                self._queued -= 1
+                waiter.loop.call_soon_threadsafe(self._wake, waiter.future)
+                return
+            self._active -= 1
+
+    def _evict_lower_priority(self, priority: int) -> bool:
+        """
+        Con la cola llena, descarta al último en espera de menor prioridad que la entrante
+        (requiere el lock); retorna True si liberó un lugar
+        """
+        candidates = [w for w in self._queue if not w.abandoned and w.priority > priority]
+        if not candidates:
+            return False
+        victim = max(candidates)
+        victim.abandoned = True
+        self._queued -= 1
+        self._stats['shed_queue_full'] += 1
+        victim.loop.call_soon_threadsafe(self._reject, victim.future)
+        return True
+
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    @staticmethod
+    def _reject(future: asyncio.Future):
+        if not future.done():
+            future.set_exception(AdmissionRejected('desplazada por una llamada de mayor prioridad'))
+
+    def pause(self, seconds: float):
+        """Pausa nuevas admisiones (p. ej. tras un 429 con Retry-After)"""
+        self._stats['rate_limited'] += 1
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            logger.warning(f"Upstream con rate limit, pausando admisiones {seconds:.1f}s")
+
+    def get_stats(self) -> dict:
+        """Estado del control de admisión"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active'] = self._active
+            stats['waiting'] = self._queued
+        stats['max_concurrency'] = self.max_concurrency
+        stats['max_queue'] = self.max_queue
+        stats['queue_timeout'] = self.queue_timeout
+        stats['paused_for'] = round(max(0.0, self._paused_until - time.monotonic()), 2)
+        return stats
@@ -1,18 +1,29 @@
 """
 Servicio LLM modular que coordina todas las operaciones de IA y búsqueda de propiedades
 """
-import re
+import asyncio
 import logging
-from typing import Dict, List, Optional
+import numpy as np
+from typing import AsyncIterator, Dict, List, Optional
 from .ollama_client_service import OllamaClient
 from .sql_validation_service import SQLService
 from .data_loader_service import DataLoader
 from .property_search_service import PropertySearchService
+from .query_log_service import QueryLog
+from .llm_admission_service import llm_priority, PRIORITY_VALIDATION
+from .request_deadline_service import current_deadline, min_stage_seconds
+from .llm_metrics_service import llm_usage
+from .query_parser_service import parser_cache_stats
+from .gazetteer_service import default_gazetteer
+from .ranking_service import (
+    RankingEngine, SIGNAL_BOOST, SIGNAL_EXACT, SIGNAL_SEMANTIC, SIGNAL_TEXT,
+    membership_signal, order_signal, score_signal
+)
 
 logger = logging.getLogger(__name__)
 
 class LLMService:
-    def __init__(self):
+    def __init__(self, query_log: QueryLog = None):
         """
         Inicializa el servicio LLM modular con todos los componentes
         """
@@ -20,7 +31,9 @@ class LLMService:
         self.ollama_client = OllamaClient()
         self.sql_service = SQLService(self.ollama_client)
         self.data_loader = DataLoader(self.sql_service)
-        self.search_service = PropertySearchService(self.ollama_client)
+        self.search_service = PropertySearchService(self.ollama_client, self.data_loader.catalog.vector_index)
+        self.ranking = RankingEngine()
+        self.query_log = query_log or QueryLog()
         
         logger.info("LLM Service modular inicializado correctamente")
 
@@ -29,14 +42,33 @@ class LLMService:
     async def search_ia_real_state(self, query: str, use_cloud: bool = True) -> dict:
         """
         Búsqueda inteligente de propiedades inmobiliarias con múltiples estrategias
+        Si el LLM está degradado (circuit breaker abierto) responde con búsqueda por reglas
+        El metadata incluye los tokens y tiempos LLM de la petición (llm_usage)
         """
+        with llm_usage() as usage:
+            response = await self._search_ia_real_state(query, use_cloud)
+        response['metadata']['llm_usage'] = usage.summary()
+        return response
+
+    async def _search_ia_real_state(self, query: str, use_cloud: bool) -> dict:
         try:
             logger.info(f"Iniciando búsqueda IA para: '{query}'")
+            self.query_log.record(query)
+            
+            if self.ollama_client.breaker.should_degrade():
+                logger.warning("LLM degradado, respondiendo con búsqueda por reglas")
+                return await self._rule_based_search(query, 'circuit_open')
             
             # 1. Cargar propiedades generando SQL específico para la consulta
-            data_result = self.data_loader.load_properties_from_generated_query_with_info(query)
+            data_result = await self.data_loader.load_properties_from_generated_query_with_info_async(query)
             properties = data_result.get('properties', [])
             
+            deadline = current_deadline()
+            if not properties and data_result.get('data_source') == 'none':
+                # No se pudo generar SQL: no esperar más al LLM
+                reason = 'deadline_exceeded' if deadline is not None and deadline.partial else 'sql_generation_failed'
+                return await self._rule_based_search(query, reason)
+            
             if not properties:
                 logger.warning("No se encontraron propiedades para buscar")
                 return {
@@ -60,11 +92,23 @@ class LLMService:
             # 3. Si tenemos coincidencias exactas, priorizarlas (cambiado el umbral)
             final_properties = exact_matches
             search_strategy = 'exact_filters'
+            prompt_stats = None
+            semantic_results = []
+            text_results = []
             
             # Si hay pocos resultados exactos (menos de 3), complementar con búsqueda semántica
-            if len(exact_matches) < 3 and use_cloud:
+            wants_semantic = len(exact_matches) < 3 and use_cloud and not self.ollama_client.breaker.should_degrade()
+            if wants_semantic and deadline is not None and not deadline.allows(min_stage_seconds()):
+                # Sin presupuesto para el re-ranking: se responde con los filtros exactos
+                deadline.mark_partial('semantic_rerank')
+                wants_semantic = False
+            if wants_semantic:
                 try:
-                    semantic_results = await self.search_service.ai_semantic_search(properties, query)
+                    semantic_info = await asyncio.wait_for(
+                        self.search_service.ai_semantic_search_with_info(properties, query),
+                        timeout=deadline.remaining() if deadline is not None else None)
+                    semantic_results = semantic_info['properties']
+                    prompt_stats = semantic_info['prompt_stats']
                     # Solo usar semántica si mejora significativamente los resultados
                     if len(semantic_results) > len(exact_matches) * 1.5:
                         final_properties = semantic_results
@@ -72,71 +116,30 @@ class LLMService:
                         logger.info(f"Usando búsqueda semántica: {len(semantic_results)} resultados")
                     else:
                         # Combinar resultados exactos con algunos semánticos
-                        combined_results = exact_matches[:]
-                        for prop in semantic_results[:5]:  # Máximo 5 adicionales
-                            if prop not in combined_results:
-                                combined_results.append(prop)
-                        final_properties = combined_results
+                        exact_ids = {id(prop) for prop in exact_matches}
+                        extra = [prop for prop in semantic_results if id(prop) not in exact_ids][:5]  # Máximo 5 adicionales
+                        final_properties = exact_matches + extra
                         search_strategy = 'exact_plus_semantic'
+                except asyncio.TimeoutError:
+                    if deadline is not None:
+                        deadline.mark_partial('semantic_rerank')
                 except Exception as e:
                     logger.warning(f"Error en búsqueda semántica: {e}")
             
             # 4. Solo usar filtro de texto simple si no hay resultados exactos
             if len(final_properties) == 0:
-                text_results = self.search_service._simple_text_filter(properties, query)
+                text_results = self.search_service.text_search(properties, query)
                 if len(text_results) > 0:
-                    final_properties = text_results
+                    final_properties = [prop for prop, score in text_results]
                     search_strategy = 'text_filter'
                     logger.info(f"Usando filtro de texto como último recurso: {len(text_results)} resultados")
             
-            # 5. Aplicar boost de puntuación para características específicas
-            numbers = re.findall(r'\d+(?:\.\d+)?', query)
-            numbers = [float(n) for n in numbers]
-            query_lower = query.lower()
-            
-            for prop in final_properties:
-                boost_info = self.search_service.calculate_specific_boost(prop, query_lower, numbers)
-                prop['_boost_score'] = boost_info['total_boost']
-                prop['_boost_reasons'] = boost_info['reasons']
-            
-            # 6. Ordenar por boost score si hay boosts aplicados
-            if any(prop.get('_boost_score', 0) > 0 for prop in final_properties):
-                final_properties.sort(key=lambda x: x.get('_boost_score', 0), reverse=True)
-                search_strategy += '_with_boost'
-            
-            # 7. Limitar resultados
-            max_results = 10
-            limited_properties = final_properties[:max_results]
-            
-            # 8. Limpiar campos internos antes de retornar
-            for prop in limited_properties:
-                prop.pop('_boost_score', None)
-                prop.pop('_boost_reasons', None)
-                prop.pop('_match_score', None)
-                prop.pop('_match_reasons', None)
-            
-            # 9. Extraer keywords de la query
-            keywords = self._extract_keywords(query)
-            
-            # 10. Generar análisis descriptivo
-            analysis = self._generate_analysis(query, len(limited_properties), search_strategy)
-            
-            logger.info(f"Búsqueda completada: {len(limited_properties)} propiedades, estrategia: {search_strategy}")
-            
-            return {
-                'properties': limited_properties,
-                'keywords': keywords[:5],  # Máximo 5 keywords
-                'analysis': analysis,
-                'metadata': {
-                    'total_found': len(limited_properties),
-                    'search_strategy': search_strategy,
-                    'data_source': data_result.get('data_source', 'unknown'),
-                    'generated_sql': data_result.get('generated_sql'),
-                    'user_query': query,
-                    'ai_used': 'ai_semantic' in search_strategy,
-                    'boost_applied': '_with_boost' in search_strategy
-                }
+            signals = {
+                SIGNAL_EXACT: membership_signal(final_properties, exact_matches),
+                SIGNAL_SEMANTIC: order_signal(final_properties, semantic_results),
+                SIGNAL_TEXT: score_signal(final_properties, text_results)
             }
+            return self._build_search_response(query, final_properties, search_strategy, data_result, prompt_stats, signals)
             
         except Exception as e:
             logger.error(f"Error en search_ia_real_state: {e}")
@@ -156,35 +159,90 @@ class LLMService:
                 }
             }
 
-    def _extract_keywords(self, query: str) -> List[str]:
+    async def _rule_based_search(self, query: str, reason: str) -> dict:
         """
-        Extrae keywords relevantes de la consulta del usuario
+        Búsqueda determinista sin LLM sobre el snapshot del catálogo:
+        filtros exactos y, si no hay coincidencias, puntuación de texto
         """
-        import re
-        
-        # Palabras comunes a ignorar
-        stop_words = {
-            'el', 'la', 'de', 'en', 'y', 'a', 'que', 'con', 'por', 'para', 'un', 'una', 
-            'es', 'se', 'del', 'los', 'las', 'al', 'te', 'le', 'da', 'su', 'sus',
-            'busco', 'quiero', 'necesito', 'tengo', 'hay', 'está', 'son', 'tienen'
+        properties = await self.data_loader.get_catalog_properties_async()
+        data_result = {
+            'data_source': self.data_loader.catalog.data_source or 'json',
+            'generated_sql': None
         }
         
-        # Extraer palabras
-        words = re.findall(r'\b\w+\b', query.lower())
-        keywords = [word for word in words if len(word) > 2 and word not in stop_words]
+        final_properties = self.search_service.filter_exact_matches(properties, query)
+        search_strategy = 'rule_based'
+        signals = {SIGNAL_EXACT: np.ones(len(final_properties))}
+        if len(final_properties) == 0:
+            text_results = self.search_service.text_search(properties, query)
+            final_properties = [prop for prop, score in text_results]
+            search_strategy = 'rule_based_text'
+            signals = {SIGNAL_TEXT: score_signal(final_properties, text_results)}
+        
+        response = self._build_search_response(query, final_properties, search_strategy, data_result, signals=signals)
+        response['metadata']['degraded'] = True
+        response['metadata']['degraded_reason'] = reason
+        return response
+
+    def _build_search_response(self, query: str, final_properties: list, search_strategy: str, data_result: dict,
+                               prompt_stats: Optional[dict] = None, signals: Optional[dict] = None) -> dict:
+        """
+        Aplica boost, rankea, limita y arma la respuesta de búsqueda
+        Los puntajes van en arreglos paralelos a la lista: los registros (del snapshot compartido) no se modifican
+        """
+        # 5. Boost de puntuación para características específicas, como una señal más del ranking
+        signals = dict(signals or {})
+        signals[SIGNAL_BOOST] = self.search_service.boost_scores(final_properties, query)
+        
+        # 6-7. Top-k por puntaje combinado (sin ordenar toda la lista)
+        max_results = 10
+        page = self.ranking.rank(final_properties, signals, max_results)
+        limited_properties = page.properties
+        if page.boost_applied:
+            search_strategy += '_with_boost'
+        
+        # 8. Razones del boost solo para la página retornada
+        boost_reasons = {}
+        for prop in limited_properties:
+            reasons = self.search_service.calculate_specific_boost(prop, query)['reasons']
+            if reasons:
+                boost_reasons[str(prop.get('id'))] = reasons
+        
+        # 9. Extraer keywords de la query
+        keywords = self._extract_keywords(query)
         
-        # Extraer números como keywords especiales
-        numbers = re.findall(r'\d+(?:\.\d+)?', query)
-        for num in numbers:
-            keywords.append(f"${num}" if float(num) > 1000 else num)
+        # 10. Generar análisis descriptivo
+        analysis = self._generate_analysis(query, len(limited_properties), search_strategy)
         
-        # Detectar tipos de propiedad
-        property_types = ['casa', 'departamento', 'terreno', 'local', 'oficina', 'duplex']
-        for prop_type in property_types:
-            if prop_type in query.lower():
-                keywords.insert(0, prop_type)  # Priorizar tipos de propiedad
+        logger.info(f"Búsqueda completada: {len(limited_properties)} propiedades, estrategia: {search_strategy}")
         
-        return list(dict.fromkeys(keywords))  # Eliminar duplicados manteniendo orden
+        response = {
+            'properties': limited_properties,
+            'keywords': keywords[:5],  # Máximo 5 keywords
+            'analysis': analysis,
+            'metadata': {
+                'total_found': len(limited_properties),
+                'search_strategy': search_strategy,
+                'data_source': data_result.get('data_source', 'unknown'),
+                'generated_sql': data_result.get('generated_sql'),
+                'sql_source': data_result.get('sql_source'),
+                'user_query': query,
+                'ai_used': 'ai_semantic' in search_strategy,
+                'boost_applied': '_with_boost' in search_strategy,
+                'candidates': page.total,
+                'scores': page.scores,
+                'boost_reasons': boost_reasons
+            }
+        }
+        if prompt_stats:
+            # Medición del prompt de búsqueda semántica (tokens estimados)
+            response['metadata']['semantic_prompt'] = prompt_stats
+        deadline = current_deadline()
+        if deadline is not None:
+            # partial=True: alguna etapa se omitió o cortó por el deadline de la petición
+            response['metadata']['partial'] = deadline.partial
+            response['metadata']['deadline'] = deadline.to_metadata()
+        return response
 
     def _generate_analysis(self, query: str, results_count: int, strategy: str) -> str:
         """
@@ -209,7 +267,11 @@ class LLMService:
             'ai_semantic': 'usando búsqueda semántica con inteligencia artificial',
             'ai_semantic_with_boost': 'combinando IA semántica con boost de características específicas',
             'text_filter': 'mediante filtrado de texto simple',
-            'text_filter_with_boost': 'con filtrado de texto y priorización inteligente'
+            'text_filter_with_boost': 'con filtrado de texto y priorización inteligente',
+            'rule_based': 'mediante filtros deterministas (IA no disponible temporalmente)',
+            'rule_based_with_boost': 'mediante filtros deterministas y priorización de características (IA no disponible temporalmente)',
+            'rule_based_text': 'mediante puntuación de texto (IA no disponible temporalmente)',
+            'rule_based_text_with_boost': 'mediante puntuación de texto y priorización de características (IA no disponible temporalmente)'
         }
         
         strategy_desc = strategy_descriptions.get(strategy, 'usando estrategia de búsqueda avanzada')
@@ -248,16 +310,45 @@ class LLMService:
         
         return analysis
 
+    def get_stats(self) -> dict:
+        """Estadísticas operativas de los componentes del servicio"""
+        return {
+            'connections': self.ollama_client.get_connection_stats(),
+            'single_flight': self.ollama_client.single_flight.get_stats(),
+            'admission': self.ollama_client.admission.get_stats(),
+            'circuit_breaker': self.ollama_client.breaker.get_stats(),
+            'router': self.ollama_client.router.get_stats(),
+            'rerank_batching': self.search_service.rerank_batcher.get_stats(),
+            'model_policy': self.ollama_client.model_policy.get_stats(),
+            'keep_alive': self.ollama_client.keepalive.get_stats(),
+            'structured_output': self.ollama_client.get_structured_stats(),
+            'llm_metrics': self.ollama_client.metrics.get_stats(),
+            'sql_cache': self.sql_service.get_cache_stats(),
+            'sql_compiler': self.data_loader.sql_compiler.get_stats(),
+            'catalog': self.data_loader.catalog.get_stats(),
+            'query_parser': parser_cache_stats(),
+            'gazetteer': default_gazetteer().get_stats(),
+            'ranking': self.ranking.get_stats()
+        }
+
     # ==================== MÉTODOS DELEGADOS ====================
 
     async def ask_ai_direct(self, prompt: str, system_prompt: str = None) -> str:
         """Delegado a OllamaClient"""
         return await self.ollama_client.ask_ai_direct(prompt, system_prompt)
 
+    def stream_ai_direct(self, prompt: str, system_prompt: str = None) -> AsyncIterator[str]:
+        """Delegado a OllamaClient (streaming de tokens)"""
+        return self.ollama_client.stream_ai_direct(prompt, system_prompt)
+
     async def search_ia(self, query: str, properties_context: str = None) -> str:
         """Delegado a PropertySearchService"""
         return await self.search_service.search_ia(query, properties_context)
 
+    def stream_search_ia(self, query: str, properties_context: str = None) -> AsyncIterator[str]:
+        """Delegado a PropertySearchService (streaming de tokens)"""
+        return self.search_service.stream_search_ia(query, properties_context)
+
     def call_ollama(self, prompt: str, use_sql_system_prompt: bool = True) -> Optional[str]:
         """Delegado a OllamaClient"""
         return self.ollama_client.call_ollama(prompt, use_sql_system_prompt)
@@ -267,61 +358,8 @@ class LLMService:
         return self.sql_service.generate_sql(user_query)
 
     async def generate_sql_async(self, user_query: str) -> Dict[str, any]:
-        """Versión asíncrona de generate_sql"""
-        try:
-            prompt = f"""
-            Genera una consulta SQL para buscar propiedades inmobiliarias basada en esta consulta: "{user_query}"
-
-            Esquema de la tabla:
-            CREATE TABLE propiedades (
-                id INT PRIMARY KEY,
-                titulo VARCHAR(255),
-                descripcion TEXT,
-                tipo ENUM('casa', 'departamento', 'terreno'),
-                precio DECIMAL(12,2),
-                habitaciones INT,
-                banos DECIMAL(3,1),
-                area_m2 DECIMAL(8,2),
-                ubicacion VARCHAR(255),
-                fecha_publicacion DATE,
-                imagen_url VARCHAR(500)
-            );
-
-            Instrucciones:
-            - Usa LIKE '%valor%' para búsquedas de texto flexibles
-            - Para precios, usa rangos razonables si no se especifica exacto
-            - Incluye LIMIT 50 para evitar resultados excesivos
-            - Ordena por relevancia (precio, fecha_publicacion)
-            - Usa OR para múltiples criterios similares
-            - Si mencionan ubicación, busca en campo ubicacion
-
-            Responde SOLO con la query SQL, sin explicaciones.
-            """
-            
-            system_prompt = 'Eres un experto en SQL que genera consultas MySQL precisas. Respondes UNICAMENTE con SQL valido, sin explicaciones.'
-            sql_response = await self.ollama_client.ask_ai_direct(prompt, system_prompt)
-            
-            if sql_response and not sql_response.startswith("Error:"):
-                clean_sql = self.sql_service.clean_sql(sql_response)
-                return {
-                    'success': True,
-                    'sql': clean_sql,
-                    'original_response': sql_response
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': 'No se pudo generar SQL',
-                    'sql': None
-                }
-                
-        except Exception as e:
-            logger.error(f"Error generando SQL async: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'sql': None
-            }
+        """Delegado a SQLService"""
+        return await self.sql_service.generate_sql_async(user_query)
 
     def clean_sql(self, sql: str) -> str:
         """Delegado a SQLService"""
@@ -332,8 +370,9 @@ class LLMService:
         return self.sql_service.validate_sql(sql)
 
     async def validate_sql_with_ai(self, sql: str) -> dict:
-        """Delegado a SQLService"""
-        return await self.sql_service.validate_sql_with_ai(sql)
+        """Delegado a SQLService (prioridad de validación en la cola del LLM)"""
+        with llm_priority(PRIORITY_VALIDATION):
+            return await self.sql_service.validate_sql_with_ai(sql)
 
     def load_properties_from_db_or_json_with_query(self) -> dict:
         """Delegado a DataLoader"""
@@ -343,10 +382,18 @@ class LLMService:
         """Delegado a DataLoader"""
         return self.data_loader.load_properties_from_generated_query_with_info(user_query)
 
+    async def load_properties_from_generated_query_with_info_async(self, user_query: str) -> dict:
+        """Delegado a DataLoader"""
+        return await self.data_loader.load_properties_from_generated_query_with_info_async(user_query)
+
     def execute_generated_query(self, sql: str) -> Optional[List[Dict]]:
         """Delegado a DataLoader"""
         return self.data_loader.execute_generated_query(sql)
 
+    async def execute_generated_query_async(self, sql: str) -> Optional[List[Dict]]:
+        """Delegado a DataLoader"""
+        return await self.data_loader.execute_generated_query_async(sql)
+
     def load_properties_from_db_or_json(self) -> list:
         """Delegado a DataLoader"""
         return self.data_loader.load_properties_from_db_or_json()
@@ -371,7 +418,7 @@ class LLMService:
 
     def _calculate_specific_boost(self, prop: dict, query_lower: str, numbers: list) -> dict:
         """Delegado a PropertySearchService"""
-        return self.search_service.calculate_specific_boost(prop, query_lower, numbers)
+        return self.search_service.calculate_specific_boost(prop, query_lower)
 
     def _simple_text_filter(self, properties: list, query: str) -> list:
         """Delegado a PropertySearchService"""
@@ -0,0 +1,217 @@
+"""
+Métricas de tokens y tiempos por llamada al LLM
+Campos de Ollama (prompt_eval_count, eval_count, *_duration) agregados por tarea
+en contadores e histogramas, más un resumen por petición para el metadata
+"""
+import threading
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Etiquetas de tarea para las métricas
+METRIC_SQL_GENERATION = 'sql_generation'
+METRIC_SEMANTIC_RERANK = 'semantic_rerank'
+METRIC_VALIDATION = 'validation'
+METRIC_ASK = 'ask'
+
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+MS_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_llm_task: ContextVar[str] = ContextVar('llm_task', default=METRIC_ASK)
+_llm_usage: ContextVar[Optional['LLMUsage']] = ContextVar('llm_usage', default=None)
+
+
+@contextmanager
+def llm_task(task: str):
+    """Etiqueta con `task` las llamadas LLM hechas dentro del bloque"""
+    token = _llm_task.set(task)
+    try:
+        yield
+    finally:
+        _llm_task.reset(token)
+
+
+def current_llm_task() -> str:
+    return _llm_task.get()
+
+
+@contextmanager
+def llm_usage():
+    """Acumula las llamadas LLM hechas dentro del bloque (resumen por petición)"""
+    usage = LLMUsage()
+    token = _llm_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _llm_usage.reset(token)
+
+
+def current_usage() -> Optional['LLMUsage']:
+    return _llm_usage.get()
+
+
+def _ns_to_ms(value) -> float:
+    return round((value or 0) / 1e6, 1)
+
+
+def call_record(task: str, model: Optional[str], data: dict, latency_ms: float) -> dict:
+    """Métricas de una respuesta de /api/chat (la final, en streaming)"""
+    return {
+        'task': task,
+        'model': data.get('model') or model,
+        'prompt_tokens': data.get('prompt_eval_count') or 0,
+        'eval_tokens': data.get('eval_count') or 0,
+        'load_ms': _ns_to_ms(data.get('load_duration')),
+        'prompt_eval_ms': _ns_to_ms(data.get('prompt_eval_duration')),
+        'eval_ms': _ns_to_ms(data.get('eval_duration')),
+        'total_ms': _ns_to_ms(data.get('total_duration')),
+        'latency_ms': round(latency_ms, 1)
+    }
+
+
+class Histogram:
+    """Histograma de buckets fijos (acumulado, al estilo Prometheus)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Cota superior del bucket que contiene el cuantil q"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def get_stats(self) -> dict:
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            buckets[f"le_{bound}"] = cumulative
+        buckets['le_inf'] = self.count
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 1),
+            'avg': round(self.sum / self.count, 1) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': buckets
+        }
+
+
+class _TaskMetrics:
+    """Contadores e histogramas de una tarea"""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.eval_ms = 0.0
+        self.by_model: Dict[str, int] = {}
+        self.histograms = {
+            'prompt_tokens': Histogram(TOKEN_BUCKETS),
+            'eval_tokens': Histogram(TOKEN_BUCKETS),
+            'latency_ms': Histogram(MS_BUCKETS),
+            'load_ms': Histogram(MS_BUCKETS),
+            'prompt_eval_ms': Histogram(MS_BUCKETS),
+            'eval_ms': Histogram(MS_BUCKETS)
+        }
+
+    def observe(self, call: dict):
+        self.calls += 1
+        self.prompt_tokens += call['prompt_tokens']
+        self.eval_tokens += call['eval_tokens']
+        self.eval_ms += call['eval_ms']
+        model = call['model'] or 'unknown'
+        self.by_model[model] = self.by_model.get(model, 0) + 1
+        for name, histogram in self.histograms.items():
+            histogram.observe(call[name])
+
+    def get_stats(self) -> dict:
+        return {
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'eval_tokens': self.eval_tokens,
+            # Velocidad de generación medida por Ollama (sin carga ni red)
+            'eval_tokens_per_s': round(self.eval_tokens / (self.eval_ms / 1000), 1) if self.eval_ms else None,
+            'by_model': dict(self.by_model),
+            'histograms': {name: h.get_stats() for name, h in self.histograms.items()}
+        }
+
+
+class LLMMetrics:
+    """Agregado de métricas por tarea para /api/llm/stats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, _TaskMetrics] = {}
+
+    def record(self, model: Optional[str], data: dict, latency_ms: float) -> dict:
+        """Registra una respuesta del LLM con la tarea del contexto y la suma al resumen de la petición"""
+        call = call_record(current_llm_task(), model, data, latency_ms)
+        with self._lock:
+            self._tasks.setdefault(call['task'], _TaskMetrics()).observe(call)
+        usage = current_usage()
+        if usage is not None:
+            usage.add(call)
+        return call
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {task: metrics.get_stats() for task, metrics in self._tasks.items()}
+
+
+class LLMUsage:
+    """Llamadas LLM de una petición; las compartidas (lotes) se prorratean"""
+
+    def __init__(self):
+        self.calls: List[dict] = []
+
+    def add(self, call: dict, share: int = 1):
+        if share > 1:
+            call = dict(call, shared_by=share,
+                        prompt_tokens=call['prompt_tokens'] / share,
+                        eval_tokens=call['eval_tokens'] / share)
+        self.calls.append(call)
+
+    def summary(self) -> dict:
+        """Resumen para el metadata de la respuesta"""
+        by_task: Dict[str, dict] = {}
+        for call in self.calls:
+            task = by_task.setdefault(call['task'], {'calls': 0, 'prompt_tokens': 0, 'eval_tokens': 0, 'latency_ms': 0.0})
+            task['calls'] += 1
+            task['prompt_tokens'] += call['prompt_tokens']
+            task['eval_tokens'] += call['eval_tokens']
+            task['latency_ms'] += call['latency_ms']
+        for task in by_task.values():
+            task['prompt_tokens'] = round(task['prompt_tokens'])
+            task['eval_tokens'] = round(task['eval_tokens'])
+            task['latency_ms'] = round(task['latency_ms'], 1)
+        return {
+            'calls': len(self.calls),
+            'prompt_tokens': sum(task['prompt_tokens'] for task in by_task.values()),
+            'eval_tokens': sum(task['eval_tokens'] for task in by_task.values()),
+            'latency_ms': round(sum(call['latency_ms'] for call in self.calls), 1),
+            'by_task': by_task
+        }
@@ -0,0 +1,275 @@
+"""
+Router de backends LLM (varios Ollama locales y/o Ollama Cloud)
+Balanceo por menor cantidad de peticiones en vuelo, salud por backend y hedging opcional
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_CLOUD_URL = "https://ollama.com"
+
+
+class LLMBackend:
+    """Un endpoint de Ollama con su peso, carga actual y estado de salud"""
+
+    def __init__(self, name: str, url: str, model: Optional[str] = None, weight: float = 1.0,
+                 api_key: Optional[str] = None):
+        self.name = name
+        self.base_url = f"{url.rstrip('/')}/api"
+        self.model = model  # None: se usa el modelo del payload
+        self.weight = max(weight, 0.01)
+        self.api_key = api_key
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def is_cloud(self) -> bool:
+        return self.base_url.startswith(OLLAMA_CLOUD_URL)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Headers propios del backend (autenticación solo para Cloud)"""
+        if self.api_key:
+            return {'Authorization': f'Bearer {self.api_key}'}
+        return {}
+
+    def prepare_payload(self, payload: dict, default_model: Optional[str] = None) -> dict:
+        """
+        Payload con el modelo propio del backend, si tiene uno configurado
+        Solo reemplaza el modelo por defecto: los modelos elegidos por tarea se respetan
+        """
+        if self.model and payload.get('model') != self.model and payload.get('model') in (default_model, None):
+            return dict(payload, model=self.model)
+        return payload
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+    def __repr__(self) -> str:
+        return f"LLMBackend({self.name}, {self.base_url}, model={self.model})"
+
+
+def parse_backends(spec: str, api_key: Optional[str] = None) -> List[LLMBackend]:
+    """
+    Interpreta OLLAMA_BACKENDS: entradas separadas por coma con opciones separadas por ';'
+    Ejemplo: "http://gpu1:11434;weight=2,http://gpu2:11434;model=llama3.2:3b,cloud;model=deepseek-v3.1:671b-cloud"
+    La palabra 'cloud' usa Ollama Cloud con OLLAMA_API_KEY; sin model= se usa el modelo del payload
+    """
+    backends = []
+    for index, entry in enumerate(part.strip() for part in spec.split(',')):
+        if not entry:
+            continue
+        url, *options = [item.strip() for item in entry.split(';')]
+        params = dict(option.split('=', 1) for option in options if '=' in option)
+
+        backend_key = None
+        if url.lower() == 'cloud':
+            if not api_key:
+                logger.warning("Backend 'cloud' ignorado: OLLAMA_API_KEY no está configurado")
+                continue
+            url = OLLAMA_CLOUD_URL
+            backend_key = api_key
+
+        try:
+            weight = float(params.get('weight', 1))
+        except ValueError:
+            logger.warning(f"Peso inválido en backend '{entry}', se usa 1")
+            weight = 1.0
+
+        name = params.get('name') or f"{index}:{url}"
+        backends.append(LLMBackend(name, url, params.get('model'), weight, backend_key))
+    return backends
+
+
+class LLMRouter:
+    """
+    Elige el backend con menos peticiones en vuelo relativo a su peso
+    - Un backend con fallas consecutivas queda fuera de rotación durante un cooldown
+    - Con hedging activo, si la respuesta tarda más que el p90 observado se envía un
+      duplicado a otro backend; gana la primera respuesta válida y la otra se cancela
+    Es seguro entre event loops (los wrappers síncronos usan loops temporales)
+    """
+
+    def __init__(self, backends: Iterable[LLMBackend], hedge_enabled: Optional[bool] = None):
+        self.backends = list(backends)
+        if not self.backends:
+            raise ValueError("El router LLM necesita al menos un backend")
+        if hedge_enabled is None:
+            hedge_enabled = os.getenv('OLLAMA_HEDGE_ENABLED', 'false').lower() == 'true'
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = float(os.getenv('OLLAMA_HEDGE_MIN_DELAY_MS', 500)) / 1000
+        self.hedge_min_samples = int(os.getenv('OLLAMA_HEDGE_MIN_SAMPLES', 20))
+        self.max_failures = int(os.getenv('OLLAMA_BACKEND_MAX_FAILURES', 3))
+        self.cooldown_seconds = float(os.getenv('OLLAMA_BACKEND_COOLDOWN', 15))
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=int(os.getenv('OLLAMA_HEDGE_WINDOW', 200)))
+        self._stats = {
+            'hedged': 0,
+            'hedge_wins': 0
+        }
+
+    @property
+    def primary(self) -> LLMBackend:
+        return self.backends[0]
+
+    def pick(self, exclude: Iterable[LLMBackend] = ()) -> Optional[LLMBackend]:
+        """
+        Backend sano con menor (en vuelo + 1) / peso; si no hay ninguno sano se usa
+        el que sale antes del cooldown. None si todos están excluidos
+        """
+        with self._lock:
+            return self._pick_locked(exclude)
+
+    def _pick_locked(self, exclude: Iterable[LLMBackend]) -> Optional[LLMBackend]:
+        excluded = set(id(backend) for backend in exclude)
+        now = time.monotonic()
+        candidates = [b for b in self.backends if id(b) not in excluded]
+        if not candidates:
+            return None
+        healthy = [b for b in candidates if b.is_healthy(now)]
+        if healthy:
+            return min(healthy, key=lambda b: (b.outstanding + 1) / b.weight)
+        return min(candidates, key=lambda b: b.unhealthy_until)
+
+    @contextmanager
+    def lease(self, exclude: Iterable[LLMBackend] = ()):
+        """
+        Elige un backend y lo cuenta como en vuelo durante el bloque
+        La elección y el conteo son atómicos para que las peticiones concurrentes se repartan
+        """
+        with self._lock:
+            backend = self._pick_locked(exclude)
+            if backend is None:
+                raise ValueError("No hay backends LLM disponibles")
+            backend.outstanding += 1
+            backend.requests += 1
+        try:
+            yield backend
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+
+    def record_result(self, backend: LLMBackend, ok: bool, latency_ms: Optional[float] = None):
+        """Actualiza la salud del backend y la ventana de latencias para el hedging"""
+        with self._lock:
+            if ok:
+                backend.consecutive_failures = 0
+                if latency_ms is not None:
+                    self._latencies.append(latency_ms)
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.max_failures and len(self.backends) > 1:
+                backend.unhealthy_until = time.monotonic() + self.cooldown_seconds
+                backend.consecutive_failures = 0
+                logger.warning(f"Backend LLM {backend.name} fuera de rotación por {self.cooldown_seconds:.0f}s")
+
+    def hedge_delay(self) -> Optional[float]:
+        """Segundos a esperar antes de enviar el duplicado (p90 observado); None si no aplica"""
+        if not self.hedge_enabled or len(self.backends) < 2:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+        return max(self.hedge_min_delay, p90 / 1000)
+
+    async def dispatch(self, send: Callable[[LLMBackend], Awaitable[Any]],
+                       is_success: Callable[[Any], bool]) -> Any:
+        """
+        Ejecuta send(backend) en el backend elegido, con hedging si corresponde
+        is_success decide si una respuesta es válida (las inválidas cuentan como falla del backend)
+        """
+        chosen = []
+        first = asyncio.ensure_future(self._run(send, is_success, chosen=chosen))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await first
+
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done:
+            return first.result()
+
+        secondary = self.pick(exclude=chosen)
+        if secondary is None or not secondary.is_healthy(time.monotonic()):
+            return await first
+
+        logger.info(f"Backend {chosen[0].name} supera el p90 ({delay * 1000:.0f} ms), hedging hacia {secondary.name}")
+        self._stats['hedged'] += 1
+        second = asyncio.ensure_future(self._run(send, is_success, exclude=chosen))
+        pending = {first, second}
+        fallback = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and is_success(task.result()):
+                        if task is second:
+                            self._stats['hedge_wins'] += 1
+                        return task.result()
+                    fallback = task
+            # Ninguna respuesta válida: propagar la última (resultado o excepción)
+            return fallback.result()
+        finally:
+            # La petición perdedora se cancela para no seguir ocupando al backend
+            for task in pending:
+                task.cancel()
+
+    async def _run(self, send: Callable[[LLMBackend], Awaitable[Any]], is_success: Callable[[Any], bool],
+                   exclude: Iterable[LLMBackend] = (), chosen: Optional[list] = None) -> Any:
+        """Elige backend y ejecuta la petición contando carga, latencia y salud"""
+        with self.lease(exclude) as backend:
+            if chosen is not None:
+                chosen.append(backend)
+            started = time.perf_counter()
+            try:
+                result = await send(backend)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.record_result(backend, False)
+                raise
+            ok = is_success(result)
+            self.record_result(backend, ok, (time.perf_counter() - started) * 1000 if ok else None)
+            return result
+
+    def get_stats(self) -> dict:
+        """Estado de los backends y del hedging"""
+        now = time.monotonic()
+        with self._lock:
+            backends = [
+                {
+                    'name': b.name,
+                    'url': b.base_url,
+                    'model': b.model,
+                    'weight': b.weight,
+                    'outstanding': b.outstanding,
+                    'requests': b.requests,
+                    'failures': b.failures,
+                    'healthy': b.is_healthy(now)
+                }
+                for b in self.backends
+            ]
+            stats = dict(self._stats)
+            samples = len(self._latencies)
+        stats['backends'] = backends
+        stats['hedge_enabled'] = self.hedge_enabled
+        stats['latency_samples'] = samples
+        delay = self.hedge_delay()
+        stats['hedge_delay_ms'] = round(delay * 1000) if delay is not None else None
+        return stats
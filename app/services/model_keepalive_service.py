@@ -0,0 +1,136 @@
+"""
+Mantiene los modelos de Ollama local cargados en memoria
+keep_alive por modelo y heartbeat en horario laboral
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, time as dt_time
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+
+def _parse_hours(value: str):
+    """'08:00-19:00' -> (time(8, 0), time(19, 0))"""
+    start, end = (part.strip() for part in value.split('-', 1))
+    return dt_time.fromisoformat(start), dt_time.fromisoformat(end)
+
+
+def _parse_days(value: str) -> Set[int]:
+    """'0-4' o '0,1,2,3,4,5' -> días de la semana (lunes = 0)"""
+    days = set()
+    for part in value.split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = (int(x) for x in part.split('-', 1))
+            days.update(range(first, last + 1))
+        elif part:
+            days.add(int(part))
+    return days
+
+
+class ModelKeepAlive:
+    """
+    - OLLAMA_KEEP_ALIVE: keep_alive por defecto que se envía a Ollama local (p. ej. '30m')
+    - OLLAMA_KEEP_ALIVE_MODELS: excepciones por modelo, 'llama3.2:3b=2h,qwen2.5:0.5b=24h'
+    - Heartbeat: en horario laboral recarga los modelos que no se usaron en el último intervalo
+    """
+
+    def __init__(self):
+        self.default_keep_alive = os.getenv('OLLAMA_KEEP_ALIVE', '30m') or None
+        self.per_model: Dict[str, str] = {}
+        for entry in os.getenv('OLLAMA_KEEP_ALIVE_MODELS', '').split(','):
+            if '=' in entry:
+                model, value = (part.strip() for part in entry.rsplit('=', 1))
+                self.per_model[model] = value
+
+        self.heartbeat_enabled = os.getenv('OLLAMA_HEARTBEAT_ENABLED', 'true').lower() == 'true'
+        self.heartbeat_interval = float(os.getenv('OLLAMA_HEARTBEAT_INTERVAL', 240))
+        try:
+            self.business_hours = _parse_hours(os.getenv('OLLAMA_HEARTBEAT_HOURS', '07:00-20:00'))
+            self.business_days = _parse_days(os.getenv('OLLAMA_HEARTBEAT_DAYS', '0-5'))
+        except ValueError as e:
+            logger.warning(f"Horario de heartbeat inválido ({e}), se usa 07:00-20:00 de lunes a sábado")
+            self.business_hours = (dt_time(7, 0), dt_time(20, 0))
+            self.business_days = set(range(6))
+        self.timezone = None
+        tz_name = os.getenv('OLLAMA_HEARTBEAT_TZ', 'America/Guatemala')
+        if ZoneInfo is not None and tz_name:
+            try:
+                self.timezone = ZoneInfo(tz_name)
+            except Exception:
+                logger.warning(f"Zona horaria '{tz_name}' no disponible, se usa la hora local")
+
+        self._last_used: Dict[str, float] = {}
+        self._stats = {
+            'preloads': 0,
+            'preload_failures': 0,
+            'heartbeats': 0,
+            'heartbeats_skipped': 0
+        }
+
+    def keep_alive_for(self, model: Optional[str]) -> Optional[str]:
+        """Valor de keep_alive para el modelo (None: usar el de Ollama)"""
+        return self.per_model.get(model, self.default_keep_alive)
+
+    def mark_used(self, model: Optional[str]):
+        """Una petición real ya renueva el keep_alive del modelo"""
+        if model:
+            self._last_used[model] = time.monotonic()
+
+    def in_business_hours(self, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now(self.timezone)
+        start, end = self.business_hours
+        return now.weekday() in self.business_days and start <= now.time() < end
+
+    def needs_heartbeat(self, model: str) -> bool:
+        last_used = self._last_used.get(model)
+        return last_used is None or time.monotonic() - last_used >= self.heartbeat_interval
+
+    async def run_heartbeat(self, ollama_client):
+        """
+        Tarea de fondo (lanzada desde el lifespan): cada intervalo, en horario laboral,
+        precarga los modelos ociosos para que sigan residentes en memoria
+        """
+        if not self.heartbeat_enabled or not ollama_client.has_local_backends():
+            logger.info("Heartbeat de modelos deshabilitado (sin backends locales o por configuración)")
+            return
+
+        logger.info(f"Heartbeat de modelos cada {self.heartbeat_interval:.0f}s en horario laboral")
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if not self.in_business_hours():
+                continue
+            idle_models = [model for model in ollama_client.configured_models() if self.needs_heartbeat(model)]
+            if not idle_models:
+                self._stats['heartbeats_skipped'] += 1
+                continue
+            self._stats['heartbeats'] += 1
+            try:
+                await ollama_client.preload_models(idle_models)
+            except Exception as e:
+                logger.warning(f"Heartbeat de modelos falló: {e}")
+
+    def record_preload(self, model: str, ok: bool):
+        if ok:
+            self._stats['preloads'] += 1
+            self.mark_used(model)
+        else:
+            self._stats['preload_failures'] += 1
+
+    def get_stats(self) -> dict:
+        """Configuración y contadores de keep_alive"""
+        stats = dict(self._stats)
+        stats['default_keep_alive'] = self.default_keep_alive
+        stats['per_model'] = dict(self.per_model)
+        stats['heartbeat_enabled'] = self.heartbeat_enabled
+        stats['heartbeat_interval'] = self.heartbeat_interval
+        stats['in_business_hours'] = self.in_business_hours()
+        return stats
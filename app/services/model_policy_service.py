@@ -0,0 +1,118 @@
+"""
+Política de modelos por tarea: modelo pequeño y rápido para tareas simples,
+modelo grande para re-ranking y conversación, con escalamiento si el pequeño falla
+"""
+import os
+import re
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Tareas LLM del backend
+TASK_SQL = 'sql'
+TASK_VALIDATION = 'validation'
+TASK_KEYWORDS = 'keywords'
+TASK_RERANK = 'rerank'
+TASK_CHAT = 'chat'
+
+TIER_SMALL = 'small'
+TIER_LARGE = 'large'
+
+DEFAULT_TASK_TIERS = {
+    TASK_SQL: TIER_SMALL,         # solo consultas simples; las complejas van al grande
+    TASK_VALIDATION: TIER_SMALL,
+    TASK_KEYWORDS: TIER_SMALL,
+    TASK_RERANK: TIER_LARGE,
+    TASK_CHAT: TIER_LARGE
+}
+
+# Señales de una consulta que necesita razonamiento (comparaciones, varias condiciones)
+_COMPLEX_PATTERNS = re.compile(
+    r'\b(entre|o|pero|excepto|sin|cerca|mejor|mejores|peor|barat[oa]s?|econ[oó]mic[oa]s?|'
+    r'lujo|ideal|parecid[oa]s?|similar(es)?|compar\w*|mientras|aunque|adem[aá]s|'
+    r'familia|niñ[oa]s|inversi[oó]n|rentabl\w*)\b'
+)
+
+
+class ModelPolicy:
+    """
+    Decide qué modelo atiende cada tarea
+    - OLLAMA_SMALL_MODEL: modelo pequeño; sin él todo va al modelo por defecto
+    - OLLAMA_LARGE_MODEL: modelo grande (por defecto el modelo configurado del cliente)
+    - OLLAMA_MODEL_POLICY: niveles por tarea, p. ej. "sql=small,validation=small,rerank=large"
+    """
+
+    def __init__(self, default_model: str, small_model: Optional[str] = None, large_model: Optional[str] = None):
+        self.large_model = large_model or os.getenv('OLLAMA_LARGE_MODEL') or default_model
+        self.small_model = small_model or os.getenv('OLLAMA_SMALL_MODEL') or None
+        self.simple_max_words = int(os.getenv('OLLAMA_SIMPLE_QUERY_MAX_WORDS', 8))
+        self.task_tiers = dict(DEFAULT_TASK_TIERS)
+        for entry in os.getenv('OLLAMA_MODEL_POLICY', '').split(','):
+            if '=' in entry:
+                task, tier = (part.strip().lower() for part in entry.split('=', 1))
+                if tier in (TIER_SMALL, TIER_LARGE):
+                    self.task_tiers[task] = tier
+        self._lock = threading.Lock()
+        self._stats = {
+            'small': 0,
+            'large': 0,
+            'escalations': 0,
+            'by_task': {}
+        }
+
+    @property
+    def enabled(self) -> bool:
+        """La política solo aplica si hay un modelo pequeño distinto del grande"""
+        return bool(self.small_model) and self.small_model != self.large_model
+
+    def is_simple_query(self, query: Optional[str]) -> bool:
+        """Consulta corta, sin comparaciones ni condiciones encadenadas"""
+        if not query:
+            return True
+        query_lower = query.lower()
+        words = re.findall(r'\w+', query_lower)
+        if len(words) > self.simple_max_words:
+            return False
+        if len(re.findall(r'\d+(?:[\.,]\d+)?', query_lower)) > 2:
+            return False
+        return not _COMPLEX_PATTERNS.search(query_lower)
+
+    def model_for(self, task: str, query: Optional[str] = None) -> str:
+        """Modelo para la tarea; para SQL depende de la complejidad de la consulta"""
+        tier = self.task_tiers.get(task, TIER_LARGE)
+        if tier == TIER_SMALL and task == TASK_SQL and not self.is_simple_query(query):
+            tier = TIER_LARGE
+        if not self.enabled:
+            tier = TIER_LARGE
+
+        with self._lock:
+            self._stats[tier] += 1
+            by_task = self._stats['by_task'].setdefault(task, {'small': 0, 'large': 0})
+            by_task[tier] += 1
+        return self.small_model if tier == TIER_SMALL else self.large_model
+
+    def is_small(self, model: Optional[str]) -> bool:
+        return self.enabled and model == self.small_model
+
+    def escalate(self, task: str, reason: str) -> str:
+        """Modelo grande para reintentar una tarea cuya salida del pequeño no pasó la validación"""
+        with self._lock:
+            self._stats['escalations'] += 1
+            self._stats['large'] += 1
+            by_task = self._stats['by_task'].setdefault(task, {'small': 0, 'large': 0})
+            by_task['large'] += 1
+        logger.info(f"Escalando tarea '{task}' a {self.large_model}: {reason}")
+        return self.large_model
+
+    def get_stats(self) -> dict:
+        """Uso de modelos por tarea y escalamientos"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['by_task'] = {task: dict(counts) for task, counts in self._stats['by_task'].items()}
+        stats['enabled'] = self.enabled
+        stats['small_model'] = self.small_model
+        stats['large_model'] = self.large_model
+        stats['task_tiers'] = dict(self.task_tiers)
+        return stats
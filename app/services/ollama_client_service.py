@@ -3,11 +3,24 @@ Cliente para comunicación con Ollama Cloud y Local
 """
 import os
 import json
+import time
+import hashlib
 import logging
 import aiohttp
 import asyncio
-from typing import Dict, Optional
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
 from dotenv import load_dotenv
+from .single_flight_service import SingleFlight
+from .llm_admission_service import AdmissionController, AdmissionRejected, current_llm_priority, parse_retry_after
+from .circuit_breaker_service import CircuitBreaker
+from .llm_router_service import LLMBackend, LLMRouter, parse_backends
+from .model_policy_service import ModelPolicy
+from .model_keepalive_service import ModelKeepAlive
+from .structured_output_service import ERROR_NO_RESPONSE, parse_structured
+from .request_deadline_service import current_deadline, min_stage_seconds, timeout_for, without_deadline
+from .llm_metrics_service import LLMMetrics
 
 # Limpiar variables de entorno existentes y cargar desde .env
 os.environ.pop('OLLAMA_API_KEY', None)
@@ -19,6 +32,11 @@ load_dotenv(override=True)
 
 logger = logging.getLogger(__name__)
 
+
+class LLMStreamError(Exception):
+    """Error durante una respuesta en streaming del LLM"""
+
+
 class OllamaClient:
     def __init__(self):
         """
@@ -46,192 +64,630 @@ class OllamaClient:
             logger.info(f"Usando Ollama Local en {ollama_url} con modelo: {self.model}")
         
         self.timeout = 60
+        
+        # Backends: OLLAMA_BACKENDS (varios hosts locales y/o Cloud) o el endpoint configurado arriba
+        backends_spec = os.getenv('OLLAMA_BACKENDS', '').strip()
+        backends = parse_backends(backends_spec, os.getenv('OLLAMA_API_KEY')) if backends_spec else []
+        if not backends:
+            backends = [LLMBackend('default', self.base_url.rsplit('/api', 1)[0], api_key=self.api_key)]
+        self.router = LLMRouter(backends)
+        if backends_spec:
+            logger.info(f"Router LLM con {len(backends)} backends: {[b.name for b in backends]}")
+        
+        # Pool de conexiones HTTP: una sesión de larga vida por event loop
+        self.pool_limit = int(os.getenv('OLLAMA_POOL_LIMIT', 100))
+        self.pool_limit_per_host = int(os.getenv('OLLAMA_POOL_LIMIT_PER_HOST', 20))
+        self.keepalive_timeout = float(os.getenv('OLLAMA_KEEPALIVE_TIMEOUT', 60))
+        self.dns_cache_ttl = int(os.getenv('OLLAMA_DNS_CACHE_TTL', 300))
+        self._sessions = weakref.WeakKeyDictionary()
+        self._connection_stats = {
+            'requests': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'dns_lookups': 0,
+            'dns_cache_hits': 0,
+            'sessions_created': 0
+        }
+        
+        # Modelo por tarea (pequeño para tareas simples, grande para re-ranking y conversación)
+        self.model_policy = ModelPolicy(self.model)
+        
+        # keep_alive por modelo y heartbeat para Ollama local
+        self.keepalive = ModelKeepAlive()
+        
+        # Tokens y tiempos por llamada, por tarea
+        self.metrics = LLMMetrics()
+        
+        # Salidas estructuradas (modo JSON con esquema)
+        self._structured_stats = {
+            'calls': 0,
+            'repairs': 0,
+            'failures': 0
+        }
+        
+        # Coalescencia de peticiones idénticas en vuelo
+        self.single_flight_enabled = os.getenv('OLLAMA_SINGLE_FLIGHT', 'true').lower() == 'true'
+        self.single_flight = SingleFlight()
+        
+        # Límite global de concurrencia hacia el upstream con cola por prioridad
+        self.admission = AdmissionController()
+        
+        # Circuit breaker por tasa de error y latencia p95
+        self.breaker = CircuitBreaker()
 
     def call_ollama(self, prompt: str, use_sql_system_prompt: bool = True) -> Optional[str]:
-        """Llama a Ollama usando API REST síncrono (Cloud o Local)"""
+        """
+        Wrapper síncrono de call_ollama_async (Cloud o Local)
+        Solo para scripts y código sin event loop; las rutas deben usar la versión async
+        """
+        return self.run_sync(self.call_ollama_async(prompt, use_sql_system_prompt))
+
+    async def call_ollama_async(self, prompt: str, use_sql_system_prompt: bool = True,
+                                model: Optional[str] = None) -> Optional[str]:
+        """
+        Llama a Ollama de forma asíncrona reutilizando la sesión persistente
+        model permite elegir el modelo de la tarea (por defecto el configurado)
+        """
+        system_content = 'Eres un experto en SQL que genera consultas MySQL precisas. Respondes UNICAMENTE con SQL valido, sin explicaciones.' if use_sql_system_prompt else 'Eres un asistente util y amigable.'
+        
+        messages = [
+            {
+                'role': 'system',
+                'content': system_content
+            },
+            {
+                'role': 'user',
+                'content': prompt
+            }
+        ]
+        
+        logger.info(f"Llamando a {self.base_url}/chat con modelo {model or self.model}")
+        return await self._async_call_ollama(messages, model)
+
+    def run_sync(self, coro):
+        """
+        Ejecuta una corrutina del cliente desde código síncrono
+        Usa un event loop temporal y cierra su sesión HTTP al terminar
+        """
+        async def runner():
+            try:
+                return await coro
+            finally:
+                await self.close()
+
         try:
-            system_content = 'Eres un experto en SQL que genera consultas MySQL precisas. Respondes UNICAMENTE con SQL valido, sin explicaciones.' if use_sql_system_prompt else 'Eres un asistente util y amigable.'
-            
-            messages = [
-                {
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(runner())
+
+        # Llamado desde dentro de un event loop: ejecutar en un hilo aparte para no bloquearlo
+        logger.warning("Llamada síncrona a Ollama dentro de un event loop; usa la versión async")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, runner()).result()
+
+    # ==================== SESIÓN HTTP ====================
+
+    def _build_headers(self) -> Dict[str, str]:
+        """Headers comunes para las llamadas a /api/chat (la autenticación va por backend)"""
+        return {'Content-Type': 'application/json'}
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        """Trazas de aiohttp para medir reutilización de conexiones"""
+        stats = self._connection_stats
+
+        async def on_request_start(session, ctx, params):
+            stats['requests'] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            stats['connections_created'] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            stats['connections_reused'] += 1
+
+        async def on_dns_resolvehost_end(session, ctx, params):
+            stats['dns_lookups'] += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            stats['dns_cache_hits'] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        return trace_config
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Retorna la sesión del event loop actual, creándola si no existe
+        Las sesiones de aiohttp no se pueden compartir entre loops
+        """
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                limit_per_host=self.pool_limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self._build_headers(),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[self._build_trace_config()]
+            )
+            self._sessions[loop] = session
+            self._connection_stats['sessions_created'] += 1
+            logger.info(f"Sesión HTTP persistente creada (limit={self.pool_limit}, per_host={self.pool_limit_per_host})")
+        return session
+
+    async def open(self):
+        """Abre la sesión del loop actual (llamado desde el lifespan de la app)"""
+        await self._get_session()
+
+    async def close(self):
+        """Cierra la sesión del loop actual (llamado desde el lifespan de la app)"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+            logger.info("Sesión HTTP persistente cerrada")
+
+    def get_connection_stats(self) -> dict:
+        """Estadísticas de reutilización de conexiones HTTP"""
+        stats = dict(self._connection_stats)
+        total = stats['connections_created'] + stats['connections_reused']
+        stats['reuse_ratio'] = round(stats['connections_reused'] / total, 3) if total else None
+        stats['open_sessions'] = sum(1 for session in list(self._sessions.values()) if not session.closed)
+        return stats
+
+    # ==================== LLAMADAS ASÍNCRONAS ====================
+
+    async def _async_call_ollama(self, messages: list, model: Optional[str] = None) -> Optional[str]:
+        """Método interno para llamada asíncrona a Ollama"""
+        payload = {
+            'model': model or self.model,
+            'messages': messages,
+            'stream': False
+        }
+        
+        data = await self._chat(payload, max_retries=3)
+        if data is None:
+            return None
+        
+        content = data.get('message', {}).get('content', '').strip()
+        if not content:
+            logger.warning("Respuesta vacía de Ollama")
+            return None
+        return content
+
+    async def ask_ai_direct(self, prompt: str, system_prompt: str = None, model: Optional[str] = None) -> str:
+        """
+        Método directo para hacer preguntas a la IA con system prompt personalizable
+        """
+        try:
+            messages = []
+            if system_prompt:
+                messages.append({
                     'role': 'system',
-                    'content': system_content
-                },
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ]
-            
-            logger.info(f"Llamando a {self.base_url}/chat con modelo {self.model}")
-            logger.debug(f"API Key presente: {bool(self.api_key)}")
-            
-            # Usar requests síncrono (más simple y confiable)
-            import requests
+                    'content': system_prompt
+                })
             
-            headers = {'Content-Type': 'application/json'}
-            if self.api_key:
-                headers['Authorization'] = f'Bearer {self.api_key}'
-                logger.debug(f"Auth header configurado")
+            messages.append({
+                'role': 'user',
+                'content': prompt
+            })
             
             payload = {
-                'model': self.model,
+                'model': model or self.model,
                 'messages': messages,
                 'stream': False
             }
             
-            # Implementar reintentos para errores transitorios (429, 5xx)
-            max_retries = 3
-            backoff = 1.0
-            for attempt in range(1, max_retries + 1):
-                response = requests.post(
-                    f"{self.base_url}/chat",
-                    headers=headers,
-                    json=payload,
-                    timeout=self.timeout
-                )
-
-                logger.info(f"Status: {response.status_code} (attempt {attempt})")
-
-                if response.status_code == 200:
-                    data = response.json()
-                    content = data.get('message', {}).get('content', '')
-                    logger.info(f"Respuesta recibida: {len(content)} caracteres")
-                    return content.strip()
-
-                # No reintentar si la autenticación falla
-                if response.status_code == 401:
-                    logger.error(f"Error HTTP 401 Unauthorized: {response.text}")
-                    return None
-
-                # Reintentar en caso de rate limit o errores de servidor
-                if response.status_code in (429,) or 500 <= response.status_code < 600:
-                    logger.warning(f"Error transitorio {response.status_code}, reintentando en {backoff}s: {response.text}")
-                    time_to_sleep = backoff
-                    backoff *= 2
-                    import time
-                    time.sleep(time_to_sleep)
-                    continue
-
-                # Otros errores no recuperables
-                logger.error(f"Error HTTP {response.status_code}: {response.text}")
-                return None
-            
+            data = await self._chat(payload, max_retries=1)
+            if data is None:
+                return f"Error: No se pudo obtener respuesta del LLM"
+            return data.get('message', {}).get('content', '').strip()
         except Exception as e:
-            logger.error(f"Error llamando a Ollama: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return None
+            logger.error(f"Error en ask_ai_direct: {e}")
+            return f"Error: {str(e)}"
 
-    async def _async_call_ollama(self, messages: list) -> Optional[str]:
-        """Método interno para llamada asíncrona a Ollama"""
-        headers = {
-            'Content-Type': 'application/json'
+    async def ask_ai_structured(self, prompt: str, system_prompt: str, schema: dict,
+                                model: Optional[str] = None) -> Tuple[Optional[Any], Optional[str]]:
+        """
+        Pregunta en modo JSON: Ollama restringe la salida al esquema (`format`)
+        y el resultado se valida contra el mismo esquema. Si la salida no cumple se hace
+        un único reintento corto indicando el error
+        Retorna (valor, None) o (None, error); ERROR_NO_RESPONSE si el LLM no respondió
+        """
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': prompt}
+        ]
+        payload = {
+            'model': model or self.model,
+            'messages': messages,
+            'stream': False,
+            'format': schema,
+            'options': {'temperature': 0}
         }
         
-        if self.use_cloud and self.api_key:
-            headers['Authorization'] = f'Bearer {self.api_key}'
+        self._structured_stats['calls'] += 1
+        data = await self._chat(payload, max_retries=1)
+        if data is None:
+            return None, ERROR_NO_RESPONSE
+        content = data.get('message', {}).get('content', '')
+        value, error = parse_structured(content, schema)
+        if error is None:
+            return value, None
+        
+        # Reintento restringido: se muestra la salida inválida y el error concreto
+        logger.warning(f"Salida estructurada inválida ({error}), reintentando")
+        self._structured_stats['repairs'] += 1
+        repair_payload = dict(payload, messages=messages + [
+            {'role': 'assistant', 'content': content[:2000]},
+            {'role': 'user', 'content': f"La respuesta anterior no cumple el esquema JSON: {error}. Responde ÚNICAMENTE con el JSON corregido."}
+        ])
+        data = await self._chat(repair_payload, max_retries=1)
+        if data is None:
+            return None, ERROR_NO_RESPONSE
+        value, error = parse_structured(data.get('message', {}).get('content', ''), schema)
+        if error is None:
+            return value, None
+        self._structured_stats['failures'] += 1
+        logger.warning(f"Salida estructurada inválida tras el reintento: {error}")
+        return None, error
+
+    def get_structured_stats(self) -> dict:
+        """Llamadas en modo JSON, reintentos de reparación y fallas"""
+        return dict(self._structured_stats)
+
+    async def embed(self, texts: List[str], model: str) -> Optional[List[List[float]]]:
+        """
+        Embeddings con /api/embed; prueba los backends en orden (locales primero)
+        Retorna None si ninguno respondió
+        """
+        backends = sorted(self.router.backends, key=lambda backend: backend.is_cloud)
+        for backend in backends:
+            try:
+                session = await self._get_session()
+                async with session.post(f"{backend.base_url}/embed", json={'model': model, 'input': texts},
+                                        headers=backend.headers,
+                                        timeout=aiohttp.ClientTimeout(total=timeout_for(self.timeout))) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        return data.get('embeddings')
+                    logger.warning(f"/api/embed en {backend.name} respondió HTTP {response.status}")
+            except Exception as e:
+                logger.warning(f"/api/embed en {backend.name} falló: {e}")
+        return None
+
+    async def stream_ai_direct(self, prompt: str, system_prompt: str = None,
+                               model: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Versión en streaming de ask_ai_direct: emite los tokens a medida que llegan
+        Si el consumidor deja de iterar (cliente desconectado) se cierra la conexión
+        upstream y Ollama detiene la generación
+        """
+        messages = []
+        if system_prompt:
+            messages.append({'role': 'system', 'content': system_prompt})
+        messages.append({'role': 'user', 'content': prompt})
         
         payload = {
-            'model': self.model,
+            'model': model or self.model,
             'messages': messages,
-            'stream': False
+            'stream': True
         }
         
-        max_retries = 3
+        try:
+            async with self.admission.slot():
+                permit = self.breaker.acquire_permit()
+                if permit is None:
+                    raise LLMStreamError("Circuit breaker LLM abierto")
+                
+                started = time.perf_counter()
+                healthy = None
+                backend = None
+                try:
+                    session = await self._get_session()
+                    with self.router.lease() as backend:
+                        async with session.post(f"{backend.base_url}/chat", json=self._prepare_body(backend, payload),
+                                                headers=backend.headers) as response:
+                            if response.status != 200:
+                                error_text = await response.text()
+                                logger.error(f"Error HTTP {response.status} en streaming: {error_text}")
+                                healthy = False if response.status == 429 or response.status >= 500 else None
+                                raise LLMStreamError(f"HTTP {response.status}")
+                            
+                            try:
+                                # Ollama envía un objeto JSON por línea (NDJSON)
+                                async for line in response.content:
+                                    line = line.strip()
+                                    if not line:
+                                        continue
+                                    chunk = json.loads(line)
+                                    if chunk.get('error'):
+                                        healthy = False
+                                        raise LLMStreamError(chunk['error'])
+                                    token = chunk.get('message', {}).get('content', '')
+                                    if token:
+                                        yield token
+                                    if chunk.get('done'):
+                                        # El último chunk trae los contadores de tokens y tiempos
+                                        healthy = True
+                                        self.metrics.record(payload.get('model'), chunk,
+                                                            (time.perf_counter() - started) * 1000)
+                                        break
+                            finally:
+                                if healthy is None:
+                                    # Consumidor cancelado: cerrar el socket en vez de drenar el cuerpo
+                                    response.close()
+                except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+                    healthy = False
+                    raise LLMStreamError(str(e)) from e
+                finally:
+                    self._record_upstream_result(permit, healthy, started)
+                    if healthy is not None and backend is not None:
+                        self.router.record_result(backend, healthy)
+        except AdmissionRejected as e:
+            raise LLMStreamError(str(e)) from e
+
+    @staticmethod
+    def _single_flight_key(payload: dict, max_retries: int, priority: int) -> tuple:
+        """
+        Llave de coalescencia: (modelo, hash de mensajes, resto de opciones, reintentos, prioridad)
+        Solo se comparten llamadas que harían exactamente lo mismo en la cola de admisión
+        """
+        messages_json = json.dumps(payload.get('messages', []), sort_keys=True, ensure_ascii=False)
+        messages_hash = hashlib.sha256(messages_json.encode('utf-8')).hexdigest()
+        options = {k: v for k, v in payload.items() if k not in ('model', 'messages')}
+        return (payload.get('model'), messages_hash, json.dumps(options, sort_keys=True), max_retries, priority)
+
+    async def _chat(self, payload: dict, max_retries: int = 3) -> Optional[dict]:
+        """
+        Llamada a /api/chat con coalescencia de peticiones idénticas en vuelo
+        La llamada compartida corre sin deadline (no la corta la petición que la inició);
+        cada llamador acota su propia espera con su deadline
+        Retorna el JSON completo de la respuesta o None si falló
+        """
+        if not self.single_flight_enabled:
+            return await self._post_chat(payload, max_retries)
+
+        deadline = current_deadline()
+        if deadline is not None and not deadline.allows(min_stage_seconds()):
+            logger.warning("Deadline de la petición agotado; no se llama al LLM")
+            deadline.mark_partial('llm')
+            return None
+
+        async def shared_call() -> Optional[dict]:
+            with without_deadline():
+                return await self._post_chat(payload, max_retries)
+
+        key = self._single_flight_key(payload, max_retries, current_llm_priority())
+        try:
+            return await asyncio.wait_for(self.single_flight.do(key, shared_call),
+                                          timeout=deadline.remaining() if deadline is not None else None)
+        except asyncio.TimeoutError:
+            if deadline is None:
+                raise
+            logger.warning("Deadline de la petición agotado esperando la llamada al LLM")
+            deadline.mark_partial('llm')
+            return None
+
+    async def _post_chat(self, payload: dict, max_retries: int = 3) -> Optional[dict]:
+        """
+        POST a /api/chat con reintentos para 429, 5xx y errores de transporte
+        Cada intento pasa por el control de admisión y el circuit breaker;
+        si se descarta o el circuito está abierto retorna None de inmediato
+        Con deadline de petición cada intento usa como timeout el tiempo restante
+        y no se reintenta si la espera no cabe en el presupuesto
+        """
         retry_delay = 2
+        deadline = current_deadline()
         
         for attempt in range(max_retries):
+            wait_seconds = retry_delay
+            if deadline is not None and not deadline.allows(min_stage_seconds()):
+                logger.warning("Deadline de la petición agotado; no se llama al LLM")
+                deadline.mark_partial('llm')
+                return None
             try:
-                timeout = aiohttp.ClientTimeout(total=self.timeout)
-                
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    async with session.post(
-                        f"{self.base_url}/chat",
-                        headers=headers,
-                        json=payload
-                    ) as response:
+                async with self.admission.slot():
+                    permit = self.breaker.acquire_permit()
+                    if permit is None:
+                        logger.warning("Circuit breaker LLM abierto; usando fallback")
+                        return None
+                    
+                    started = time.perf_counter()
+                    healthy = None
+                    try:
+                        attempt_timeout = deadline.timeout(self.timeout) if deadline is not None else self.timeout
+                        status, body, headers = await asyncio.wait_for(
+                            self.router.dispatch(lambda backend: self._send_chat(backend, payload),
+                                                 self._is_backend_healthy),
+                            timeout=attempt_timeout)
                         
-                        if response.status == 200:
-                            data = await response.json()
-                            content = data.get('message', {}).get('content', '').strip()
-                            if content:
-                                return content
-                            else:
-                                logger.warning("Respuesta vacía de Ollama")
-                                return None
-                        else:
-                            error_text = await response.text()
-                            logger.error(f"Error HTTP {response.status}: {error_text}")
-                            
-                            if response.status == 401:
-                                logger.error("Error de autenticación con Ollama Cloud")
-                                return None
-                            
-                            if attempt < max_retries - 1:
-                                logger.info(f"Reintentando en {retry_delay} segundos...")
-                                await asyncio.sleep(retry_delay)
-                                retry_delay *= 2
-                            else:
-                                return None
+                        if status == 200:
+                            healthy = True
+                            self.metrics.record(payload.get('model'), body, (time.perf_counter() - started) * 1000)
+                            return body
+                        
+                        logger.error(f"Error HTTP {status}: {body}")
+                        
+                        if status == 401:
+                            logger.error("Error de autenticación con Ollama Cloud")
+                            return None
+                        
+                        # Solo se reintentan rate limit y errores de servidor
+                        if status != 429 and status < 500:
+                            return None
+                        
+                        healthy = False
+                        if status == 429:
+                            retry_after = parse_retry_after(headers.get('Retry-After'))
+                            if retry_after is not None:
+                                self.admission.pause(retry_after)
+                                wait_seconds = max(retry_delay, retry_after)
+                    except asyncio.TimeoutError:
+                        # Un corte por deadline de la petición no es una falla del upstream
+                        if attempt_timeout >= self.timeout:
+                            healthy = False
+                        raise
+                    except aiohttp.ClientError:
+                        healthy = False
+                        raise
+                    finally:
+                        self._record_upstream_result(permit, healthy, started)
                                 
+            except AdmissionRejected as e:
+                logger.warning(f"{e}; usando fallback")
+                return None
             except asyncio.TimeoutError:
                 logger.error(f"Timeout en intento {attempt + 1}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
+                if deadline is not None and deadline.expired():
+                    deadline.mark_partial('llm')
                     return None
             except Exception as e:
                 logger.error(f"Error en intento {attempt + 1}: {e}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
+            
+            if attempt < max_retries - 1:
+                if self.breaker.should_degrade():
+                    logger.warning("Circuit breaker LLM abierto; se cancelan los reintentos")
+                    return None
+                if deadline is not None and not deadline.allows(wait_seconds + min_stage_seconds()):
+                    logger.warning("Sin presupuesto de tiempo para reintentar la llamada al LLM")
+                    deadline.mark_partial('llm')
                     return None
+                logger.info(f"Reintentando en {wait_seconds} segundos...")
+                await asyncio.sleep(wait_seconds)
+                retry_delay *= 2
         
         return None
 
-    async def ask_ai_direct(self, prompt: str, system_prompt: str = None) -> str:
+    async def _send_chat(self, backend: LLMBackend, payload: dict) -> Tuple[int, Any, Mapping]:
+        """POST a /api/chat de un backend; retorna (status, JSON o texto del error, headers)"""
+        session = await self._get_session()
+        async with session.post(f"{backend.base_url}/chat", json=self._prepare_body(backend, payload),
+                                headers=backend.headers) as response:
+            if response.status == 200:
+                return response.status, await response.json(), response.headers
+            return response.status, await response.text(), response.headers
+
+    @staticmethod
+    def _is_backend_healthy(result: Tuple[int, Any, Mapping]) -> bool:
+        """Un 429 o 5xx cuenta como falla del backend (para el router y el hedging)"""
+        status = result[0]
+        return status != 429 and status < 500
+
+    def _record_upstream_result(self, permit: str, healthy: Optional[bool], started: float):
+        """Informa al circuit breaker el resultado y la latencia de un intento"""
+        latency_ms = (time.perf_counter() - started) * 1000
+        if healthy is True:
+            self.breaker.record_success(permit, latency_ms)
+        elif healthy is False:
+            self.breaker.record_failure(permit, latency_ms)
+        else:
+            self.breaker.release(permit)
+
+    # ==================== PRECARGA Y KEEP_ALIVE ====================
+
+    def _prepare_body(self, backend: LLMBackend, payload: dict) -> dict:
         """
-        Método directo para hacer preguntas a la IA con system prompt personalizable
+        Cuerpo final para un backend: modelo fijado del backend y, en Ollama local,
+        keep_alive del modelo para que no se descargue tras un rato ocioso
         """
+        body = backend.prepare_payload(payload, self.model)
+        if not backend.is_cloud:
+            keep_alive = self.keepalive.keep_alive_for(body.get('model'))
+            if keep_alive and 'keep_alive' not in body:
+                body = dict(body, keep_alive=keep_alive)
+            self.keepalive.mark_used(body.get('model'))
+        return body
+
+    def has_local_backends(self) -> bool:
+        return any(not backend.is_cloud for backend in self.router.backends)
+
+    def configured_models(self) -> list:
+        """Modelos que puede usar el cliente (grande, pequeño y fijados por backend)"""
+        models = [self.model_policy.large_model]
+        if self.model_policy.enabled:
+            models.append(self.model_policy.small_model)
+        models.extend(backend.model for backend in self.router.backends if backend.model)
+        return list(dict.fromkeys(models))
+
+    async def preload_models(self, models: Optional[list] = None) -> bool:
+        """
+        Carga los modelos en memoria en cada backend local con un /api/generate vacío
+        (Ollama carga el modelo sin generar y renueva su keep_alive)
+        """
+        models = models or self.configured_models()
+        calls = []
+        for backend in self.router.backends:
+            if backend.is_cloud:
+                continue
+            backend_models = [backend.model] if backend.model else models
+            calls.extend(self._preload_model(backend, model) for model in backend_models)
+        if not calls:
+            return False
+        results = await asyncio.gather(*calls)
+        return any(results)
+
+    async def _preload_model(self, backend: LLMBackend, model: str) -> bool:
+        """Precarga un modelo en un backend local"""
+        payload = {'model': model}
+        keep_alive = self.keepalive.keep_alive_for(model)
+        if keep_alive:
+            payload['keep_alive'] = keep_alive
         try:
-            headers = {
-                'Content-Type': 'application/json'
-            }
-            
-            if self.use_cloud and self.api_key:
-                headers['Authorization'] = f'Bearer {self.api_key}'
-            
-            messages = []
-            if system_prompt:
-                messages.append({
-                    'role': 'system',
-                    'content': system_prompt
-                })
-            
-            messages.append({
-                'role': 'user',
-                'content': prompt
-            })
-            
-            payload = {
-                'model': self.model,
-                'messages': messages,
-                'stream': False
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=self.timeout)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(f"{self.base_url}/chat", headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get('message', {}).get('content', '').strip()
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Error HTTP {response.status}: {error_text}")
-                        return f"Error: No se pudo obtener respuesta del LLM"
+            session = await self._get_session()
+            async with session.post(f"{backend.base_url}/generate", json=payload, headers=backend.headers) as response:
+                await response.read()
+                ok = response.status == 200
+                if ok:
+                    logger.info(f"Modelo {model} cargado en {backend.name} (keep_alive={keep_alive})")
+                else:
+                    logger.warning(f"Precarga de {model} en {backend.name} falló con HTTP {response.status}")
         except Exception as e:
-            logger.error(f"Error en ask_ai_direct: {e}")
-            return f"Error: {str(e)}"
\ No newline at end of file
+            logger.warning(f"Precarga de {model} en {backend.name} falló: {e}")
+            ok = False
+        self.keepalive.record_preload(model, ok)
+        return ok
+
+    async def warmup(self) -> bool:
+        """
+        Deja los modelos cargados antes de recibir tráfico real (sin reintentos):
+        precarga con /api/generate en backends locales y una petición mínima en Cloud
+        """
+        payload = {
+            'model': self.model,
+            'messages': [{'role': 'user', 'content': 'ok'}],
+            'stream': False,
+            'options': {'num_predict': 1}
+        }
+
+        calls = [self._warmup_backend(backend, payload) for backend in self.router.backends if backend.is_cloud]
+        if self.has_local_backends():
+            calls.append(self.preload_models())
+        results = await asyncio.gather(*calls)
+        return any(results)
+
+    async def _warmup_backend(self, backend: LLMBackend, payload: dict) -> bool:
+        """Precalienta el modelo en un backend Cloud del router"""
+        try:
+            session = await self._get_session()
+            async with session.post(f"{backend.base_url}/chat", json=self._prepare_body(backend, payload),
+                                    headers=backend.headers) as response:
+                if response.status == 200:
+                    await response.read()
+                    logger.info(f"Modelo {backend.model or self.model} precalentado en {backend.name}")
+                    return True
+                error_text = await response.text()
+                logger.warning(f"Warm-up del modelo en {backend.name} falló con HTTP {response.status}: {error_text}")
+                return False
+        except Exception as e:
+            logger.warning(f"Warm-up del modelo en {backend.name} falló: {e}")
+            return False
@@ -0,0 +1,158 @@
+"""
+Codificación compacta de propiedades candidatas para los prompts del LLM
+Una línea por candidato con columnas cortas, empaquetada según un presupuesto de tokens
+"""
+import os
+import re
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]|\s{2,}", re.UNICODE)
+_WORD_PATTERN = re.compile(r"[a-záéíóúñü0-9]+")
+
+# Palabras sin valor para distinguir candidatos
+_STOP_WORDS = {
+    'el', 'la', 'de', 'en', 'y', 'a', 'que', 'con', 'por', 'para', 'un', 'una', 'es', 'se',
+    'del', 'los', 'las', 'al', 'su', 'sus', 'muy', 'más', 'mas', 'como', 'este', 'esta',
+    'ideal', 'excelente', 'hermosa', 'hermoso', 'amplia', 'amplio', 'bonita', 'bonito',
+    'propiedad', 'venta', 'ubicada', 'ubicado', 'cuenta', 'tiene', 'incluye', 'cerca'
+}
+
+COMPACT_HEADER = "id|tipo|precio_q|hab|ban|m2|zona|claves"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimación de tokens sin tokenizer: palabras, signos y tramos de espacios (indentación),
+    con los fragmentos largos contando como varios tokens (aprox. 1 cada 6 caracteres)
+    """
+    if not text:
+        return 0
+    return sum(1 + (len(piece) - 1) // 6 for piece in _TOKEN_PATTERN.findall(text))
+
+
+class EncodedCandidates:
+    """Resultado de empaquetar candidatos: filas, IDs incluidos y medición de tokens"""
+
+    def __init__(self, rows: List[str], ids: List, total: int, tokens: int, verbose_tokens: int):
+        self.rows = rows
+        self.ids = ids
+        self.total = total
+        self.tokens = tokens
+        self.verbose_tokens = verbose_tokens
+
+    @property
+    def text(self) -> str:
+        """Bloque con encabezado y una fila por candidato"""
+        return '\n'.join([COMPACT_HEADER] + self.rows)
+
+    @property
+    def included(self) -> int:
+        return len(self.ids)
+
+    def get_stats(self) -> dict:
+        """Medición para metadata: tokens del bloque compacto vs el formato por bloques anterior"""
+        saved = self.verbose_tokens - self.tokens
+        return {
+            'encoding': 'compact',
+            'candidates_total': self.total,
+            'candidates_encoded': self.included,
+            'candidate_tokens': self.tokens,
+            'verbose_tokens': self.verbose_tokens,
+            'tokens_saved': saved,
+            'token_reduction': round(saved / self.verbose_tokens, 3) if self.verbose_tokens else 0.0
+        }
+
+
+class CandidateEncoder:
+    """
+    Codifica propiedades en formato tabular compacto
+    Empaqueta tantos candidatos como quepan en el presupuesto de tokens
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, max_terms: Optional[int] = None,
+                 max_candidates: Optional[int] = None):
+        self.token_budget = token_budget or int(os.getenv('SEMANTIC_PROMPT_TOKEN_BUDGET', 1500))
+        self.max_terms = max_terms or int(os.getenv('SEMANTIC_DESCRIPTION_TERMS', 8))
+        self.max_candidates = max_candidates or int(os.getenv('SEMANTIC_MAX_CANDIDATES', 100))
+
+    def key_terms(self, prop: Dict) -> List[str]:
+        """Términos clave del título y la descripción, sin repetir tipo ni zona"""
+        skip = set(_WORD_PATTERN.findall(f"{prop.get('tipo', '')} {prop.get('ubicacion', '')}".lower()))
+        terms = []
+        seen = set()
+        text = f"{prop.get('titulo', '')} {prop.get('descripcion', '')}".lower()
+        for word in _WORD_PATTERN.findall(text):
+            if len(word) < 3 or word in _STOP_WORDS or word in skip or word in seen:
+                continue
+            seen.add(word)
+            terms.append(word)
+            if len(terms) >= self.max_terms:
+                break
+        return terms
+
+    def encode_row(self, prop: Dict, index: int = 0) -> str:
+        """Una línea por candidato; los separadores se eliminan de los valores"""
+        def clean(value) -> str:
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            return str(value if value is not None else '').replace('|', '/').replace('\n', ' ').strip()
+
+        try:
+            price = f"{float(prop.get('precio') or 0):.0f}"
+        except (TypeError, ValueError):
+            price = clean(prop.get('precio'))
+
+        return '|'.join([
+            clean(prop.get('id', index)),
+            clean(prop.get('tipo')),
+            price,
+            clean(prop.get('habitaciones', 0)),
+            clean(prop.get('banos', 0)),
+            clean(prop.get('area_m2', 0)),
+            clean(prop.get('ubicacion')),
+            ' '.join(self.key_terms(prop))
+        ])
+
+    @staticmethod
+    def verbose_block(prop: Dict, index: int = 0) -> str:
+        """Formato por bloques usado antes; solo para medir la reducción de tokens"""
+        return f"""
+                ID: {prop.get('id', index)}
+                Título: {prop.get('titulo', 'Sin título')}
+                Tipo: {prop.get('tipo', 'N/A')}
+                Precio: Q{prop.get('precio', 0):,.2f}
+                Habitaciones: {prop.get('habitaciones', 0)}
+                Baños: {prop.get('banos', 0)}
+                Área: {prop.get('area_m2', 0)} m²
+                Ubicación: {prop.get('ubicacion', 'N/A')}
+                Descripción: {(prop.get('descripcion') or 'Sin descripción')[:100]}...
+                ---
+                """
+
+    def pack(self, properties: List[Dict], token_budget: Optional[int] = None) -> EncodedCandidates:
+        """Agrega candidatos en orden hasta agotar el presupuesto de tokens del bloque"""
+        budget = token_budget or self.token_budget
+        rows = []
+        tokens = estimate_tokens(COMPACT_HEADER)
+        verbose_tokens = 0
+        ids = []
+
+        for index, prop in enumerate(properties[:self.max_candidates]):
+            row = self.encode_row(prop, index)
+            row_tokens = estimate_tokens(row) + 1  # salto de línea
+            if tokens + row_tokens > budget and ids:
+                break
+            rows.append(row)
+            tokens += row_tokens
+            ids.append(prop.get('id', index))
+            try:
+                verbose_tokens += estimate_tokens(self.verbose_block(prop, index))
+            except (TypeError, ValueError):
+                pass
+
+        if len(ids) < len(properties):
+            logger.info(f"Presupuesto de {budget} tokens: {len(ids)} de {len(properties)} candidatos incluidos")
+        return EncodedCandidates(rows, ids, len(properties), tokens, verbose_tokens)
@@ -8,6 +8,7 @@ from typing import List, Optional, Dict, Any
 from datetime import date
 from ..models import Product
 from ..repositories.property_repository import IPropertyRepository
+from .fallback_store_service import products_fallback_store
 
 
 class IPropertyService(ABC):
@@ -145,17 +146,12 @@ class PropertyService(IPropertyService):
         
         # Si no hay propiedades, intentar cargar desde JSON
         if not properties_dict or len(properties_dict) == 0:
-            import json
-            import os
-            
             try:
-                json_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'products.json')
-                if os.path.exists(json_path):
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        json_data = json.load(f)
-                        print(f"PropertyService: Cargando {len(json_data)} propiedades desde JSON como fallback")
-                        properties_dict = json_data
-                        sql_query = "Datos cargados desde archivo JSON (fallback)"
+                json_data = products_fallback_store.get_records()
+                if json_data:
+                    print(f"PropertyService: Cargando {len(json_data)} propiedades desde JSON como fallback")
+                    properties_dict = json_data
+                    sql_query = "Datos cargados desde archivo JSON (fallback)"
             except Exception as e:
                 print(f"Error al cargar JSON fallback en PropertyService: {e}")
                 properties_dict = []
@@ -0,0 +1,147 @@
+"""
+Registro de consultas de búsqueda recientes
+Se usa para reproducir las consultas más frecuentes al arrancar (warm-up)
+"""
+import os
+import json
+import asyncio
+import time
+import logging
+import threading
+from collections import Counter, deque
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_LOG_PATH = Path(__file__).resolve().parents[2] / 'logs' / 'query_log.jsonl'
+
+
+class QueryLog:
+    """
+    Log de consultas en archivo JSONL con ventana acotada en memoria
+    record() solo agrega a memoria y a un buffer; la escritura al archivo (y la carga inicial)
+    se hace en un hilo del executor para no bloquear el event loop
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = Path(path or os.getenv('QUERY_LOG_PATH', str(DEFAULT_QUERY_LOG_PATH)))
+        self.max_entries = max_entries or int(os.getenv('QUERY_LOG_MAX_ENTRIES', 5000))
+        self._entries = deque(maxlen=self.max_entries)
+        self._pending: List[dict] = []
+        # _lock protege memoria y buffer (operaciones cortas); _io_lock serializa el acceso al archivo
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._loaded = False
+        self._flush_scheduled = False
+        self._file_lines = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normaliza la consulta para agrupar variantes triviales"""
+        return ' '.join((query or '').lower().split())
+
+    def record(self, query: str):
+        """Registra una consulta (best-effort, nunca lanza excepción)"""
+        normalized = self.normalize(query)
+        if not normalized:
+            return
+
+        entry = {'ts': time.time(), 'query': normalized}
+        with self._lock:
+            self._entries.append(entry)
+            self._pending.append(entry)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Sin event loop (scripts, pruebas): escribir en el mismo hilo
+            self.flush()
+            return
+        loop.run_in_executor(None, self.flush)
+
+    def flush(self):
+        """Escribe al archivo las consultas pendientes (bloqueante: fuera del event loop)"""
+        with self._io_lock:
+            self._ensure_loaded()
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._flush_scheduled = False
+            if not pending:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    for entry in pending:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                self._file_lines += len(pending)
+                # Compactar el archivo cuando crece el doble de la ventana
+                if self._file_lines >= 2 * self.max_entries:
+                    self._compact()
+            except OSError as e:
+                logger.debug(f"No se pudo escribir el log de consultas: {e}")
+
+    def top_queries(self, n: int, max_age_seconds: Optional[int] = None) -> List[str]:
+        """Retorna las N consultas más frecuentes de la ventana reciente"""
+        if n <= 0:
+            return []
+
+        with self._io_lock:
+            self._ensure_loaded()
+        with self._lock:
+            entries = list(self._entries)
+
+        if max_age_seconds:
+            cutoff = time.time() - max_age_seconds
+            entries = [e for e in entries if e.get('ts', 0) >= cutoff]
+
+        counter = Counter(e['query'] for e in entries)
+        return [query for query, _ in counter.most_common(n)]
+
+    def _ensure_loaded(self):
+        """
+        Carga la cola del archivo existente la primera vez (requiere _io_lock)
+        Las consultas registradas antes de la carga quedan después de las del archivo
+        """
+        if self._loaded:
+            return
+        self._loaded = True
+
+        if not self.path.exists():
+            return
+
+        loaded = deque(maxlen=self.max_entries)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._file_lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get('query'):
+                        loaded.append(entry)
+            logger.info(f"Log de consultas cargado: {len(loaded)} entradas desde {self.path}")
+        except OSError as e:
+            logger.warning(f"No se pudo leer el log de consultas: {e}")
+            return
+
+        with self._lock:
+            loaded.extend(self._entries)
+            self._entries = loaded
+
+    def _compact(self):
+        """Reescribe el archivo solo con la ventana en memoria (requiere _io_lock)"""
+        with self._lock:
+            # La ventana ya incluye las pendientes: se escriben aquí y no en el próximo flush
+            entries = list(self._entries)
+            self._pending = []
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+        self._file_lines = len(entries)
@@ -0,0 +1,482 @@
+"""
+Parser de consultas de búsqueda en lenguaje natural
+Tokeniza la consulta en una sola pasada y resuelve por posición multiplicadores
+(mil, millones), rangos (entre X y Y), modificadores (menos de, desde) y el campo
+al que se refiere cada número (habitaciones, baños, área, precio)
+Las ubicaciones salen del gazetteer (Aho-Corasick) con su id canónico
+También mide qué parte de la consulta quedó expresada en filtros (coverage)
+"""
+import os
+import re
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from .gazetteer_service import KIND_ZONE, LocationEntry, default_gazetteer, fold
+
+logger = logging.getLogger(__name__)
+
+MODIFIER_MAX = 'max'
+MODIFIER_MIN = 'min'
+
+FIELD_HABITACIONES = 'habitaciones'
+FIELD_BANOS = 'banos'
+FIELD_AREA = 'area'
+FIELD_PRECIO = 'precio'
+
+# Número con separador de miles (300,000) o decimal (1.5 / 1,5); palabra con sufijo 2/² (m2); símbolo $
+_TOKEN_RE = re.compile(
+    r'(?P<num>\d{1,3}(?:,\d{3})+(?![\d.,])|\d+(?:[.,]\d+)?)'
+    r'|(?P<word>[^\W\d_]+[2²]?)'
+    r'|(?P<sym>\$)'
+)
+
+_MULTIPLIERS = {
+    'mil': 1e3, 'miles': 1e3, 'k': 1e3,
+    'millon': 1e6, 'millones': 1e6
+}
+
+# Con plurales y femeninos: "casas mayores a 200 metros", "área máxima de 150"
+_MODIFIERS = {
+    'menos': MODIFIER_MAX, 'menor': MODIFIER_MAX, 'menores': MODIFIER_MAX, 'hasta': MODIFIER_MAX,
+    'maximo': MODIFIER_MAX, 'maximos': MODIFIER_MAX, 'maxima': MODIFIER_MAX, 'maximas': MODIFIER_MAX,
+    'max': MODIFIER_MAX,
+    'mas': MODIFIER_MIN, 'mayor': MODIFIER_MIN, 'mayores': MODIFIER_MIN, 'desde': MODIFIER_MIN,
+    'minimo': MODIFIER_MIN, 'minimos': MODIFIER_MIN, 'minima': MODIFIER_MIN, 'minimas': MODIFIER_MIN,
+    'min': MODIFIER_MIN
+}
+
+# Palabras que pueden ir entre el modificador y el número: "más de", "mayor a"
+_MODIFIER_LINKS = {'de', 'a', 'que', 'los', 'las'}
+
+# "al menos 150", "por lo menos 2": mínimo, no máximo
+_AT_LEAST_PREFIXES = {'al', 'lo'}
+
+# Prefijos de moneda pegados al número: "$150,000", "Q500", "US$ 200"; no separan modificador y número
+_CURRENCY_PREFIXES = {'$', 'q', 'us'}
+
+_FIELDS = {}
+for _field, _words in (
+    (FIELD_HABITACIONES, ('habitacion', 'habitaciones', 'cuarto', 'cuartos', 'recamara', 'recamaras',
+                          'dormitorio', 'dormitorios')),
+    (FIELD_BANOS, ('baño', 'baños', 'bano', 'banos', 'sanitario', 'sanitarios')),
+    (FIELD_AREA, ('metro', 'metros', 'm2', 'm²', 'mts', 'area', 'superficie', 'cuadrado', 'cuadrados')),
+    (FIELD_PRECIO, ('precio', 'cuesta', 'cueste', 'vale', 'valor', 'quetzales', 'q', 'dolar', 'dolares',
+                    'presupuesto', 'costo', '$'))
+):
+    for _word in _words:
+        _FIELDS[_word] = _field
+
+_TYPES = {}
+for _tipo, _words in (
+    ('casa', ('casa', 'casas')),
+    ('departamento', ('departamento', 'departamentos', 'apartamento', 'apartamentos')),
+    ('terreno', ('terreno', 'terrenos', 'lote', 'lotes'))
+):
+    for _word in _words:
+        _TYPES[_word] = _tipo
+# Con varios tipos en la consulta gana el primero de esta lista
+_TYPE_PRIORITY = ('casa', 'departamento', 'terreno')
+
+STOP_WORDS = frozenset({
+    'el', 'la', 'de', 'en', 'y', 'a', 'que', 'con', 'por', 'para', 'un', 'una',
+    'es', 'se', 'del', 'los', 'las'
+})
+
+# Palabras que no restringen la búsqueda: no cuentan para la cobertura
+_NEUTRAL_WORDS = frozenset({
+    'o', 'u', 'e', 'al', 'lo', 'us', 'me', 'mi', 'y', 'busco', 'buscando', 'buscar', 'quiero', 'necesito',
+    'muestrame', 'mostrar', 'ver',
+    'deseo', 'interesa', 'gustaria', 'propiedad', 'propiedades', 'inmueble', 'inmuebles', 'venta',
+    'comprar', 'compra', 'disponible', 'disponibles', 'tenga', 'tengan', 'tiene', 'sea', 'ubicada',
+    'ubicado', 'ubicadas', 'ubicados'
+}) | STOP_WORDS | _MODIFIER_LINKS | frozenset(_MULTIPLIERS)
+
+# Filtro que da sentido a cada palabra de campo
+_FIELD_FILTERS = {
+    FIELD_HABITACIONES: ('habitaciones', 'habitaciones_min', 'habitaciones_max'),
+    FIELD_BANOS: ('banos', 'banos_min', 'banos_max'),
+    FIELD_AREA: ('area_min', 'area_max', 'area_exacta'),
+    FIELD_PRECIO: ('precio_min', 'precio_max', 'precio_exacto')
+}
+
+# Ventanas (en tokens) para asociar un número con la palabra de su campo
+_LOOKAHEAD = 2
+_LOOKBEHIND = 3
+
+# Filtros en el orden del dict histórico de _extract_filters
+FILTER_FIELDS = (
+    'tipo', 'precio_min', 'precio_max', 'precio_exacto', 'precio_tolerancia',
+    'habitaciones', 'habitaciones_min', 'habitaciones_max', 'banos', 'banos_min', 'banos_max', 'area_min', 'area_max', 'area_exacta', 'area_tolerancia',
+    'ubicacion_incluye', 'ubicacion_id'
+)
+
+
+class QueryFilters:
+    """
+    Resultado del parser; se comparte entre llamadas (memoizado), no se debe modificar
+    Además de los filtros guarda los números, precios y áreas detectados y las keywords
+    """
+
+    def __init__(self):
+        self.tipo: Optional[str] = None
+        self.precio_min: Optional[float] = None
+        self.precio_max: Optional[float] = None
+        self.precio_exacto: Optional[float] = None
+        self.precio_tolerancia: Optional[float] = None
+        self.habitaciones: Optional[int] = None
+        self.habitaciones_min: Optional[int] = None
+        self.habitaciones_max: Optional[int] = None
+        self.banos: Optional[float] = None
+        self.banos_min: Optional[float] = None
+        self.banos_max: Optional[float] = None
+        self.area_min: Optional[float] = None
+        self.area_max: Optional[float] = None
+        self.area_exacta: Optional[float] = None
+        self.area_tolerancia: Optional[float] = None
+        self.ubicacion_incluye: Optional[str] = None
+        self.ubicacion_id: Optional[str] = None
+        self.locations: Tuple[str, ...] = ()
+        self.location_ids: Tuple[str, ...] = ()
+        self.numbers: Tuple[float, ...] = ()
+        self.prices: Tuple[float, ...] = ()
+        self.areas: Tuple[float, ...] = ()
+        self.keywords: Tuple[str, ...] = ()
+        # Fracción de las palabras con contenido que quedaron en filtros, y las que no
+        self.coverage: float = 0.0
+        self.uncovered: Tuple[str, ...] = ()
+
+    def to_dict(self) -> dict:
+        """Filtros definidos, con las mismas llaves que el dict de _extract_filters"""
+        return {name: getattr(self, name) for name in FILTER_FIELDS if getattr(self, name) is not None}
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, name) is not None for name in FILTER_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"QueryFilters({self.to_dict()})"
+
+
+def _to_number(text: str) -> float:
+    if ',' in text and re.fullmatch(r'\d{1,3}(?:,\d{3})+', text):
+        return float(text.replace(',', ''))
+    return float(text.replace(',', '.'))
+
+
+class _Token:
+    __slots__ = ('kind', 'text', 'key', 'value', 'start', 'end')
+
+    def __init__(self, kind: str, text: str, start: int = 0, end: int = 0):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+        self.key = fold(text) if kind != 'num' else text
+        self.value = _to_number(text) if kind == 'num' else None
+
+
+def _tokenize(text: str) -> List[_Token]:
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        tokens.append(_Token('word' if kind == 'sym' else kind, match.group(), match.start(), match.end()))
+    return tokens
+
+
+class _Parser:
+    """Una pasada por los tokens; los números se resuelven con su posición"""
+
+    def __init__(self, text: str):
+        self.tokens = tokens = _tokenize(text)
+        self.result = QueryFilters()
+        self.consumed = set()   # posiciones ya asignadas (números de un rango, palabra de campo)
+        self.types = set()
+        self.type_at: Dict[int, str] = {}
+        self.assigned = set()   # números, modificadores y 'entre' que terminaron en un filtro
+        self.zones: List[LocationEntry] = []
+        self.places: List[LocationEntry] = []
+        # Ubicaciones del gazetteer por token inicial: (ubicación, tokens que ocupa)
+        self.locations_at: Dict[int, Tuple[LocationEntry, int]] = {}
+        for match in default_gazetteer().find(text):
+            covered = [i for i, token in enumerate(tokens) if token.start >= match.start and token.end <= match.end]
+            if covered:
+                self.locations_at[covered[0]] = (match.entry, len(covered))
+        self.prices: List[float] = []
+        self.areas: List[float] = []
+
+    def parse(self) -> QueryFilters:
+        tokens = self.tokens
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            located = self.locations_at.get(index)
+            if located is not None:
+                entry, length = located
+                (self.zones if entry.kind == KIND_ZONE else self.places).append(entry)
+                self.consumed.update(range(index, index + length))
+                index += length
+                continue
+            if token.kind == 'num':
+                if index not in self.consumed:
+                    self._number(index)
+            elif token.key in _TYPES:
+                self.types.add(_TYPES[token.key])
+                self.type_at[index] = _TYPES[token.key]
+            elif token.key == 'entre':
+                self._range(index)
+            index += 1
+        return self._finish()
+
+    # ==================== NÚMEROS ====================
+
+    def _multiplier_at(self, index: int) -> float:
+        if index < len(self.tokens) and self.tokens[index].kind == 'word':
+            return _MULTIPLIERS.get(self.tokens[index].key, 1.0)
+        return 1.0
+
+    def _skip_currency(self, index: int) -> int:
+        """Posición del número tras un prefijo de moneda ('$', 'Q', 'US$') que empiece en `index`"""
+        tokens = self.tokens
+        while index < len(tokens) and tokens[index].kind == 'word' and tokens[index].key in _CURRENCY_PREFIXES:
+            index += 1
+        return index
+
+    def _currency_start(self, index: int) -> int:
+        """Primera posición del prefijo de moneda del número en `index` (o el número mismo)"""
+        tokens = self.tokens
+        while index > 0 and tokens[index - 1].kind == 'word' and tokens[index - 1].key in _CURRENCY_PREFIXES:
+            index -= 1
+        return index
+
+    def _modifier_before(self, index: int) -> Tuple[Optional[str], Optional[int]]:
+        """'menos 300', 'menos de $300', 'mayor a 300', 'al menos 300': (modificador, posición)"""
+        start = self._currency_start(index)
+        for back in (1, 2):
+            position = start - back
+            if position < 0 or self.tokens[position].kind == 'num':
+                break
+            key = self.tokens[position].key
+            if key in _MODIFIERS:
+                if key == 'menos' and position > 0 and self.tokens[position - 1].key in _AT_LEAST_PREFIXES:
+                    return MODIFIER_MIN, position
+                return _MODIFIERS[key], position
+            if key not in _MODIFIER_LINKS:
+                break
+        return None, None
+
+    def _field_for(self, first: int, last: int) -> Optional[str]:
+        """
+        Campo de un número (o rango) en tokens[first..last]: la palabra justo antes si nadie
+        la usó ('precio 850000', 'habitaciones 3 baños 2'), si no la que lo sigue
+        ('3 habitaciones', '500 mil quetzales') o la más cercana antes ('precio de 500 mil')
+        """
+        tokens = self.tokens
+        previous = first - 1
+        if previous >= 0 and previous not in self.consumed and tokens[previous].key in _FIELDS:
+            self.consumed.add(previous)
+            return _FIELDS[tokens[previous].key]
+        position = last + 1
+        if self._multiplier_at(position) != 1.0:
+            position += 1
+        for ahead in range(position, min(len(tokens), position + _LOOKAHEAD)):
+            if tokens[ahead].kind == 'num':
+                break
+            field = _FIELDS.get(tokens[ahead].key)
+            if field and ahead not in self.consumed:
+                self.consumed.add(ahead)
+                return field
+        for behind in range(first - 1, max(-1, first - 1 - _LOOKBEHIND), -1):
+            if tokens[behind].kind == 'num':
+                break
+            field = _FIELDS.get(tokens[behind].key)
+            if field and behind not in self.consumed:
+                return field
+        return None
+
+    def _number(self, index: int):
+        token = self.tokens[index]
+        multiplier = self._multiplier_at(index + 1)
+        modifier, modifier_at = self._modifier_before(index)
+        if self._assign(token.value, token.value * multiplier, multiplier != 1.0,
+                        self._field_for(index, index), modifier):
+            # El modificador siempre fija un mínimo o máximo cuando el número se aplica
+            self.assigned.add(index)
+            if modifier_at is not None:
+                self.assigned.add(modifier_at)
+
+    def _range(self, index: int):
+        """
+        'entre X [mult] y Y [mult]'; si solo Y lleva multiplicador aplica a ambos
+        Los números pueden llevar prefijo de moneda ('entre $50,000 y $100,000')
+        """
+        tokens = self.tokens
+        first = self._skip_currency(index + 1)
+        if first >= len(tokens) or tokens[first].kind != 'num':
+            return
+        position = first + 1
+        mult_first = self._multiplier_at(position)
+        if mult_first != 1.0:
+            position += 1
+        if position + 1 >= len(tokens) or tokens[position].key not in ('y', 'a'):
+            return
+        second = self._skip_currency(position + 1)
+        if second >= len(tokens) or tokens[second].kind != 'num':
+            return
+        mult_second = self._multiplier_at(second + 1)
+        if mult_first == 1.0:
+            mult_first = mult_second
+        low = tokens[first].value * mult_first
+        high = tokens[second].value * mult_second
+        low, high = min(low, high), max(low, high)
+        self.consumed.update((first, second))
+
+        field = self._field_for(index, second)
+        if field is None and low >= 1000:
+            field = FIELD_PRECIO
+        result = self.result
+        if field == FIELD_PRECIO and low >= 1000:
+            result.precio_min, result.precio_max = low, high
+            self.prices.extend((low, high))
+        elif field == FIELD_AREA:
+            result.area_min, result.area_max = low, high
+            self.areas.extend((low, high))
+        elif field == FIELD_HABITACIONES and 1 <= low and high <= 10:
+            result.habitaciones_min, result.habitaciones_max = int(low), int(high)
+        elif field == FIELD_BANOS and 0.5 <= low and high <= 10:
+            result.banos_min, result.banos_max = low, high
+        else:
+            return
+        self.assigned.update((index, first, second))
+
+    def _assign(self, raw: float, value: float, has_multiplier: bool, field: Optional[str],
+                modifier: Optional[str]) -> bool:
+        """Aplica el número a su filtro; False si no se usó"""
+        result = self.result
+        if field == FIELD_HABITACIONES:
+            if not 1 <= raw <= 10:
+                return False
+            if modifier == MODIFIER_MAX:
+                result.habitaciones_max = int(raw)
+            elif modifier == MODIFIER_MIN:
+                result.habitaciones_min = int(raw)
+            else:
+                result.habitaciones = int(raw)
+            return True
+        if field == FIELD_BANOS:
+            if not 0.5 <= raw <= 10:
+                return False
+            if modifier == MODIFIER_MAX:
+                result.banos_max = float(raw)
+            elif modifier == MODIFIER_MIN:
+                result.banos_min = float(raw)
+            else:
+                result.banos = float(raw)
+            return True
+        if field == FIELD_AREA:
+            if not 20 <= value <= 2000:
+                return False
+            self.areas.append(value)
+            if modifier == MODIFIER_MAX:
+                result.area_max = value
+            elif modifier == MODIFIER_MIN:
+                result.area_min = value
+            else:
+                result.area_exacta = value
+                result.area_tolerancia = 0.05
+            return True
+
+        # Precio: palabra de precio, multiplicador, modificador o un número grande suelto
+        is_price = field == FIELD_PRECIO or has_multiplier or modifier is not None or value >= 50000
+        if not is_price or value < 1000:
+            return False
+        self.prices.append(value)
+        if modifier == MODIFIER_MAX:
+            result.precio_max = value
+        elif modifier == MODIFIER_MIN:
+            result.precio_min = value
+        elif result.precio_min is None and result.precio_max is None and result.precio_exacto is None:
+            result.precio_exacto = value
+            result.precio_tolerancia = 0.05 if field == FIELD_PRECIO else 0.10
+        else:
+            # Un segundo precio suelto no reemplaza el filtro (sí cuenta para el boost)
+            return False
+        return True
+
+    # ==================== UBICACIÓN Y RESULTADO ====================
+
+    def _finish(self) -> QueryFilters:
+        result = self.result
+        for tipo in _TYPE_PRIORITY:
+            if tipo in self.types:
+                result.tipo = tipo
+                break
+        # Una ubicación con nombre es más específica que la zona
+        located = self.places[0] if self.places else (self.zones[0] if self.zones else None)
+        if located is not None:
+            result.ubicacion_incluye = located.name
+            result.ubicacion_id = located.id
+        result.locations = tuple(entry.name for entry in self.zones + self.places)
+        result.location_ids = tuple(entry.id for entry in self.zones + self.places)
+        result.numbers = tuple(t.value for t in self.tokens if t.kind == 'num')
+        result.prices = tuple(self.prices)
+        result.areas = tuple(self.areas)
+        result.keywords = tuple(
+            t.text for t in self.tokens
+            if len(t.text) > 2 and t.text not in STOP_WORDS and (t.kind == 'word' or t.text.isdigit())
+        )
+        self._coverage()
+        return result
+
+    def _coverage(self):
+        """
+        Palabras con contenido cubiertas por los filtros: números aplicados, el tipo y la
+        ubicación elegidos y las palabras de campo con su filtro definido. Los modificadores
+        ('menos de', 'al menos') y 'entre' solo cuentan si fijaron un mínimo o máximo. Otra
+        ubicación u otro tipo (disyunciones) y las palabras desconocidas quedan sin cubrir
+        """
+        result = self.result
+        covered = set(self.assigned)
+        covered.update(index for index, tipo in self.type_at.items() if tipo == result.tipo)
+        for start, (entry, length) in self.locations_at.items():
+            if entry.id == result.ubicacion_id:
+                covered.update(range(start, start + length))
+        in_location = {i for start, (_, length) in self.locations_at.items() for i in range(start, start + length)}
+
+        content = 0
+        uncovered = []
+        for index, token in enumerate(self.tokens):
+            if token.kind == 'word' and token.key in _NEUTRAL_WORDS and index not in in_location:
+                continue
+            content += 1
+            if index in covered:
+                continue
+            field = _FIELDS.get(token.key) if token.kind == 'word' else None
+            if field and any(getattr(result, name) is not None for name in _FIELD_FILTERS[field]):
+                continue
+            uncovered.append(token.text)
+        result.uncovered = tuple(uncovered)
+        result.coverage = round((content - len(uncovered)) / content, 3) if content else 0.0
+
+
+def normalize_query(query: str) -> str:
+    """Llave de memoización: minúsculas y espacios colapsados"""
+    return ' '.join(query.lower().split())
+
+
+@lru_cache(maxsize=int(os.getenv('QUERY_PARSER_CACHE_SIZE', 1024)))
+def _parse_normalized(text: str) -> QueryFilters:
+    return _Parser(text).parse()
+
+
+def parse_query(query: Optional[str]) -> QueryFilters:
+    """Filtros de la consulta; memoizado por consulta normalizada"""
+    return _parse_normalized(normalize_query(query or ''))
+
+
+def parser_cache_stats() -> dict:
+    info = _parse_normalized.cache_info()
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize
+    }
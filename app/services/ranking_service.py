@@ -0,0 +1,122 @@
+"""
+Motor de ranking de la búsqueda de propiedades
+Combina señales por candidato (filtros exactos, BM25, boost, orden semántico) en un
+arreglo de puntajes paralelo a la lista, sin modificar los registros, y elige el top-k
+"""
+import os
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_EXACT = 'exact'
+SIGNAL_TEXT = 'text'
+SIGNAL_BOOST = 'boost'
+SIGNAL_SEMANTIC = 'semantic'
+
+# El boost va en puntos (8-15 por característica); el resto de señales está en [0, 1]
+# y con estos pesos solo desempata candidatos con el mismo boost
+DEFAULT_RANKING_WEIGHTS = {
+    SIGNAL_BOOST: 1.0,
+    SIGNAL_EXACT: 0.5,
+    SIGNAL_SEMANTIC: 0.5,
+    SIGNAL_TEXT: 0.5
+}
+
+
+def ranking_weights() -> Dict[str, float]:
+    """Pesos por señal; RANKING_WEIGHTS="semantic=5,text=2" los ajusta"""
+    weights = dict(DEFAULT_RANKING_WEIGHTS)
+    for entry in os.getenv('RANKING_WEIGHTS', '').split(','):
+        if '=' in entry:
+            signal, value = (part.strip() for part in entry.split('=', 1))
+            try:
+                weights[signal] = float(value)
+            except ValueError:
+                logger.warning(f"Peso de ranking inválido para '{signal}': {value}")
+    return weights
+
+
+def membership_signal(candidates: Sequence[dict], members: Sequence[dict]) -> np.ndarray:
+    """1.0 para los candidatos presentes en `members` (por identidad del registro)"""
+    member_ids = {id(prop) for prop in members}
+    return np.fromiter((id(prop) in member_ids for prop in candidates), dtype=np.float64, count=len(candidates))
+
+
+def order_signal(candidates: Sequence[dict], ordered: Sequence[dict]) -> np.ndarray:
+    """Posición en una lista ordenada por relevancia: 1.0 la primera, decreciente, 0 si no aparece"""
+    if not ordered:
+        return np.zeros(len(candidates))
+    step = 1.0 / len(ordered)
+    rank = {}
+    for position, prop in enumerate(ordered):
+        rank.setdefault(id(prop), 1.0 - position * step)
+    return np.fromiter((rank.get(id(prop), 0.0) for prop in candidates), dtype=np.float64, count=len(candidates))
+
+
+def score_signal(candidates: Sequence[dict], scored: Sequence[Tuple[dict, float]]) -> np.ndarray:
+    """Puntajes (p. ej. BM25) normalizados al máximo, 0 si el candidato no tiene"""
+    top = max((score for _, score in scored), default=0.0)
+    if top <= 0:
+        return np.zeros(len(candidates))
+    by_id = {id(prop): score / top for prop, score in scored}
+    return np.fromiter((by_id.get(id(prop), 0.0) for prop in candidates), dtype=np.float64, count=len(candidates))
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Índices de los k mayores puntajes, de mayor a menor, con empates por posición
+    Selección con argpartition: O(n) más el orden de los k elegidos
+    """
+    size = len(scores)
+    if k <= 0 or size == 0:
+        return np.zeros(0, dtype=np.intp)
+    if k < size:
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        rows = np.concatenate([above, ties])
+    else:
+        rows = np.arange(size)
+    return rows[np.lexsort((rows, -scores[rows]))]
+
+
+class RankedPage:
+    """Página de resultados: registros elegidos, sus puntajes y si hubo boost"""
+
+    def __init__(self, properties: List[dict], scores: List[float], total: int, boost_applied: bool):
+        self.properties = properties
+        self.scores = scores
+        self.total = total
+        self.boost_applied = boost_applied
+
+
+class RankingEngine:
+    """Puntaje = Σ peso · señal; los registros de origen nunca se modifican"""
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = weights if weights is not None else ranking_weights()
+
+    def score(self, size: int, signals: Dict[str, np.ndarray]) -> np.ndarray:
+        scores = np.zeros(size, dtype=np.float64)
+        for signal, values in signals.items():
+            weight = self.weights.get(signal, 0.0)
+            if weight and values is not None:
+                scores += weight * values
+        return scores
+
+    def rank(self, candidates: List[dict], signals: Dict[str, np.ndarray], k: int) -> RankedPage:
+        scores = self.score(len(candidates), signals)
+        rows = top_k(scores, k)
+        boost = signals.get(SIGNAL_BOOST)
+        return RankedPage(
+            properties=[candidates[row] for row in rows],
+            scores=[round(float(scores[row]), 4) for row in rows],
+            total=len(candidates),
+            boost_applied=boost is not None and bool((boost > 0).any())
+        )
+
+    def get_stats(self) -> dict:
+        return {'weights': dict(self.weights)}
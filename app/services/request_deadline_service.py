@@ -0,0 +1,149 @@
+"""
+Deadline por petición: presupuesto de tiempo total que se propaga a las llamadas
+al LLM (timeouts con el tiempo restante, sin reintentos fuera de presupuesto) y a la BD
+"""
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Header opcional del cliente con el presupuesto en segundos (p. ej. "X-Request-Timeout: 8")
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+# Presupuesto por ruta si el cliente no envía el header (segundos)
+DEFAULT_ROUTE_DEADLINES = {
+    'search_real_state': 20.0,
+    'search_ia': 45.0,
+    'ask_ai': 45.0,
+    'generate_sql': 30.0
+}
+
+_request_deadline: ContextVar[Optional['Deadline']] = ContextVar('request_deadline', default=None)
+
+
+def min_stage_seconds() -> float:
+    """Tiempo mínimo restante para que valga la pena iniciar una etapa (llamada LLM, query)"""
+    return float(os.getenv('REQUEST_DEADLINE_MIN_STAGE', 0.5))
+
+
+class Deadline:
+    """Instante límite de una petición y etapas que quedaron incompletas por falta de tiempo"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget
+        self.cut_stages: List[str] = []
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, seconds: float) -> bool:
+        """True si quedan al menos `seconds` de presupuesto"""
+        return self.remaining() >= seconds
+
+    def timeout(self, default: float) -> float:
+        """Timeout para una operación: el menor entre el suyo y el tiempo restante"""
+        return min(default, self.remaining())
+
+    def mark_partial(self, stage: str):
+        """Registra una etapa omitida o cortada por el deadline"""
+        if stage not in self.cut_stages:
+            self.cut_stages.append(stage)
+            logger.warning(f"Deadline de la petición: etapa '{stage}' incompleta")
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.cut_stages)
+
+    def to_metadata(self) -> dict:
+        """Resumen para el metadata de la respuesta"""
+        return {
+            'budget_s': self.budget,
+            'elapsed_s': round(time.monotonic() - self.started, 3),
+            'partial': self.partial,
+            'cut_stages': list(self.cut_stages)
+        }
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """
+    Fija el deadline de las llamadas hechas dentro del bloque
+    Un deadline anidado nunca extiende al exterior: se conserva el más estricto
+    """
+    current = _request_deadline.get()
+    if current is not None and current.remaining() <= seconds:
+        yield current
+        return
+    deadline = Deadline(seconds)
+    token = _request_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _request_deadline.reset(token)
+
+
+@contextmanager
+def without_deadline():
+    """Ejecuta el bloque sin deadline (trabajo compartido entre varias peticiones)"""
+    token = _request_deadline.set(None)
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline del contexto actual (None fuera de una petición)"""
+    return _request_deadline.get()
+
+
+def remaining_time() -> Optional[float]:
+    """Segundos restantes del deadline actual; None si no hay deadline"""
+    deadline = _request_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def timeout_for(default: float) -> float:
+    """Timeout para una operación acotado por el deadline actual"""
+    deadline = _request_deadline.get()
+    return deadline.timeout(default) if deadline is not None else default
+
+
+def route_deadlines() -> Dict[str, float]:
+    """Presupuestos por ruta; REQUEST_DEADLINES="search_real_state=15,generate_sql=20" los ajusta"""
+    deadlines = dict(DEFAULT_ROUTE_DEADLINES)
+    for entry in os.getenv('REQUEST_DEADLINES', '').split(','):
+        if '=' in entry:
+            route, value = (part.strip() for part in entry.split('=', 1))
+            try:
+                deadlines[route] = float(value)
+            except ValueError:
+                logger.warning(f"Deadline inválido para '{route}': {value}")
+    return deadlines
+
+
+def route_deadline(route: str, headers: Optional[Mapping[str, str]] = None) -> float:
+    """
+    Presupuesto de una petición: el header X-Request-Timeout si es válido,
+    si no el de la ruta; nunca mayor que REQUEST_DEADLINE_MAX
+    """
+    max_deadline = float(os.getenv('REQUEST_DEADLINE_MAX', 120))
+    budget = route_deadlines().get(route, float(os.getenv('REQUEST_DEADLINE_DEFAULT', 30)))
+    value = headers.get(DEADLINE_HEADER) if headers is not None else None
+    if value:
+        try:
+            requested = float(value)
+            if requested > 0:
+                budget = requested
+        except ValueError:
+            logger.warning(f"Header {DEADLINE_HEADER} inválido: {value}")
+    return min(budget, max_deadline)
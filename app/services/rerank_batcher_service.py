@@ -0,0 +1,210 @@
+"""
+Micro-batching de re-ranking semántico
+Agrupa peticiones concurrentes de ai_semantic_search en una sola llamada al LLM
+"""
+import os
+import asyncio
+import logging
+import weakref
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from .prompt_encoding_service import COMPACT_HEADER, EncodedCandidates, estimate_tokens
+from .model_policy_service import TASK_RERANK
+from .structured_output_service import batch_rerank_schema
+from .request_deadline_service import without_deadline
+from .llm_metrics_service import current_usage, llm_usage
+
+logger = logging.getLogger(__name__)
+
+BATCH_SYSTEM_PROMPT = (
+    "Eres un experto en bienes raíces. Respondes ÚNICAMENTE con un objeto JSON "
+    "que asigna a cada id de consulta su lista de IDs de propiedades."
+)
+
+RerankResult = Tuple[Optional[list], dict]
+
+# Resultado de un lote de una sola petición: el llamador usa el prompt individual en su propio contexto
+_RUN_ALONE = object()
+
+
+class _RerankRequest:
+    """Petición en espera dentro de un lote"""
+
+    def __init__(self, query: str, encoded: EncodedCandidates, future: asyncio.Future):
+        self.query = query
+        self.encoded = encoded
+        self.future = future
+        # Resumen LLM de la petición, para prorratear el costo del lote
+        self.usage = current_usage()
+
+
+class _PendingBatch:
+    """Lote abierto de un event loop"""
+
+    def __init__(self):
+        self.requests: List[_RerankRequest] = []
+        self.tokens = 0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+
+class RerankBatcher:
+    """
+    Junta durante unos milisegundos las peticiones de re-ranking concurrentes y las
+    envía en un solo prompt estructurado: tabla de candidatos compartida, lista de
+    candidatos por consulta y respuesta JSON por id de consulta
+    Un lote de una sola petición usa el prompt individual (single_rerank)
+    """
+
+    def __init__(self, ollama_client, single_rerank: Callable[[str, EncodedCandidates], Awaitable[RerankResult]],
+                 enabled: Optional[bool] = None):
+        self.ollama_client = ollama_client
+        self.single_rerank = single_rerank
+        if enabled is None:
+            enabled = os.getenv('RERANK_BATCH_ENABLED', 'false').lower() == 'true'
+        self.enabled = enabled
+        self.window_seconds = float(os.getenv('RERANK_BATCH_WINDOW_MS', 15)) / 1000
+        self.max_batch_size = int(os.getenv('RERANK_BATCH_MAX_SIZE', 8))
+        self.token_budget = int(os.getenv('RERANK_BATCH_TOKEN_BUDGET', 6000))
+        # Un lote abierto por event loop; las futures no cruzan loops
+        self._pending = weakref.WeakKeyDictionary()
+        self._tasks = set()
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'batched_requests': 0,
+            'single_calls': 0,
+            'parse_failures': 0
+        }
+
+    async def rank(self, query: str, encoded: EncodedCandidates) -> RerankResult:
+        """Encola la petición y espera su parte del resultado del lote"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request = _RerankRequest(query, encoded, future)
+        self._stats['requests'] += 1
+
+        batch = self._pending.get(loop)
+        if batch is not None and batch.tokens + encoded.tokens > self.token_budget:
+            # No cabe en el lote abierto: enviarlo ya y abrir uno nuevo
+            self._flush(loop)
+            batch = None
+        if batch is None:
+            batch = _PendingBatch()
+            self._pending[loop] = batch
+            batch.flush_handle = loop.call_later(self.window_seconds, self._flush, loop)
+
+        batch.requests.append(request)
+        batch.tokens += encoded.tokens
+        if len(batch.requests) >= self.max_batch_size:
+            self._flush(loop)
+
+        result = await future
+        if result is _RUN_ALONE:
+            # Deadline y métricas del llamador, no los de quien disparó el flush
+            return await self.single_rerank(query, encoded)
+        return result
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        """Cierra el lote abierto del loop y lanza su llamada"""
+        batch = self._pending.pop(loop, None)
+        if batch is None:
+            return
+        if batch.flush_handle is not None:
+            batch.flush_handle.cancel()
+        task = loop.create_task(self._run_batch(batch.requests))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, requests: List[_RerankRequest]):
+        """Ejecuta el lote y reparte los resultados a cada petición"""
+        # Los llamadores cancelados (cliente desconectado) no entran en el prompt
+        requests = [r for r in requests if not r.future.done()]
+        if not requests:
+            return
+
+        try:
+            if len(requests) == 1:
+                self._stats['single_calls'] += 1
+                self._resolve(requests[0], _RUN_ALONE)
+                return
+
+            self._stats['batches'] += 1
+            self._stats['batched_requests'] += len(requests)
+            prompt, query_ids = self._build_batch_prompt(requests)
+            info = {
+                'batch_size': len(requests),
+                'prompt_tokens': estimate_tokens(prompt) + estimate_tokens(BATCH_SYSTEM_PROMPT)
+            }
+            logger.info(f"Re-ranking en lote de {len(requests)} consultas (~{info['prompt_tokens']} tokens)")
+
+            model = self.ollama_client.model_policy.model_for(TASK_RERANK)
+            # El lote es compartido: no lo corta el deadline de una sola petición,
+            # cada llamador espera su resultado acotado por su propio deadline
+            with without_deadline(), llm_usage() as batch_usage:
+                ranked, error = await self.ollama_client.ask_ai_structured(
+                    prompt, BATCH_SYSTEM_PROMPT, batch_rerank_schema(query_ids), model=model)
+            for request in requests:
+                if request.usage is not None:
+                    for call in batch_usage.calls:
+                        request.usage.add(call, share=len(requests))
+            if ranked is None:
+                logger.warning(f"Re-ranking por lotes sin resultado válido: {error}")
+                self._stats['parse_failures'] += 1
+
+            for query_id, request in zip(query_ids, requests):
+                ids = None
+                if ranked is not None:
+                    # Solo se aceptan IDs que eran candidatos de esa consulta
+                    allowed = set(request.encoded.ids)
+                    ids = [prop_id for prop_id in ranked[query_id] if prop_id in allowed][:10]
+                self._resolve(request, (ids, dict(info)))
+        except Exception as e:
+            logger.error(f"Error en re-ranking por lotes: {e}")
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    @staticmethod
+    def _resolve(request: _RerankRequest, result: RerankResult):
+        if not request.future.done():
+            request.future.set_result(result)
+
+    @staticmethod
+    def _build_batch_prompt(requests: List[_RerankRequest]) -> Tuple[str, List[str]]:
+        """Prompt con la tabla de candidatos sin duplicados y las consultas con sus candidatos"""
+        rows: Dict = {}
+        for request in requests:
+            for prop_id, row in zip(request.encoded.ids, request.encoded.rows):
+                rows.setdefault(prop_id, row)
+
+        query_ids = [f"q{index + 1}" for index in range(len(requests))]
+        query_lines = []
+        for query_id, request in zip(query_ids, requests):
+            if len(request.encoded.ids) == len(rows):
+                candidates = "todas"
+            else:
+                candidates = ','.join(str(prop_id) for prop_id in request.encoded.ids)
+            query_lines.append(f'{query_id}: "{request.query}" | candidatas: {candidates}')
+
+        table = '\n'.join([COMPACT_HEADER] + list(rows.values()))
+        consultas = '\n'.join(query_lines)
+        example = ', '.join(f'"{query_id}": [1, 5, 3]' for query_id in query_ids[:2])
+        prompt = f"""Propiedades, una por línea (precio_q en quetzales, hab=habitaciones, ban=baños, m2=área, claves=términos de la descripción):
+{table}
+
+Consultas (cada una solo puede elegir entre sus candidatas):
+{consultas}
+
+Para cada consulta evalúa relevancia directa, características específicas (precio, habitaciones, ubicación), tipo de propiedad y descripción.
+Responde ÚNICAMENTE con un objeto JSON con los IDs más relevantes de cada consulta ordenados por relevancia (máximo 10 por consulta). Formato: {{{example}}}"""
+        return prompt, query_ids
+
+    def get_stats(self) -> dict:
+        """Estadísticas del micro-batching"""
+        stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['window_ms'] = round(self.window_seconds * 1000)
+        stats['max_batch_size'] = self.max_batch_size
+        batches = stats['batches']
+        stats['avg_batch_size'] = round(stats['batched_requests'] / batches, 2) if batches else None
+        stats['upstream_calls_saved'] = stats['batched_requests'] - batches
+        return stats
@@ -0,0 +1,70 @@
+"""
+Coalescencia de llamadas idénticas en vuelo (single-flight)
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _InflightCall:
+    """Llamada upstream compartida y cantidad de llamadores esperándola"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Las llamadas concurrentes con la misma llave esperan una sola tarea upstream
+    Cancelar a un llamador no cancela la tarea mientras queden otros esperando;
+    si se van todos, la tarea upstream se cancela
+    """
+
+    def __init__(self):
+        # Llave: (id del event loop, llave de la llamada); las tareas no cruzan loops
+        self._calls: Dict[Tuple[int, Hashable], _InflightCall] = {}
+        self._stats = {
+            'leaders': 0,
+            'coalesced': 0,
+            'cancelled_upstream': 0
+        }
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta factory() una sola vez por llave entre llamadas concurrentes"""
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+
+        call = self._calls.get(call_key)
+        if call is None:
+            call = _InflightCall(loop.create_task(factory()))
+            self._calls[call_key] = call
+            call.task.add_done_callback(lambda _task, c=call: self._forget(call_key, c))
+            self._stats['leaders'] += 1
+        else:
+            self._stats['coalesced'] += 1
+            logger.debug(f"Llamada LLM coalescida con una en vuelo ({call.waiters} esperando)")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nadie más espera el resultado: detener la llamada upstream
+                self._forget(call_key, call)
+                call.task.cancel()
+                self._stats['cancelled_upstream'] += 1
+
+    def _forget(self, call_key: Tuple[int, Hashable], call: _InflightCall):
+        """Quita la llamada del mapa si sigue siendo la registrada para la llave"""
+        if self._calls.get(call_key) is call:
+            del self._calls[call_key]
+
+    def get_stats(self) -> dict:
+        """Estadísticas de coalescencia"""
+        stats = dict(self._stats)
+        stats['in_flight'] = len(self._calls)
+        return stats
@@ -0,0 +1,182 @@
+"""
+Compilador determinista de QueryFilters a SQL parametrizado
+Cada filtro se traduce a un predicado indexable (igualdad o rango sobre la columna, sin
+funciones) y los valores van como parámetros. La confianza es la cobertura del parser:
+con confianza alta la consulta se resuelve sin generar SQL con el LLM
+"""
+import os
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .gazetteer_service import default_gazetteer, normalize_location_text
+from .query_parser_service import QueryFilters, parse_query
+
+logger = logging.getLogger(__name__)
+
+SQL_SOURCE_COMPILED = 'compiled'
+SQL_SOURCE_LLM = 'llm'
+
+# Misma tolerancia que _matches_strict_filters para baños
+BANOS_TOLERANCE = 0.01
+
+# Separador entre palabras de una ubicación en REGEXP ('zona 10', 'Zona-10')
+_REGEXP_SEPARATOR = '[^0-9a-z]+'
+
+
+class CompiledQuery:
+    """SQL con placeholders (%s de mysql-connector), sus parámetros y la confianza de la traducción"""
+
+    def __init__(self, sql: str, params: Tuple, confidence: float, uncovered: Tuple[str, ...] = (),
+                 location_id: Optional[str] = None, limit: Optional[int] = None):
+        self.sql = sql
+        self.params = params
+        self.confidence = confidence
+        self.uncovered = uncovered
+        self.location_id = location_id
+        self.limit = limit
+
+    def refine(self, rows: List[Dict]) -> List[Dict]:
+        """
+        LIKE no respeta límites de palabra ('%villa nueva%' también trae 'villa nuevas'):
+        se dejan solo las filas cuya ubicación menciona el id canónico y luego se aplica el límite
+        (con ubicación el SQL trae más filas que el límite para que el descarte no deje la página corta)
+        """
+        if self.location_id is not None:
+            gazetteer = default_gazetteer()
+            rows = [row for row in rows if self.location_id in gazetteer.location_ids(row.get('ubicacion') or '')]
+        return rows[:self.limit] if self.limit is not None else rows
+
+    def __repr__(self) -> str:
+        return f"CompiledQuery({self.sql!r}, {self.params}, confidence={self.confidence})"
+
+
+class SQLCompiler:
+    """
+    Traduce QueryFilters a un SELECT sobre propiedades
+    - tipo, habitaciones: igualdad; precio, habitaciones, baños, área: BETWEEN / >= / <=
+    - ubicación: nombre y alias del gazetteer; los que terminan en número ('zona 1') con REGEXP
+      anclado para no traer 'zona 10', el resto con LIKE (la colación _ci ignora mayúsculas y tildes)
+    plan() retorna None si la consulta no quedó cubierta: entonces el SQL lo genera el LLM
+    """
+
+    def __init__(self, min_confidence: Optional[float] = None, limit: Optional[int] = None):
+        self.min_confidence = min_confidence if min_confidence is not None else float(
+            os.getenv('SQL_COMPILER_MIN_CONFIDENCE', 0.8))
+        self.limit = limit if limit is not None else int(os.getenv('SQL_COMPILER_LIMIT', 50))
+        # Factor de filas extra que se piden cuando hay que revisar la ubicación con el gazetteer
+        self.overfetch = max(1, int(os.getenv('SQL_COMPILER_OVERFETCH', 4)))
+        self._lock = threading.Lock()
+        self._compiled = 0
+        self._fallbacks = 0
+
+    def compile(self, filters: QueryFilters) -> CompiledQuery:
+        """SQL parametrizado de los filtros; la confianza es 0 si no hay ningún filtro"""
+        where: List[str] = []
+        params: List = []
+
+        if filters.tipo is not None:
+            where.append("tipo = %s")
+            params.append(filters.tipo)
+
+        if filters.precio_exacto is not None:
+            tolerance = filters.precio_tolerancia if filters.precio_tolerancia is not None else 0.05
+            where.append("precio BETWEEN %s AND %s")
+            params.extend((filters.precio_exacto * (1 - tolerance), filters.precio_exacto * (1 + tolerance)))
+        self._range(where, params, 'precio', filters.precio_min, filters.precio_max)
+
+        if filters.habitaciones is not None:
+            where.append("habitaciones = %s")
+            params.append(filters.habitaciones)
+        self._range(where, params, 'habitaciones', filters.habitaciones_min, filters.habitaciones_max)
+        if filters.banos is not None:
+            where.append("banos BETWEEN %s AND %s")
+            params.extend((filters.banos - BANOS_TOLERANCE, filters.banos + BANOS_TOLERANCE))
+        self._range(where, params, 'banos', filters.banos_min, filters.banos_max)
+
+        if filters.area_exacta is not None:
+            tolerance = filters.area_tolerancia if filters.area_tolerancia is not None else 0.05
+            where.append("area_m2 BETWEEN %s AND %s")
+            params.extend((filters.area_exacta * (1 - tolerance), filters.area_exacta * (1 + tolerance)))
+        self._range(where, params, 'area_m2', filters.area_min, filters.area_max)
+
+        location_id = None
+        if filters.ubicacion_id is not None:
+            patterns = self._location_patterns(filters.ubicacion_id)
+            if patterns:
+                location_id = filters.ubicacion_id
+                clauses = []
+                for pattern in patterns:
+                    if pattern[-1].isdigit():
+                        clauses.append("ubicacion REGEXP %s")
+                        params.append(self.location_regexp(pattern))
+                    else:
+                        clauses.append("ubicacion LIKE %s")
+                        params.append(f"%{pattern}%")
+                where.append('(' + ' OR '.join(clauses) + ')')
+
+        sql = "SELECT * FROM propiedades"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY fecha_publicacion DESC LIMIT %s;"
+        params.append(self.limit * self.overfetch if location_id is not None else self.limit)
+
+        confidence = filters.coverage if filters else 0.0
+        return CompiledQuery(sql, tuple(params), confidence, filters.uncovered, location_id, self.limit)
+
+    def plan(self, user_query: str) -> Optional[CompiledQuery]:
+        """SQL compilado si la consulta quedó cubierta (confianza >= mínimo); None si se necesita el LLM"""
+        compiled = self.compile(parse_query(user_query))
+        covered = compiled.confidence >= self.min_confidence
+        with self._lock:
+            if covered:
+                self._compiled += 1
+            else:
+                self._fallbacks += 1
+        if not covered:
+            logger.info(f"SQL compilado con confianza {compiled.confidence} para '{user_query}' "
+                        f"(sin cubrir: {', '.join(compiled.uncovered) or '-'}): se usa el LLM")
+            return None
+        logger.info(f"SQL compilado para '{user_query}' (confianza {compiled.confidence}): {compiled.sql}")
+        return compiled
+
+    @staticmethod
+    def _range(where: List[str], params: List, column: str, low: Optional[float], high: Optional[float]):
+        if low is not None and high is not None:
+            where.append(f"{column} BETWEEN %s AND %s")
+            params.extend((low, high))
+        elif low is not None:
+            where.append(f"{column} >= %s")
+            params.append(low)
+        elif high is not None:
+            where.append(f"{column} <= %s")
+            params.append(high)
+
+    @staticmethod
+    def location_regexp(pattern: str) -> str:
+        """REGEXP de un alias terminado en número, con límites: 'zona 1' no coincide en 'Zona 10'"""
+        return '(^|[^0-9a-z])' + _REGEXP_SEPARATOR.join(pattern.split()) + '([^0-9]|$)'
+
+    @staticmethod
+    def _location_patterns(location_id: str) -> List[str]:
+        """Nombre y alias sin duplicados; se omiten los que contienen a otro sin número (ya los cubre su LIKE)"""
+        entry = default_gazetteer().get(location_id)
+        if entry is None:
+            return []
+        names = []
+        for name in (entry.name,) + entry.aliases:
+            normalized = normalize_location_text(name)[0]
+            if normalized and normalized not in names:
+                names.append(normalized)
+        return [name for name in names
+                if not any(other != name and other in name and not other[-1].isdigit() for other in names)]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'compiled': self._compiled,
+                'llm_fallbacks': self._fallbacks,
+                'min_confidence': self.min_confidence,
+                'limit': self.limit,
+                'overfetch': self.overfetch
+            }
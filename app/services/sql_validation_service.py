@@ -1,24 +1,84 @@
 """
 Servicio para generación y validación de SQL
 """
+import os
 import re
 import json
+import time
 import logging
+import threading
+from collections import OrderedDict
 from typing import Dict, Optional
 from .ollama_client_service import OllamaClient
+from .model_policy_service import TASK_SQL, TASK_VALIDATION
+from .structured_output_service import ERROR_NO_RESPONSE, VALIDATION_SCHEMA
+from .llm_metrics_service import llm_task, METRIC_SQL_GENERATION, METRIC_VALIDATION
 
 logger = logging.getLogger(__name__)
 
 class SQLService:
     def __init__(self, ollama_client: OllamaClient):
         self.ollama_client = ollama_client
+        # Cache LRU de SQL generado por consulta normalizada
+        self._sql_cache = OrderedDict()
+        self._sql_cache_lock = threading.Lock()
+        self.sql_cache_size = int(os.getenv('SQL_CACHE_SIZE', 256))
+        self.sql_cache_ttl = int(os.getenv('SQL_CACHE_TTL', 3600))
 
     def generate_sql(self, user_query: str) -> Dict[str, any]:
+        """
+        Wrapper síncrono de generate_sql_async para scripts y código sin event loop
+        """
+        return self.ollama_client.run_sync(self.generate_sql_async(user_query))
+
+    async def generate_sql_async(self, user_query: str) -> Dict[str, any]:
         """
         Genera SQL usando IA basado en consulta de usuario
         """
+        cached = self.get_cached_sql(user_query)
+        if cached:
+            return cached
+
         try:
-            prompt = f"""
+            prompt = self._build_sql_prompt(user_query)
+            policy = self.ollama_client.model_policy
+            model = policy.model_for(TASK_SQL, user_query)
+            with llm_task(METRIC_SQL_GENERATION):
+                sql_response = await self.ollama_client.call_ollama_async(prompt, use_sql_system_prompt=True, model=model)
+                
+                if sql_response and policy.is_small(model) and not self.validate_sql(self.clean_sql(sql_response)):
+                    # El modelo pequeño no produjo un SELECT válido: reintentar con el grande
+                    model = policy.escalate(TASK_SQL, "SQL inválido del modelo pequeño")
+                    sql_response = await self.ollama_client.call_ollama_async(prompt, use_sql_system_prompt=True, model=model)
+            
+            if sql_response:
+                clean_sql = self.clean_sql(sql_response)
+                result = {
+                    'success': True,
+                    'sql': clean_sql,
+                    'original_response': sql_response,
+                    'model': model or self.ollama_client.model
+                }
+                self.cache_sql(user_query, result)
+                return result
+            else:
+                return {
+                    'success': False,
+                    'error': 'No se pudo generar SQL',
+                    'sql': None
+                }
+                
+        except Exception as e:
+            logger.error(f"Error generando SQL: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'sql': None
+            }
+
+    def _build_sql_prompt(self, user_query: str) -> str:
+        """Prompt de generación de SQL para la tabla propiedades"""
+        return f"""
             Genera una consulta SQL para buscar propiedades inmobiliarias basada en esta consulta: "{user_query}"
 
             Esquema de la tabla:
@@ -46,29 +106,45 @@ class SQLService:
 
             Responde SOLO con la query SQL, sin explicaciones.
             """
-            
-            sql_response = self.ollama_client.call_ollama(prompt, use_sql_system_prompt=True)
-            
-            if sql_response:
-                clean_sql = self.clean_sql(sql_response)
-                return {
-                    'success': True,
-                    'sql': clean_sql,
-                    'original_response': sql_response
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': 'No se pudo generar SQL',
-                    'sql': None
-                }
-                
-        except Exception as e:
-            logger.error(f"Error generando SQL: {e}")
+
+    @staticmethod
+    def _cache_key(user_query: str) -> str:
+        """Normaliza la consulta para usarla como llave de cache"""
+        return ' '.join((user_query or '').lower().split())
+
+    def get_cached_sql(self, user_query: str) -> Optional[Dict[str, any]]:
+        """Retorna el resultado cacheado para la consulta si existe y no venció"""
+        key = self._cache_key(user_query)
+        with self._sql_cache_lock:
+            entry = self._sql_cache.get(key)
+            if not entry:
+                return None
+            stored_at, result = entry
+            if self.sql_cache_ttl > 0 and time.time() - stored_at > self.sql_cache_ttl:
+                del self._sql_cache[key]
+                return None
+            self._sql_cache.move_to_end(key)
+        logger.info(f"SQL obtenido de cache para '{user_query}'")
+        return dict(result, cached=True)
+
+    def cache_sql(self, user_query: str, result: Dict[str, any]):
+        """Guarda un resultado exitoso de generación de SQL (solo si pasa la validación básica)"""
+        if not result.get('success') or not self.validate_sql(result.get('sql')):
+            return
+        key = self._cache_key(user_query)
+        with self._sql_cache_lock:
+            self._sql_cache[key] = (time.time(), result)
+            self._sql_cache.move_to_end(key)
+            while len(self._sql_cache) > self.sql_cache_size:
+                self._sql_cache.popitem(last=False)
+
+    def get_cache_stats(self) -> dict:
+        """Estado del cache de SQL"""
+        with self._sql_cache_lock:
             return {
-                'success': False,
-                'error': str(e),
-                'sql': None
+                'size': len(self._sql_cache),
+                'max_size': self.sql_cache_size,
+                'ttl_seconds': self.sql_cache_ttl
             }
 
     def clean_sql(self, sql: str) -> str:
@@ -174,58 +250,30 @@ class SQLService:
                 imagen_url VARCHAR(500)
             );
             
-            Responde ÚNICAMENTE con un JSON válido en este formato exacto:
-            {{
-                "valid": true/false,
-                "score": 0-100,
-                "issues": ["problema1", "problema2"],
-                "suggestions": ["mejora1", "mejora2"],
-                "security_level": "safe/warning/dangerous"
-            }}
+            Responde ÚNICAMENTE con un JSON con los campos valid (true/false), score (0-100),
+            issues (lista), suggestions (lista) y security_level (safe/warning/dangerous).
             """
             
             system_prompt = "Eres un experto en bases de datos MySQL que analiza consultas SQL. Respondes ÚNICAMENTE en formato JSON válido, sin explicaciones adicionales."
             
-            ai_response = await self.ollama_client.ask_ai_direct(validation_prompt, system_prompt)
+            policy = self.ollama_client.model_policy
+            model = policy.model_for(TASK_VALIDATION)
+            with llm_task(METRIC_VALIDATION):
+                validation_result, error = await self.ollama_client.ask_ai_structured(
+                    validation_prompt, system_prompt, VALIDATION_SCHEMA, model=model)
+                
+                if validation_result is None and error != ERROR_NO_RESPONSE and policy.is_small(model):
+                    # El modelo pequeño no cumplió el esquema ni tras el reintento: usar el grande
+                    model = policy.escalate(TASK_VALIDATION, f"JSON de validación inválido ({error})")
+                    validation_result, error = await self.ollama_client.ask_ai_structured(
+                        validation_prompt, system_prompt, VALIDATION_SCHEMA, model=model)
             
-            if not ai_response or "Error:" in ai_response:
-                logger.warning(f"Error en validación con IA: {ai_response}")
+            if validation_result is None:
+                logger.warning(f"Error en validación con IA: {error}")
                 return self._get_fallback_validation("No se pudo validar con IA")
             
-            try:
-                # Limpiar respuesta de markdown si existe
-                response_clean = ai_response.strip()
-                if response_clean.startswith('```json'):
-                    response_clean = response_clean.replace('```json', '').replace('```', '').strip()
-                elif response_clean.startswith('```'):
-                    response_clean = response_clean.replace('```', '').strip()
-                
-                # Intentar parsear el JSON de respuesta
-                validation_result = json.loads(response_clean)
-                
-                # Validar que tenga los campos requeridos
-                required_fields = ['valid', 'score', 'issues', 'suggestions', 'security_level']
-                for field in required_fields:
-                    if field not in validation_result:
-                        validation_result[field] = self._get_default_validation_value(field)
-                
-                # Asegurar tipos correctos
-                validation_result['valid'] = bool(validation_result.get('valid', False))
-                validation_result['score'] = max(0, min(100, int(validation_result.get('score', 0))))
-                validation_result['issues'] = list(validation_result.get('issues', []))
-                validation_result['suggestions'] = list(validation_result.get('suggestions', []))
-                
-                security_level = validation_result.get('security_level', 'warning')
-                if security_level not in ['safe', 'warning', 'dangerous']:
-                    security_level = 'warning'
-                validation_result['security_level'] = security_level
-                
-                logger.info(f"Validación SQL exitosa: valid={validation_result['valid']}, score={validation_result['score']}")
-                return validation_result
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parseando JSON de IA: {e}, Response: {ai_response[:200]}")
-                return self._get_fallback_validation("Respuesta de IA inválida")
+            logger.info(f"Validación SQL exitosa: valid={validation_result['valid']}, score={validation_result['score']}")
+            return validation_result
                 
         except Exception as e:
             logger.error(f"Error en validate_sql_with_ai: {e}")
@@ -0,0 +1,106 @@
+"""
+Salidas estructuradas del LLM: esquemas JSON para el parámetro `format` de Ollama
+y validación mínima del resultado (sin regex ni limpieza de markdown)
+"""
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RERANK_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'ids': {'type': 'array', 'items': {'type': 'integer'}}
+    },
+    'required': ['ids']
+}
+
+VALIDATION_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'valid': {'type': 'boolean'},
+        'score': {'type': 'integer', 'minimum': 0, 'maximum': 100},
+        'issues': {'type': 'array', 'items': {'type': 'string'}},
+        'suggestions': {'type': 'array', 'items': {'type': 'string'}},
+        'security_level': {'type': 'string', 'enum': ['safe', 'warning', 'dangerous']}
+    },
+    'required': ['valid', 'score', 'issues', 'suggestions', 'security_level']
+}
+
+
+def batch_rerank_schema(query_ids: List[str]) -> dict:
+    """Esquema {id_consulta: [IDs]} para el re-ranking por lotes"""
+    return {
+        'type': 'object',
+        'properties': {
+            query_id: {'type': 'array', 'items': {'type': 'integer'}}
+            for query_id in query_ids
+        },
+        'required': list(query_ids)
+    }
+
+
+# Error de parse_structured/ask_ai_structured cuando el LLM no respondió (no es culpa del modelo)
+ERROR_NO_RESPONSE = 'sin respuesta del LLM'
+
+
+_TYPE_CHECKS = {
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'string': lambda value: isinstance(value, str),
+    'boolean': lambda value: isinstance(value, bool),
+    'integer': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'null': lambda value: value is None
+}
+
+
+def validate_schema(value: Any, schema: dict, path: str = '$') -> List[str]:
+    """
+    Validador mínimo del subconjunto de JSON Schema usado aquí
+    (type, properties, required, items, enum, minimum, maximum)
+    Retorna la lista de errores; vacía si el valor cumple
+    """
+    errors = []
+    expected = schema.get('type')
+    if expected and not _TYPE_CHECKS[expected](value):
+        return [f"{path}: se esperaba {expected}"]
+
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append(f"{path}: valor fuera de {schema['enum']}")
+    if 'minimum' in schema and value < schema['minimum']:
+        errors.append(f"{path}: menor que {schema['minimum']}")
+    if 'maximum' in schema and value > schema['maximum']:
+        errors.append(f"{path}: mayor que {schema['maximum']}")
+
+    if expected == 'object':
+        for key in schema.get('required', []):
+            if key not in value:
+                errors.append(f"{path}.{key}: requerido")
+        for key, sub_schema in schema.get('properties', {}).items():
+            if key in value:
+                errors.extend(validate_schema(value[key], sub_schema, f"{path}.{key}"))
+    elif expected == 'array':
+        item_schema = schema.get('items')
+        if item_schema:
+            for index, item in enumerate(value):
+                errors.extend(validate_schema(item, item_schema, f"{path}[{index}]"))
+    return errors
+
+
+def parse_structured(text: Optional[str], schema: dict) -> Tuple[Optional[Any], Optional[str]]:
+    """
+    Parsea la salida en modo JSON y la valida contra el esquema
+    Retorna (valor, None) si cumple o (None, descripción del error)
+    """
+    if not text:
+        return None, "respuesta vacía"
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError as e:
+        return None, f"JSON inválido: {e}"
+    errors = validate_schema(value, schema)
+    if errors:
+        return None, '; '.join(errors[:5])
+    return value, None
@@ -0,0 +1,191 @@
+"""
+Índice invertido del catálogo con ranking BM25
+Campos tokenizados sin tildes y con peso por campo (BM25F simplificado): el costo de
+una búsqueda depende del largo de las listas de postings, no del tamaño del catálogo
+"""
+import re
+import math
+import heapq
+import threading
+import logging
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from .query_parser_service import fold, STOP_WORDS
+
+logger = logging.getLogger(__name__)
+
+# Peso de cada campo en la frecuencia del término
+FIELD_BOOSTS = {
+    'titulo': 2.0,
+    'tipo': 1.5,
+    'ubicacion': 1.5,
+    'descripcion': 1.0
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r'[^\W_]+')
+# Plurales en -es tras estas consonantes (habitaciones, jardines, locales); el resto solo pierde la -s
+_ES_PLURAL = frozenset('nlrdz')
+
+
+def stem(token: str) -> str:
+    """Singular aproximado para que 'casas' y 'casa' compartan término"""
+    if len(token) > 4 and token.endswith('es') and token[-3] in _ES_PLURAL:
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Términos de un texto: minúsculas, sin tildes, sin stop words y en singular"""
+    return [stem(fold(word)) for word in _WORD_RE.findall(text.lower()) if word not in STOP_WORDS]
+
+
+class _Document:
+    __slots__ = ('record', 'position', 'fingerprint', 'terms', 'length')
+
+    def __init__(self, record: dict, position: int, fingerprint: tuple, terms: Dict[str, float]):
+        self.record = record
+        self.position = position
+        self.fingerprint = fingerprint
+        self.terms = tuple(terms)
+        self.length = sum(terms.values())
+
+
+class TextIndex:
+    """
+    Índice invertido término -> {documento: frecuencia ponderada}
+    sync() aplica solo los cambios entre cargas del catálogo (altas, cambios y bajas por id)
+    """
+
+    def __init__(self, field_boosts: Optional[Dict[str, float]] = None):
+        self.field_boosts = dict(field_boosts or FIELD_BOOSTS)
+        self._postings: Dict[str, Dict[Hashable, float]] = {}
+        self._docs: Dict[Hashable, _Document] = {}
+        self._total_length = 0.0
+        self._lock = threading.Lock()
+        self.searches = 0
+
+    @classmethod
+    def from_records(cls, records: List[dict]) -> 'TextIndex':
+        """Índice temporal sobre una lista de propiedades (p. ej. el resultado de un query)"""
+        index = cls()
+        index.sync(records)
+        return index
+
+    @property
+    def size(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _key(record: dict, position: int) -> Hashable:
+        record_id = record.get('id')
+        return record_id if record_id is not None else ('row', position)
+
+    def _fingerprint(self, record: dict) -> tuple:
+        return tuple(record.get(field) for field in self.field_boosts)
+
+    def _add(self, key: Hashable, record: dict, position: int, fingerprint: tuple):
+        terms: Dict[str, float] = defaultdict(float)
+        for field, boost in self.field_boosts.items():
+            value = record.get(field)
+            if value:
+                for term in tokenize(str(value)):
+                    terms[term] += boost
+        document = _Document(record, position, fingerprint, terms)
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[key] = frequency
+        self._docs[key] = document
+        self._total_length += document.length
+
+    def _remove(self, key: Hashable):
+        document = self._docs.pop(key)
+        for term in document.terms:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= document.length
+
+    def _upsert(self, record: dict, position: int) -> str:
+        key = self._key(record, position)
+        fingerprint = self._fingerprint(record)
+        document = self._docs.get(key)
+        if document is not None:
+            if document.fingerprint == fingerprint:
+                document.record = record
+                document.position = position
+                return 'unchanged'
+            self._remove(key)
+            self._add(key, record, position, fingerprint)
+            return 'updated'
+        self._add(key, record, position, fingerprint)
+        return 'added'
+
+    def upsert(self, record: dict, position: Optional[int] = None) -> str:
+        """Agrega o actualiza una propiedad; retorna 'added', 'updated' o 'unchanged'"""
+        with self._lock:
+            return self._upsert(record, position if position is not None else len(self._docs))
+
+    def remove(self, record_id: Hashable) -> bool:
+        """Quita una propiedad por id"""
+        with self._lock:
+            if record_id not in self._docs:
+                return False
+            self._remove(record_id)
+            return True
+
+    def sync(self, records: List[dict]) -> Dict[str, int]:
+        """Deja el índice igual a `records` re-tokenizando solo lo que cambió"""
+        changes = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+        with self._lock:
+            seen = set()
+            for position, record in enumerate(records):
+                changes[self._upsert(record, position)] += 1
+                seen.add(self._key(record, position))
+            for key in [key for key in self._docs if key not in seen]:
+                self._remove(key)
+                changes['removed'] += 1
+        return changes
+
+    def search(self, terms: Iterable[str], k: Optional[int] = None) -> List[Tuple[dict, float]]:
+        """
+        Propiedades que contienen algún término, con su puntaje BM25, de mayor a menor
+        (empates en orden del catálogo); con `k` solo las k mejores
+        """
+        query_terms = list(dict.fromkeys(term for text in terms for term in tokenize(text)))
+        with self._lock:
+            self.searches += 1
+            total = len(self._docs)
+            if not total or not query_terms:
+                return []
+            avg_length = self._total_length / total or 1.0
+            scores: Dict[Hashable, float] = defaultdict(float)
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, frequency in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._docs[key].length / avg_length)
+                    scores[key] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+            rank_key = lambda item: (-item[1], self._docs[item[0]].position)
+            if k is not None:
+                ranked = heapq.nsmallest(k, scores.items(), key=rank_key)
+            else:
+                ranked = sorted(scores.items(), key=rank_key)
+            return [(self._docs[key].record, round(score, 4)) for key, score in ranked]
+
+    def get_stats(self) -> dict:
+        return {
+            'documents': len(self._docs),
+            'terms': len(self._postings),
+            'postings': sum(len(postings) for postings in self._postings.values()),
+            'searches': self.searches,
+            'field_boosts': dict(self.field_boosts)
+        }
@@ -0,0 +1,357 @@
+"""
+Índice vectorial del catálogo para búsqueda semántica local (CPU)
+Embedders intercambiables (hashing de n-gramas de caracteres sin red, u Ollama /api/embed),
+embeddings persistidos en disco y reutilizados mientras el texto no cambie, e índice IVF
+con similitud coseno y top-k; los embeddings de consultas se cachean
+"""
+import os
+import math
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .query_parser_service import fold
+from .ranking_service import top_k
+from .columnar_index_service import IndexedRecords
+
+logger = logging.getLogger(__name__)
+
+# Campos que describen una propiedad para el embedding
+EMBEDDING_FIELDS = ('titulo', 'tipo', 'ubicacion', 'descripcion')
+
+DEFAULT_EMBEDDINGS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'embeddings')
+
+
+def property_text(record: dict) -> str:
+    """Texto de una propiedad que se convierte en vector"""
+    return ' '.join(str(record.get(field) or '') for field in EMBEDDING_FIELDS)
+
+
+def _text_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    """
+    Embedder local sin red: n-gramas de caracteres (texto en minúsculas y sin tildes)
+    proyectados con hashing con signo a `dim` dimensiones, frecuencia sublineal y norma L2
+    """
+
+    def __init__(self, dim: Optional[int] = None, ngrams: Tuple[int, ...] = (3, 4)):
+        self.dim = dim or int(os.getenv('VECTOR_HASHING_DIM', 512))
+        self.ngrams = ngrams
+        self.remote = False
+        self.identifier = f"hashing-{self.dim}-{'-'.join(map(str, ngrams))}"
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = f" {' '.join(fold(text.lower()).split())} "
+        counts: Dict[int, int] = {}
+        for n in self.ngrams:
+            for start in range(len(padded) - n + 1):
+                bucket = zlib.crc32(padded[start:start + n].encode('utf-8'))
+                counts[bucket] = counts.get(bucket, 0) + 1
+        for bucket, count in counts.items():
+            sign = 1.0 if bucket & 0x80000000 else -1.0
+            vector[bucket % self.dim] += sign * (1.0 + math.log(count))
+        return vector
+
+    def embed(self, texts: Sequence[str]) -> Optional[np.ndarray]:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return _normalize(np.stack([self._embed_one(text) for text in texts]))
+
+
+class OllamaEmbedder:
+    """Embeddings de Ollama (/api/embed) con el modelo OLLAMA_EMBED_MODEL"""
+
+    def __init__(self, ollama_client, model: Optional[str] = None):
+        self.ollama_client = ollama_client
+        self.model = model or os.getenv('OLLAMA_EMBED_MODEL', 'nomic-embed-text')
+        self.remote = True
+        self.identifier = f"ollama-{self.model.replace(':', '_').replace('/', '_')}"
+
+    def embed(self, texts: Sequence[str]) -> Optional[np.ndarray]:
+        """Síncrono: se llama desde hilos (carga del snapshot, búsquedas con asyncio.to_thread)"""
+        if not texts:
+            return None
+        vectors = self.ollama_client.run_sync(self.ollama_client.embed(list(texts), self.model))
+        if not vectors or len(vectors) != len(texts):
+            return None
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def create_embedder(ollama_client=None):
+    """Embedder según VECTOR_EMBEDDER: 'hashing' (por defecto) u 'ollama'"""
+    kind = os.getenv('VECTOR_EMBEDDER', 'hashing').lower()
+    if kind == 'ollama' and ollama_client is not None:
+        return OllamaEmbedder(ollama_client)
+    if kind not in ('hashing', 'ollama'):
+        logger.warning(f"VECTOR_EMBEDDER desconocido: {kind}, usando hashing")
+    return HashingEmbedder()
+
+
+class IVFIndex:
+    """
+    Índice de archivo invertido: k-means esférico sobre una muestra, cada vector en la
+    lista de su centroide más cercano; la búsqueda revisa solo las `nprobe` listas más cercanas
+    Con pocos vectores la búsqueda es exhaustiva (exacta)
+    """
+
+    def __init__(self, vectors: np.ndarray, min_rows: Optional[int] = None, iterations: int = 8, seed: int = 13):
+        self.vectors = vectors
+        self.min_rows = min_rows if min_rows is not None else int(os.getenv('VECTOR_IVF_MIN_ROWS', 5000))
+        self.nprobe = int(os.getenv('VECTOR_IVF_NPROBE', 8))
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[np.ndarray] = []
+        if len(vectors) >= self.min_rows:
+            self._train(iterations, seed)
+
+    def _assign(self, vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        return np.concatenate([np.argmax(vectors[start:start + chunk] @ self.centroids.T, axis=1)
+                               for start in range(0, len(vectors), chunk)])
+
+    def _train(self, iterations: int, seed: int):
+        size = len(self.vectors)
+        nlist = max(1, min(int(math.sqrt(size)), 1024))
+        rng = np.random.default_rng(seed)
+        sample = self.vectors[rng.choice(size, size=min(size, nlist * 40), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            filled = np.bincount(assignment, minlength=nlist) > 0
+            self.centroids[filled] = _normalize(sums[filled])
+        assignment = self._assign(self.vectors)
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Filas y similitudes coseno de los k vectores más cercanos"""
+        if self.centroids is None:
+            rows = np.arange(len(self.vectors))
+        else:
+            probes = top_k(self.centroids @ query, self.nprobe)
+            rows = np.concatenate([self.lists[probe] for probe in probes])
+        scores = self.vectors[rows] @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def get_stats(self) -> dict:
+        return {
+            'mode': 'ivf' if self.centroids is not None else 'flat',
+            'lists': len(self.lists),
+            'nprobe': self.nprobe if self.centroids is not None else None
+        }
+
+
+class _VectorState:
+    """Vectores de una versión del catálogo (se reemplaza completo en cada sync)"""
+
+    def __init__(self, records: List[dict], keys: List[str], hashes: np.ndarray, vectors: np.ndarray):
+        self.records = records
+        self.keys = keys
+        self.hashes = hashes
+        self.vectors = vectors
+        self.row_by_key = {key: row for row, key in enumerate(keys)}
+        self.row_by_hash = {int(text_hash): row for row, text_hash in enumerate(hashes)}
+        self.ivf = IVFIndex(vectors)
+
+
+class VectorIndex:
+    """
+    Vectores del catálogo, persistidos por embedder en VECTOR_INDEX_DIR
+    sync() solo calcula embeddings de propiedades nuevas o con texto cambiado
+    """
+
+    def __init__(self, embedder=None, directory: Optional[str] = None):
+        self.embedder = embedder or HashingEmbedder()
+        self.directory = directory or os.getenv('VECTOR_INDEX_DIR', DEFAULT_EMBEDDINGS_DIR)
+        self.batch_size = int(os.getenv('VECTOR_EMBED_BATCH', 64))
+        # Con un embedder remoto cada candidato sin vector es una llamada durante la petición: se acota
+        self.request_embed_limit = int(os.getenv('VECTOR_REQUEST_EMBED_LIMIT', 16))
+        self._state: Optional[_VectorState] = None
+        self._sync_lock = threading.Lock()
+        self._query_cache: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._query_cache_size = int(os.getenv('VECTOR_QUERY_CACHE_SIZE', 1024))
+        self._cache_lock = threading.Lock()
+        self.stats = {'embedded': 0, 'reused': 0, 'query_hits': 0, 'query_misses': 0, 'searches': 0, 'errors': 0,
+                      'request_embedded': 0, 'request_skipped': 0}
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{self.embedder.identifier}.npz")
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    @property
+    def size(self) -> int:
+        return len(self._state.keys) if self._state is not None else 0
+
+    @staticmethod
+    def _key(record: dict, position: int) -> str:
+        record_id = record.get('id')
+        return str(record_id) if record_id is not None else f"row:{position}"
+
+    def _load_persisted(self) -> Dict[str, Tuple[int, np.ndarray]]:
+        if self._state is not None:
+            state = self._state
+            return {key: (state.hashes[row], state.vectors[row]) for row, key in enumerate(state.keys)}
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                return {key: (text_hash, vector) for key, text_hash, vector
+                        in zip(data['keys'].tolist(), data['hashes'], data['vectors'])}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"No se pudieron leer los embeddings de {self.path}: {e}")
+            return {}
+
+    def _persist(self, state: _VectorState):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp.npz"
+            np.savez(temp_path, keys=np.array(state.keys, dtype=str), hashes=state.hashes, vectors=state.vectors)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.warning(f"No se pudieron guardar los embeddings en {self.path}: {e}")
+
+    def _embed_batches(self, texts: List[str]) -> Optional[np.ndarray]:
+        chunks = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors = self.embedder.embed(texts[start:start + self.batch_size])
+            if vectors is None:
+                return None
+            chunks.append(vectors)
+        return np.concatenate(chunks) if chunks else None
+
+    def sync(self, records: List[dict]) -> Dict[str, int]:
+        """Deja el índice igual a `records`; reutiliza los embeddings guardados si el texto no cambió"""
+        with self._sync_lock:
+            started = time.perf_counter()
+            persisted = self._load_persisted()
+            keys = [self._key(record, position) for position, record in enumerate(records)]
+            texts = [property_text(record) for record in records]
+            hashes = np.array([_text_hash(text) for text in texts], dtype=np.int64)
+
+            vectors: List[Optional[np.ndarray]] = [None] * len(records)
+            missing = []
+            for row, key in enumerate(keys):
+                stored = persisted.get(key)
+                if stored is not None and stored[0] == hashes[row]:
+                    vectors[row] = stored[1]
+                else:
+                    missing.append(row)
+
+            if missing:
+                embedded = self._embed_batches([texts[row] for row in missing])
+                if embedded is None:
+                    self.stats['errors'] += 1
+                    logger.warning("No se pudieron calcular los embeddings del catálogo; índice vectorial sin cambios")
+                    return {'embedded': 0, 'reused': len(records) - len(missing), 'failed': len(missing)}
+                for row, vector in zip(missing, embedded):
+                    vectors[row] = vector
+
+            matrix = np.stack(vectors).astype(np.float32) if vectors else np.zeros((0, 1), dtype=np.float32)
+            state = _VectorState(records, keys, hashes, matrix)
+            self._state = state
+            if missing or len(persisted) != len(records):
+                self._persist(state)
+            self.stats['embedded'] += len(missing)
+            self.stats['reused'] += len(records) - len(missing)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            logger.info(f"Índice vectorial ({self.embedder.identifier}): {len(records)} propiedades, "
+                        f"{len(missing)} embeddings nuevos ({elapsed_ms:.0f} ms)")
+            return {'embedded': len(missing), 'reused': len(records) - len(missing)}
+
+    def embed_query(self, query: str) -> Optional[np.ndarray]:
+        """Embedding de una consulta, cacheado (LRU) por texto normalizado"""
+        key = ' '.join(query.lower().split())
+        with self._cache_lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.stats['query_hits'] += 1
+                return vector
+        vectors = self.embedder.embed([key])
+        if vectors is None:
+            self.stats['errors'] += 1
+            return None
+        with self._cache_lock:
+            self.stats['query_misses'] += 1
+            self._query_cache[key] = vectors[0]
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vectors[0]
+
+    def search(self, query: str, k: int, candidates: Optional[List[dict]] = None) -> Optional[List[Tuple[dict, float]]]:
+        """
+        Top-k por similitud coseno: sobre todo el catálogo (IVF), o solo entre `candidates`
+        (p. ej. resultados SQL), usando sus vectores guardados y calculando los que falten
+        Los candidatos sin id se buscan por el hash de su texto (su posición no es una fila del catálogo);
+        con embedder remoto se calculan a lo más request_embed_limit y el resto queda con similitud 0
+        Retorna None si no hay índice o no se pudo obtener el embedding
+        """
+        state = self._state
+        if state is None:
+            return None
+        query_vector = self.embed_query(query)
+        if query_vector is None:
+            return None
+        self.stats['searches'] += 1
+
+        whole_catalog = isinstance(candidates, IndexedRecords) and candidates.rows is None
+        if candidates is None or (whole_catalog and len(candidates) == len(state.records)):
+            rows, scores = state.ivf.search(query_vector, k)
+            return [(state.records[row], float(score)) for row, score in zip(rows, scores)]
+
+        vectors = np.zeros((len(candidates), state.vectors.shape[1]), dtype=np.float32)
+        missing = []
+        for position, record in enumerate(candidates):
+            text_hash = _text_hash(property_text(record))
+            record_id = record.get('id')
+            row = state.row_by_key.get(str(record_id)) if record_id is not None else state.row_by_hash.get(text_hash)
+            if row is not None and state.hashes[row] == text_hash:
+                vectors[position] = state.vectors[row]
+            else:
+                missing.append(position)
+        if missing and self.embedder.remote and len(missing) > self.request_embed_limit:
+            self.stats['request_skipped'] += len(missing) - self.request_embed_limit
+            missing = missing[:self.request_embed_limit]
+        if missing:
+            embedded = self._embed_batches([property_text(candidates[position]) for position in missing])
+            if embedded is not None:
+                vectors[missing] = embedded
+                self.stats['request_embedded'] += len(missing)
+        scores = vectors @ query_vector
+        best = top_k(scores, k)
+        return [(candidates[position], float(scores[position])) for position in best]
+
+    def get_stats(self) -> dict:
+        state = self._state
+        with self._cache_lock:
+            cached = len(self._query_cache)
+        return {
+            'embedder': self.embedder.identifier,
+            'vectors': len(state.keys) if state is not None else 0,
+            'dim': int(state.vectors.shape[1]) if state is not None and len(state.keys) else None,
+            'ivf': state.ivf.get_stats() if state is not None else None,
+            'query_cache_size': cached,
+            **self.stats
+        }
@@ -0,0 +1,94 @@
+"""
+Servicio de calentamiento de caches al arrancar la aplicación
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+from .llm_admission_service import llm_priority, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupService:
+    """
+    Precarga el snapshot del catálogo, calienta el modelo y reproduce las
+    consultas más frecuentes para llenar los caches antes de recibir tráfico
+    """
+
+    def __init__(self, llm_service, top_n: Optional[int] = None):
+        self.llm_service = llm_service
+        self.enabled = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+        self.top_n = top_n if top_n is not None else int(os.getenv('WARMUP_TOP_QUERIES', 20))
+        self.max_age_seconds = int(os.getenv('WARMUP_QUERY_WINDOW', 7 * 24 * 3600))
+        self.concurrency = max(1, int(os.getenv('WARMUP_CONCURRENCY', 4)))
+        self.timeout = float(os.getenv('WARMUP_TIMEOUT', 180))
+        self.ready = False
+        self.status = {
+            'state': 'pending',
+            'catalog_size': None,
+            'model_warmed': None,
+            'queries_replayed': 0,
+            'errors': [],
+            'duration_ms': None
+        }
+
+    async def warm(self) -> dict:
+        """Ejecuta el calentamiento completo; la app queda lista al terminar"""
+        if not self.enabled:
+            self.status['state'] = 'disabled'
+            self.ready = True
+            return self.status
+
+        started = time.perf_counter()
+        self.status['state'] = 'warming'
+        try:
+            with llm_priority(PRIORITY_BACKGROUND):
+                await asyncio.wait_for(self._warm_steps(), timeout=self.timeout)
+            self.status['state'] = 'done'
+        except asyncio.TimeoutError:
+            logger.warning(f"Warm-up excedió {self.timeout}s, se continúa con caches parciales")
+            self.status['state'] = 'timeout'
+        except Exception as e:
+            logger.error(f"Error durante warm-up: {e}")
+            self.status['state'] = 'failed'
+            self.status['errors'].append(str(e))
+        finally:
+            self.status['duration_ms'] = round((time.perf_counter() - started) * 1000)
+            self.ready = True
+
+        logger.info(f"Warm-up finalizado: {self.status}")
+        return self.status
+
+    async def _warm_steps(self):
+        """Pasos del calentamiento en orden: catálogo, modelo y consultas frecuentes"""
+        data_loader = self.llm_service.data_loader
+
+        # 1. Snapshot del catálogo (también abre la primera conexión a DB)
+        try:
+            self.status['catalog_size'] = await asyncio.to_thread(data_loader.catalog.load)
+        except Exception as e:
+            logger.warning(f"No se pudo precargar el catálogo: {e}")
+            self.status['errors'].append(f"catalog: {e}")
+
+        # 2. Modelo (antes de reproducir consultas, que lo usan)
+        self.status['model_warmed'] = await self.llm_service.ollama_client.warmup()
+
+        # 3. Consultas más frecuentes -> cache de SQL generado
+        queries = await asyncio.to_thread(self.llm_service.query_log.top_queries, self.top_n, self.max_age_seconds)
+        if not queries:
+            return
+
+        logger.info(f"Reproduciendo {len(queries)} consultas frecuentes para calentar caches")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def replay(query: str):
+            async with semaphore:
+                try:
+                    await data_loader.load_properties_from_generated_query_with_info_async(query)
+                    self.status['queries_replayed'] += 1
+                except Exception as e:
+                    logger.warning(f"Error reproduciendo consulta '{query}': {e}")
+
+        await asyncio.gather(*(replay(query) for query in queries))
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Servidor Ollama simulado para pruebas de carga y desarrollo sin conexión.
+
+Implementa el contrato de /api/chat (con y sin streaming) y /api/generate (precarga),
+con respuestas deterministas según el tipo de prompt que envía el backend:
+- Generación de SQL  -> SELECT construido con reglas simples sobre la consulta
+- Re-ranking          -> lista JSON de IDs (o un objeto por consulta en lotes)
+- Validación de SQL   -> JSON con valid/score/issues/suggestions/security_level
+- Conversación        -> texto breve que repite la consulta
+
+Latencia configurable (fixed, uniform, normal, lognormal, exponential) e inyección
+de errores 500 y 429 con Retry-After, por probabilidad o con las marcas
+__FAIL__ / __RATE__ dentro del prompt.
+
+Uso:
+    python fake_ollama_server.py --port 11500 --latency-ms 800 --latency-dist lognormal
+    # .env del backend:
+    #   USE_OLLAMA_CLOUD=false
+    #   OLLAMA_URL=http://127.0.0.1:11500
+    # o bien, manteniendo la configuración Cloud:
+    #   OLLAMA_BACKENDS=http://127.0.0.1:11500
+
+GET /stats devuelve los contadores del servidor simulado.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+# Marcas para forzar errores desde la consulta del usuario
+FAIL_MARKER = '__FAIL__'
+RATE_MARKER = '__RATE__'
+
+TIPOS = {
+    'casa': 'casa',
+    'casas': 'casa',
+    'departamento': 'departamento',
+    'departamentos': 'departamento',
+    'apartamento': 'departamento',
+    'apartamentos': 'departamento',
+    'terreno': 'terreno',
+    'terrenos': 'terreno',
+    'lote': 'terreno'
+}
+
+DANGEROUS_SQL = ('drop ', 'delete ', 'update ', 'insert ', 'alter ', 'truncate ', '--', ';--')
+
+
+class FakeOllama:
+    """Estado y comportamiento del servidor simulado"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.stats = {
+            'requests': 0,
+            'streams': 0,
+            'streams_cancelled': 0,
+            'errors_injected': 0,
+            'rate_limited': 0,
+            'preloads': 0,
+            'malformed': 0,
+            'loaded_models': {},
+            'by_kind': {}
+        }
+
+    # ==================== LATENCIA Y FALLAS ====================
+
+    def sample_latency(self) -> float:
+        """Latencia en segundos según la distribución configurada"""
+        mean = self.args.latency_ms / 1000
+        jitter = self.args.jitter_ms / 1000
+        dist = self.args.latency_dist
+        if dist == 'uniform':
+            value = self.random.uniform(max(0.0, mean - jitter), mean + jitter)
+        elif dist == 'normal':
+            value = self.random.gauss(mean, jitter)
+        elif dist == 'lognormal':
+            # Cola larga: mediana = mean, sigma controla la cola
+            value = mean * self.random.lognormvariate(0, self.args.sigma)
+        elif dist == 'exponential':
+            value = self.random.expovariate(1 / mean) if mean > 0 else 0.0
+        else:
+            value = mean
+        return max(0.0, value)
+
+    def injected_failure(self, text: str):
+        """Respuesta de error a inyectar, o None"""
+        if RATE_MARKER in text or self.random.random() < self.args.rate_limit_rate:
+            self.stats['rate_limited'] += 1
+            return web.json_response(
+                {'error': 'rate limit exceeded'},
+                status=429,
+                headers={'Retry-After': str(self.args.retry_after)}
+            )
+        if FAIL_MARKER in text or self.random.random() < self.args.error_rate:
+            self.stats['errors_injected'] += 1
+            return web.json_response({'error': 'simulated server error'}, status=500)
+        return None
+
+    # ==================== RESPUESTAS GUIONADAS ====================
+
+    def script_response(self, messages: list, structured: bool = False) -> tuple:
+        """Clasifica el prompt y genera la respuesta determinista: (tipo, contenido)"""
+        system = ' '.join(m.get('content', '') for m in messages if m.get('role') == 'system')
+        # El primer mensaje del usuario define la tarea (los reintentos añaden mensajes después)
+        user = next((m.get('content', '') for m in messages if m.get('role') == 'user'), '')
+
+        if 'Analiza esta consulta SQL' in user:
+            return 'validation', self.validation_response(user)
+        if 'Consultas (' in user and 'candidatas' in user:
+            return 'rerank_batch', self.batch_rerank_response(user)
+        if 'IDs' in system or 'IDs' in user:
+            ids = self.rank_ids(user, self.extract_query(user))
+            # En modo JSON (`format`) la respuesta es un objeto {"ids": [...]}
+            return 'rerank', json.dumps({'ids': ids} if structured else ids)
+        if 'SQL' in system or 'Genera una consulta SQL' in user:
+            return 'sql', self.sql_response(self.extract_query(user))
+        query = self.extract_query(user)
+        return 'chat', f"Respuesta simulada sobre {query}. Hay varias propiedades que podrían interesarte; revisa ubicación, precio y número de habitaciones."
+
+    @staticmethod
+    def extract_query(text: str) -> str:
+        """Primera cadena entre comillas del prompt (la consulta del usuario) o el texto completo"""
+        match = re.search(r'"([^"]+)"', text)
+        return match.group(1) if match else text.strip()[:200]
+
+    @staticmethod
+    def sql_response(query: str) -> str:
+        """SELECT determinista a partir de palabras clave de la consulta"""
+        query_lower = query.lower()
+        conditions = []
+
+        for word, tipo in TIPOS.items():
+            if re.search(rf'\b{word}\b', query_lower):
+                conditions.append(f"tipo = '{tipo}'")
+                break
+
+        rooms = re.search(r'(\d+)\s*(?:habitaciones|habitación|habitacion|cuartos|recámaras)', query_lower)
+        if rooms:
+            conditions.append(f"habitaciones >= {rooms.group(1)}")
+
+        baths = re.search(r'(\d+(?:\.\d+)?)\s*baños', query_lower)
+        if baths:
+            conditions.append(f"banos >= {baths.group(1)}")
+
+        zone = re.search(r'zona\s*(\d+)', query_lower)
+        if zone:
+            conditions.append(f"ubicacion LIKE '%zona {zone.group(1)}%'")
+
+        price = re.search(r'(?:menos de|máximo|hasta)\s*[$q]?\s*([\d,\.]+)', query_lower)
+        if price:
+            conditions.append(f"precio <= {price.group(1).replace(',', '')}")
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        return f"SELECT * FROM propiedades{where} ORDER BY precio ASC LIMIT 50"
+
+    @staticmethod
+    def validation_response(prompt: str) -> str:
+        """Validación JSON determinista del SQL incluido en el prompt"""
+        match = re.search(r'SQL a analizar:\s*(.+)', prompt)
+        sql = match.group(1).strip() if match else ''
+        sql_lower = sql.lower()
+        issues, suggestions = [], []
+
+        dangerous = any(token in sql_lower for token in DANGEROUS_SQL)
+        valid = sql_lower.startswith('select') and not dangerous
+        if dangerous:
+            issues.append('Contiene comandos peligrosos')
+        if 'limit' not in sql_lower:
+            suggestions.append('Agregar LIMIT para acotar resultados')
+        score = 0 if dangerous else (95 if not suggestions else 75)
+
+        return json.dumps({
+            'valid': valid,
+            'score': score,
+            'issues': issues,
+            'suggestions': suggestions,
+            'security_level': 'dangerous' if dangerous else ('safe' if valid else 'warning')
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def candidate_rows(prompt: str) -> dict:
+        """Filas de candidatos del prompt: formato compacto (id|...) o por bloques (ID: n)"""
+        rows = {}
+        for line in prompt.splitlines():
+            line = line.strip()
+            compact = re.match(r'^(\d+)\|(.*)$', line)
+            if compact:
+                rows[int(compact.group(1))] = compact.group(2).lower()
+        if not rows:
+            for block in re.split(r'\n\s*---', prompt):
+                match = re.search(r'ID:\s*(\d+)', block)
+                if match:
+                    rows[int(match.group(1))] = block.lower()
+        return rows
+
+    def rank_ids(self, prompt: str, query: str, allowed=None) -> list:
+        """Ordena candidatos por coincidencia de palabras con la consulta (desempate por id)"""
+        words = [w for w in re.findall(r'\w+', query.lower()) if len(w) > 2]
+        rows = self.candidate_rows(prompt)
+        if allowed is not None:
+            rows = {k: v for k, v in rows.items() if k in allowed}
+        scored = sorted(rows.items(), key=lambda item: (-sum(w in item[1] for w in words), item[0]))
+        return [prop_id for prop_id, _ in scored[:10]]
+
+    def batch_rerank_response(self, prompt: str) -> str:
+        """Objeto {id_consulta: [IDs]} para prompts de re-ranking en lote"""
+        result = {}
+        for match in re.finditer(r'^(q\d+):\s*"([^"]*)"\s*\|\s*candidatas:\s*(.+)$', prompt, re.MULTILINE):
+            query_id, query, candidates = match.groups()
+            allowed = None if candidates.strip() == 'todas' else {
+                int(c) for c in re.findall(r'\d+', candidates)
+            }
+            result[query_id] = self.rank_ids(prompt, query, allowed)
+        return json.dumps(result)
+
+    # ==================== HANDLERS ====================
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        self.stats['requests'] += 1
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return web.json_response({'error': 'invalid JSON'}, status=400)
+
+        messages = body.get('messages') or []
+        text = ' '.join(m.get('content', '') for m in messages)
+        model = body.get('model', self.args.model)
+        cold = model not in self.stats['loaded_models']
+        if 'keep_alive' in body:
+            self.stats['loaded_models'][model] = body['keep_alive']
+
+        latency = self.sample_latency()
+        await asyncio.sleep(latency)
+
+        failure = self.injected_failure(text)
+        if failure is not None:
+            return failure
+
+        kind, content = self.script_response(messages, structured='format' in body)
+        self.stats['by_kind'][kind] = self.stats['by_kind'].get(kind, 0) + 1
+        if 'format' in body and self.random.random() < self.args.malformed_rate:
+            # JSON truncado para ejercitar el reintento de salidas estructuradas
+            self.stats['malformed'] += 1
+            content = content[:max(1, len(content) // 2)]
+        prompt_tokens = len(re.findall(r'\w+|[^\w\s]', text))
+        eval_tokens = len(content.split())
+
+        # La latencia simulada cuenta como carga del modelo si aún no estaba cargado
+        load_ns = int(latency * 1e9) if cold else 0
+        if body.get('stream', True):
+            return await self.stream_chat(request, model, content, prompt_tokens, load_ns)
+
+        return web.json_response(dict({
+            'model': model,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'message': {'role': 'assistant', 'content': content},
+            'done': True,
+            'done_reason': 'stop'
+        }, **self.timings(prompt_tokens, eval_tokens, load_ns)))
+
+    def timings(self, prompt_tokens: int, eval_tokens: int, load_ns: int) -> dict:
+        """Contadores y duraciones (ns) como los reporta Ollama; el prompt se evalúa 10x más rápido"""
+        prompt_eval_ns = int(prompt_tokens / (self.args.tokens_per_second * 10) * 1e9)
+        eval_ns = int(eval_tokens / self.args.tokens_per_second * 1e9)
+        return {
+            'prompt_eval_count': prompt_tokens,
+            'eval_count': eval_tokens,
+            'load_duration': load_ns,
+            'prompt_eval_duration': prompt_eval_ns,
+            'eval_duration': eval_ns,
+            'total_duration': load_ns + prompt_eval_ns + eval_ns
+        }
+
+    async def stream_chat(self, request: web.Request, model: str, content: str, prompt_tokens: int,
+                          load_ns: int = 0) -> web.StreamResponse:
+        """NDJSON: un chunk por palabra a tokens_per_second y un chunk final con done=true"""
+        self.stats['streams'] += 1
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        words = re.findall(r'\S+\s*', content)
+        delay = 1 / self.args.tokens_per_second
+        try:
+            for word in words:
+                chunk = {'model': model, 'message': {'role': 'assistant', 'content': word}, 'done': False}
+                await response.write((json.dumps(chunk, ensure_ascii=False) + '\n').encode('utf-8'))
+                await asyncio.sleep(delay)
+            final = dict({
+                'model': model,
+                'message': {'role': 'assistant', 'content': ''},
+                'done': True,
+                'done_reason': 'stop'
+            }, **self.timings(prompt_tokens, len(words), load_ns))
+            await response.write((json.dumps(final) + '\n').encode('utf-8'))
+        except (asyncio.CancelledError, ConnectionResetError):
+            # El cliente cortó el stream: la "generación" se detiene aquí
+            self.stats['streams_cancelled'] += 1
+            raise
+        return response
+
+    async def generate(self, request: web.Request) -> web.Response:
+        """/api/generate: sin prompt solo "carga" el modelo (precarga/keep_alive)"""
+        self.stats['requests'] += 1
+        body = await request.json()
+        model = body.get('model', self.args.model)
+        self.stats['loaded_models'][model] = body.get('keep_alive')
+        prompt = body.get('prompt') or ''
+        if not prompt:
+            self.stats['preloads'] += 1
+            return web.json_response({'model': model, 'response': '', 'done': True, 'done_reason': 'load'})
+
+        await asyncio.sleep(self.sample_latency())
+        failure = self.injected_failure(prompt)
+        if failure is not None:
+            return failure
+        return web.json_response({
+            'model': model,
+            'response': f"Respuesta simulada sobre {self.extract_query(prompt)}.",
+            'done': True,
+            'done_reason': 'stop'
+        })
+
+    async def tags(self, request: web.Request) -> web.Response:
+        return web.json_response({'models': [{'name': self.args.model, 'model': self.args.model}]})
+
+    async def version(self, request: web.Request) -> web.Response:
+        return web.json_response({'version': 'fake'})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor Ollama simulado (/api/chat)")
+    parser.add_argument('--host', default=os.getenv('FAKE_OLLAMA_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('FAKE_OLLAMA_PORT', 11500)))
+    parser.add_argument('--model', default=os.getenv('FAKE_OLLAMA_MODEL', 'llama3.2:3b'))
+    parser.add_argument('--latency-dist', default=os.getenv('FAKE_OLLAMA_LATENCY_DIST', 'fixed'),
+                        choices=['fixed', 'uniform', 'normal', 'lognormal', 'exponential'])
+    parser.add_argument('--latency-ms', type=float, default=float(os.getenv('FAKE_OLLAMA_LATENCY_MS', 200)),
+                        help="Latencia media (mediana para lognormal)")
+    parser.add_argument('--jitter-ms', type=float, default=float(os.getenv('FAKE_OLLAMA_JITTER_MS', 50)),
+                        help="Desviación para uniform/normal")
+    parser.add_argument('--sigma', type=float, default=float(os.getenv('FAKE_OLLAMA_SIGMA', 0.5)),
+                        help="Sigma de la distribución lognormal")
+    parser.add_argument('--tokens-per-second', type=float, default=float(os.getenv('FAKE_OLLAMA_TPS', 30)))
+    parser.add_argument('--error-rate', type=float, default=float(os.getenv('FAKE_OLLAMA_ERROR_RATE', 0)))
+    parser.add_argument('--rate-limit-rate', type=float, default=float(os.getenv('FAKE_OLLAMA_429_RATE', 0)))
+    parser.add_argument('--malformed-rate', type=float, default=float(os.getenv('FAKE_OLLAMA_MALFORMED_RATE', 0)),
+                        help="Proporción de respuestas JSON truncadas cuando se pide `format`")
+    parser.add_argument('--retry-after', type=float, default=float(os.getenv('FAKE_OLLAMA_RETRY_AFTER', 1)))
+    parser.add_argument('--seed', type=int, default=int(os.getenv('FAKE_OLLAMA_SEED', 42)))
+    return parser.parse_args(argv)
+
+
+def create_app(args) -> web.Application:
+    fake = FakeOllama(args)
+    app = web.Application()
+    app.router.add_post('/api/chat', fake.chat)
+    app.router.add_post('/api/generate', fake.generate)
+    app.router.add_get('/api/tags', fake.tags)
+    app.router.add_get('/api/version', fake.version)
+    app.router.add_get('/stats', fake.get_stats)
+    return app
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"🤖 Ollama simulado en http://{args.host}:{args.port} "
+          f"(latencia {args.latency_dist} {args.latency_ms:.0f} ms, errores {args.error_rate:.0%}, 429 {args.rate_limit_rate:.0%})")
+    web.run_app(create_app(args), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -10,5 +10,11 @@ CREATE TABLE IF NOT EXISTS propiedades (
     area_m2 DECIMAL(8,2) DEFAULT 0.00,
     ubicacion VARCHAR(255),
     fecha_publicacion DATE,
-    imagen_url VARCHAR(512)
+    imagen_url VARCHAR(512),
+    -- Índices para el SQL compilado de los filtros (igualdad y rangos)
+    INDEX idx_propiedades_tipo_precio (tipo, precio),
+    INDEX idx_propiedades_precio (precio),
+    INDEX idx_propiedades_habitaciones (habitaciones, precio),
+    INDEX idx_propiedades_area (area_m2),
+    INDEX idx_propiedades_fecha (fecha_publicacion)
 );
\ No newline at end of file
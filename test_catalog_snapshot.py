@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la recarga perezosa del snapshot del catálogo (CatalogSnapshot):
+una sola recarga con peticiones concurrentes y espera entre reintentos si el loader falla.
+Se ejecuta con pytest o directamente: python test_catalog_snapshot.py
+"""
+import time
+import threading
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.catalog_snapshot_service import CatalogSnapshot
+
+PROPERTIES = [{'id': 1, 'titulo': 'Casa', 'tipo': 'casa', 'precio': 100000, 'area_m2': 120}]
+
+
+def test_peticiones_concurrentes_recargan_una_vez():
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'properties': PROPERTIES, 'data_source': 'json'}
+
+    snapshot = CatalogSnapshot(slow_loader, ttl_seconds=300)
+    threads = [threading.Thread(target=snapshot.get_properties) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert snapshot.version == 1 and snapshot.get_properties() == PROPERTIES
+
+
+def test_loader_con_error_espera_antes_de_reintentar():
+    calls = []
+    failing = [True]
+
+    def loader():
+        calls.append(1)
+        if failing[0]:
+            raise ConnectionError('sin base de datos')
+        return {'properties': PROPERTIES, 'data_source': 'json'}
+
+    snapshot = CatalogSnapshot(loader, ttl_seconds=300)
+    snapshot.retry_seconds = 0.1
+    for _ in range(5):
+        assert snapshot.get_properties() == []
+    assert len(calls) == 1
+    assert snapshot.get_stats()['failures'] == 1
+
+    failing[0] = False
+    time.sleep(0.15)
+    assert snapshot.get_properties() == PROPERTIES
+    assert len(calls) == 2
+    assert snapshot.get_stats()['retry_in_seconds'] is None
+
+
+def test_error_en_recarga_conserva_el_snapshot_anterior():
+    responses = [{'properties': PROPERTIES, 'data_source': 'json'}]
+
+    def loader():
+        if not responses:
+            raise ConnectionError('sin base de datos')
+        return responses.pop()
+
+    snapshot = CatalogSnapshot(loader, ttl_seconds=300)
+    snapshot.load()
+    snapshot.loaded_at -= 301
+    assert snapshot.get_properties() == PROPERTIES
+    assert snapshot.version == 1 and snapshot.index is not None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Pruebas del control de admisión de llamadas al LLM (AdmissionController):
+prioridad en la cola, descarte con cola llena y cupos devueltos al cancelar.
+Se ejecuta con pytest o directamente: python test_llm_admission.py
+"""
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.llm_admission_service import (
+    AdmissionController, AdmissionRejected, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+)
+
+
+def test_cancelar_durante_la_pausa_devuelve_el_cupo():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5)
+        controller.pause(2)
+        task = asyncio.ensure_future(controller.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0.05)
+        assert controller.get_stats()['active'] == 1
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        assert controller.get_stats()['active'] == 0
+
+    asyncio.run(run())
+
+
+def test_cancelar_en_la_cola_no_pierde_cupos():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5)
+        await controller.acquire()
+        waiting = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+        controller.release()
+        stats = controller.get_stats()
+        assert (stats['active'], stats['waiting']) == (0, 0)
+
+    asyncio.run(run())
+
+
+def test_prioridad_en_la_cola():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5)
+        order = []
+
+        async def call(name, priority):
+            async with controller.slot(priority):
+                order.append(name)
+
+        await controller.acquire()
+        tasks = [asyncio.ensure_future(call('background', PRIORITY_BACKGROUND))]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.ensure_future(call('interactive', PRIORITY_INTERACTIVE)))
+        await asyncio.sleep(0.01)
+        controller.release()
+        await asyncio.gather(*tasks)
+        assert order == ['interactive', 'background']
+        assert controller.get_stats()['active'] == 0
+
+    asyncio.run(run())
+
+
+def test_cola_llena_descarta():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        await controller.acquire()
+        queued = asyncio.ensure_future(controller.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0.01)
+        try:
+            await controller.acquire(PRIORITY_BACKGROUND)
+            assert False, 'debía descartarse'
+        except AdmissionRejected:
+            pass
+        controller.release()
+        await queued
+        controller.release()
+        assert controller.get_stats()['active'] == 0
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -23,7 +23,7 @@ import asyncio
 # Agregar el directorio backend al path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.services.llm_service import LLMService
+from app.services.llm_coordination_service import LLMService
 
 async def test_priority_vs_type():
     """Test que valida que características específicas tengan más peso que tipo."""
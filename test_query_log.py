@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Pruebas del log de consultas (QueryLog): escritura fuera del event loop,
+compactación al doble de la ventana y carga del archivo existente.
+Se ejecuta con pytest o directamente: python test_query_log.py
+"""
+import asyncio
+import threading
+import tempfile
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.query_log_service import QueryLog
+
+
+def _lines(path) -> int:
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+
+def test_record_escribe_fuera_del_event_loop():
+    async def run(log: QueryLog):
+        writers = []
+        flush = log.flush
+
+        def tracked_flush():
+            writers.append(threading.current_thread())
+            flush()
+
+        log.flush = tracked_flush
+        for _ in range(3):
+            log.record('Casa en Zona 10')
+        await asyncio.sleep(0.1)
+        assert writers and all(thread is not threading.main_thread() for thread in writers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = QueryLog(path=os.path.join(tmp, 'log.jsonl'), max_entries=10)
+        asyncio.run(run(log))
+        assert _lines(log.path) == 3
+        assert log.top_queries(1) == ['casa en zona 10']
+
+
+def test_compacta_al_doble_de_la_ventana():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = QueryLog(path=os.path.join(tmp, 'log.jsonl'), max_entries=5)
+        for i in range(9):
+            log.record(f'consulta {i}')
+        assert _lines(log.path) == 9
+        log.record('consulta 9')
+        assert _lines(log.path) == 5
+
+
+def test_carga_el_archivo_existente():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'log.jsonl')
+        first = QueryLog(path=path, max_entries=10)
+        for query in ('casa', 'casa', 'terreno'):
+            first.record(query)
+        second = QueryLog(path=path, max_entries=10)
+        second.record('terreno')
+        second.record('terreno')
+        assert second.top_queries(2) == ['terreno', 'casa']
+        assert _lines(path) == 5
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
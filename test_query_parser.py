@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Pruebas del parser de consultas (parse_query): modificadores, rangos, prefijos de moneda
+y ubicaciones del gazetteer. Usa las consultas de test_search.py.
+Se ejecuta con pytest o directamente: python test_query_parser.py
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.query_parser_service import parse_query
+
+
+def test_habitaciones_y_zona():
+    filters = parse_query("Busco casas de 3 habitaciones en zona 10")
+    assert filters.to_dict() == {
+        'tipo': 'casa', 'habitaciones': 3, 'ubicacion_incluye': 'zona 10', 'ubicacion_id': 'zona-10'
+    }
+
+
+def test_menos_de_con_signo_de_moneda():
+    filters = parse_query("Muéstrame departamentos de menos de $150,000")
+    assert filters.tipo == 'departamento'
+    assert filters.precio_max == 150000
+    assert filters.precio_exacto is None
+
+
+def test_mas_de_banos_y_al_menos_metros():
+    filters = parse_query("Propiedades con más de 2 baños y al menos 150 metros cuadrados")
+    assert filters.banos_min == 2
+    assert filters.banos is None
+    assert filters.area_min == 150
+    assert filters.area_max is None
+
+
+def test_rango_de_precio_con_signo_de_moneda():
+    filters = parse_query("Terrenos en venta con precio entre $50,000 y $100,000")
+    assert filters.tipo == 'terreno'
+    assert (filters.precio_min, filters.precio_max) == (50000, 100000)
+    assert filters.precio_exacto is None
+
+
+def test_habitaciones_en_zona_15():
+    filters = parse_query("Departamentos con 2 habitaciones en zona 15")
+    assert filters.to_dict() == {
+        'tipo': 'departamento', 'habitaciones': 2, 'ubicacion_incluye': 'zona 15', 'ubicacion_id': 'zona-15'
+    }
+
+
+def test_minimos_y_maximos():
+    assert parse_query("Mínimo 400000").precio_min == 400000
+    assert parse_query("Hasta 350 mil").precio_max == 350000
+    assert parse_query("casa por lo menos 3 habitaciones").habitaciones_min == 3
+    assert parse_query("máximo 2 baños").banos_max == 2
+    filters = parse_query("entre 2 y 3 baños")
+    assert (filters.banos_min, filters.banos_max) == (2, 3)
+
+
+def test_modificadores_en_plural_y_femenino():
+    filters = parse_query("casas mayores a 200 metros")
+    assert (filters.area_min, filters.area_exacta) == (200, None)
+    filters = parse_query("casa menores a 300 mil")
+    assert (filters.precio_max, filters.precio_exacto) == (300000, None)
+    assert parse_query("terrenos mínimos de 500 metros").area_min == 500
+    assert parse_query("área máxima de 150 metros").area_max == 150
+    assert parse_query("casas máximos 3 habitaciones").habitaciones_max == 3
+
+
+def test_segundo_precio_no_reemplaza_al_primero():
+    filters = parse_query("casa de 500 mil o 600 mil")
+    assert filters.precio_exacto == 500000
+    assert filters.prices == (500000, 600000)
+
+
+def test_zona_1_no_coincide_con_zona_10():
+    assert parse_query("casa en zona 1").ubicacion_id == 'zona-1'
+    assert parse_query("casa en zona 10").ubicacion_id == 'zona-10'
+    assert parse_query("casa z10").ubicacion_id == 'zona-10'
+    assert parse_query("terreno en antigua guatemala").ubicacion_id == 'antigua'
+    assert parse_query("casa en Cayala").ubicacion_id == 'cayala'
+
+
+def test_cobertura():
+    assert parse_query("Busco casas de 3 habitaciones en zona 10").coverage == 1.0
+    assert parse_query("Propiedades con más de 2 baños y al menos 150 metros cuadrados").coverage == 1.0
+    filters = parse_query("Casas publicadas en los últimos 30 días")
+    assert filters.coverage < 0.5
+    assert '30' in filters.uncovered
+    # Modificador sin número aplicado: queda sin cubrir
+    assert 'más' in parse_query("casa más grande").uncovered
+    # Disyunción: la segunda ubicación no entra en el filtro
+    assert parse_query("casa en mixco o villa nueva").uncovered == ('villa', 'nueva')
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
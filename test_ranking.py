@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Pruebas del motor de ranking (RankingEngine, top_k y señales):
+selección top-k contra un orden completo, empates y registros sin modificar.
+Se ejecuta con pytest o directamente: python test_ranking.py
+"""
+import copy
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app.services.ranking_service import (
+    RankingEngine, top_k, membership_signal, order_signal, score_signal,
+    SIGNAL_BOOST, SIGNAL_EXACT, SIGNAL_SEMANTIC, SIGNAL_TEXT
+)
+
+
+def test_top_k_igual_al_orden_completo():
+    rng = np.random.default_rng(7)
+    for size in (0, 1, 5, 100):
+        # Pocos valores distintos para forzar empates
+        scores = rng.integers(0, 4, size).astype(np.float64)
+        expected = sorted(range(size), key=lambda row: (-scores[row], row))
+        for k in (0, 1, 3, size, size + 5):
+            assert top_k(scores, k).tolist() == expected[:k]
+
+
+def test_senales():
+    candidates = [{'id': i} for i in range(4)]
+    assert membership_signal(candidates, [candidates[2]]).tolist() == [0, 0, 1, 0]
+    assert order_signal(candidates, [candidates[3], candidates[1]]).tolist() == [0, 0.5, 0, 1.0]
+    assert score_signal(candidates, [(candidates[0], 4.0), (candidates[1], 2.0)]).tolist() == [1.0, 0.5, 0, 0]
+    # Copias iguales no cuentan: las señales van por identidad del registro
+    assert membership_signal(candidates, [dict(candidates[0])]).tolist() == [0, 0, 0, 0]
+    assert score_signal(candidates, []).tolist() == [0, 0, 0, 0]
+
+
+def test_rank_combina_senales_sin_modificar_registros():
+    candidates = [{'id': i, 'titulo': f'propiedad {i}'} for i in range(5)]
+    original = copy.deepcopy(candidates)
+    engine = RankingEngine({SIGNAL_BOOST: 1.0, SIGNAL_EXACT: 0.5, SIGNAL_SEMANTIC: 0.5, SIGNAL_TEXT: 0.5})
+    signals = {
+        SIGNAL_BOOST: np.array([0, 10, 0, 10, 0], dtype=np.float64),
+        SIGNAL_EXACT: membership_signal(candidates, [candidates[3], candidates[4]]),
+        SIGNAL_TEXT: score_signal(candidates, [(candidates[2], 1.0)]),
+    }
+    page = engine.rank(candidates, signals, k=3)
+    # El boost domina; las demás señales desempatan
+    assert [prop['id'] for prop in page.properties] == [3, 1, 2]
+    assert page.scores == [10.5, 10.0, 0.5]
+    assert page.total == 5 and page.boost_applied
+    assert candidates == original
+
+
+def test_sin_boost_y_senales_sin_peso():
+    candidates = [{'id': i} for i in range(3)]
+    engine = RankingEngine({SIGNAL_SEMANTIC: 1.0})
+    signals = {SIGNAL_SEMANTIC: order_signal(candidates, [candidates[1]]),
+               SIGNAL_TEXT: np.ones(3), SIGNAL_BOOST: np.zeros(3)}
+    page = engine.rank(candidates, signals, k=10)
+    assert [prop['id'] for prop in page.properties] == [1, 0, 2]
+    assert not page.boost_applied
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -8,7 +8,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.services.llm_service import LLMService
+from app.services.llm_coordination_service import LLMService
 import json
 
 async def test_search_queries():
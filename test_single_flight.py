@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la coalescencia de llamadas al LLM (SingleFlight y OllamaClient._chat):
+una sola llamada upstream por llave, cancelación y aislamiento del deadline de cada petición.
+No llama al LLM: _post_chat se reemplaza por una llamada simulada.
+Se ejecuta con pytest o directamente: python test_single_flight.py
+"""
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.single_flight_service import SingleFlight
+from app.services.ollama_client_service import OllamaClient
+from app.services.llm_admission_service import llm_priority, PRIORITY_INTERACTIVE, PRIORITY_VALIDATION
+from app.services.request_deadline_service import current_deadline, request_deadline
+
+PAYLOAD = {'model': 'test', 'messages': [{'role': 'user', 'content': 'hola'}], 'stream': False}
+
+
+def test_llamadas_identicas_comparten_la_tarea():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'ok'
+
+        results = await asyncio.gather(*(flight.do('llave', upstream) for _ in range(5)))
+        assert results == ['ok'] * 5
+        assert len(calls) == 1
+        assert flight.get_stats()['coalesced'] == 4
+
+    asyncio.run(run())
+
+
+def test_cancelar_un_llamador_no_corta_a_los_demas():
+    async def run():
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.05)
+            return 'ok'
+
+        first = asyncio.ensure_future(flight.do('llave', upstream))
+        second = asyncio.ensure_future(flight.do('llave', upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == 'ok'
+        assert flight.get_stats()['cancelled_upstream'] == 0
+
+    asyncio.run(run())
+
+
+def test_sin_llamadores_se_cancela_la_llamada_upstream():
+    async def run():
+        flight = SingleFlight()
+        cancelled = []
+
+        async def upstream():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        caller = asyncio.ensure_future(flight.do('llave', upstream))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled == [1]
+        assert flight.get_stats()['in_flight'] == 0
+
+    asyncio.run(run())
+
+
+def _client_with_fake_upstream(seen: list, delay: float = 0.1) -> OllamaClient:
+    client = OllamaClient()
+    client.single_flight_enabled = True
+
+    async def fake_post_chat(payload, max_retries=3):
+        seen.append((max_retries, current_deadline()))
+        await asyncio.sleep(delay)
+        return {'message': {'content': 'ok'}}
+
+    client._post_chat = fake_post_chat
+    return client
+
+
+def test_la_llamada_compartida_no_hereda_el_deadline_del_lider():
+    async def run():
+        seen = []
+        client = _client_with_fake_upstream(seen, delay=0.9)
+
+        async def leader():
+            with request_deadline(0.6) as deadline:
+                result = await client._chat(PAYLOAD)
+                return result, deadline.partial
+
+        async def follower():
+            await asyncio.sleep(0.01)
+            with request_deadline(5) as deadline:
+                result = await client._chat(PAYLOAD)
+                return result, deadline.partial
+
+        (leader_result, leader_partial), (follower_result, follower_partial) = await asyncio.gather(leader(), follower())
+        assert len(seen) == 1 and seen[0][1] is None
+        # El líder corta su espera con su deadline; el otro recibe la respuesta completa
+        assert leader_result is None and leader_partial
+        assert follower_result == {'message': {'content': 'ok'}} and not follower_partial
+
+    asyncio.run(run())
+
+
+def test_reintentos_y_prioridad_distintos_no_se_comparten():
+    async def run():
+        seen = []
+        client = _client_with_fake_upstream(seen, delay=0.02)
+
+        async def call(max_retries, priority):
+            with llm_priority(priority):
+                return await client._chat(PAYLOAD, max_retries=max_retries)
+
+        await asyncio.gather(call(1, PRIORITY_VALIDATION), call(3, PRIORITY_VALIDATION),
+                             call(3, PRIORITY_INTERACTIVE), call(3, PRIORITY_INTERACTIVE))
+        assert sorted(retries for retries, _ in seen) == [1, 3, 3]
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
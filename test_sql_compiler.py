@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Pruebas del compilador de filtros a SQL (SQLCompiler): predicados, confianza y ubicaciones.
+Usa las consultas de test_search.py. No necesita base de datos ni LLM.
+Se ejecuta con pytest o directamente: python test_sql_compiler.py
+"""
+import re
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.sql_compiler_service import SQLCompiler, CompiledQuery
+from app.services.sql_validation_service import SQLService
+
+
+def _predicates(compiled: CompiledQuery) -> str:
+    """SQL con los parámetros sustituidos, solo para comparar en las pruebas"""
+    sql = compiled.sql
+    for value in compiled.params:
+        sql = sql.replace('%s', repr(value), 1)
+    return sql
+
+
+def test_mas_de_banos_y_al_menos_metros():
+    compiled = SQLCompiler(limit=50).plan("Propiedades con más de 2 baños y al menos 150 metros cuadrados")
+    assert compiled is not None and compiled.confidence == 1.0
+    assert "WHERE banos >= 2.0 AND area_m2 >= 150.0 ORDER BY" in _predicates(compiled)
+
+
+def test_rango_de_precio_con_signo_de_moneda():
+    compiled = SQLCompiler(limit=50).plan("Terrenos en venta con precio entre $50,000 y $100,000")
+    assert compiled is not None
+    assert "WHERE tipo = 'terreno' AND precio BETWEEN 50000.0 AND 100000.0 ORDER BY" in _predicates(compiled)
+
+
+def test_menos_de_con_signo_de_moneda():
+    compiled = SQLCompiler(limit=50).plan("Muéstrame departamentos de menos de $150,000")
+    assert compiled is not None
+    assert "WHERE tipo = 'departamento' AND precio <= 150000.0 ORDER BY" in _predicates(compiled)
+
+
+def test_consulta_abierta_usa_el_llm():
+    compiler = SQLCompiler()
+    assert compiler.plan("Casas publicadas en los últimos 30 días") is None
+    assert compiler.plan("casa moderna con piscina") is None
+    assert compiler.plan("propiedades en venta") is None
+    stats = compiler.get_stats()
+    assert (stats['compiled'], stats['llm_fallbacks']) == (0, 3)
+
+
+def test_sql_compilado_pasa_la_validacion():
+    compiled = SQLCompiler().plan("Busco casas de 3 habitaciones en zona 10")
+    assert compiled is not None
+    assert SQLService.validate_sql(None, compiled.sql)
+
+
+def test_zona_1_anclada_en_sql():
+    regexp = SQLCompiler.location_regexp('zona 1')
+    # REGEXP de MySQL con colación _ci: sin distinguir mayúsculas
+    assert re.search(regexp, 'Zona 1, Guatemala', re.IGNORECASE)
+    assert re.search(regexp, 'Guatemala, zona-1', re.IGNORECASE)
+    assert not re.search(regexp, 'Zona 10, Guatemala', re.IGNORECASE)
+    assert not re.search(regexp, 'Zona 14', re.IGNORECASE)
+
+
+def test_limite_despues_de_revisar_la_ubicacion():
+    compiled = SQLCompiler(limit=5).plan("casa en zona 1")
+    # El SQL pide filas extra; el límite se aplica tras descartar las de otra zona
+    assert compiled.params[-1] > 5
+    rows = [{'id': i, 'ubicacion': 'Zona 10, Guatemala'} for i in range(20)]
+    rows += [{'id': 100 + i, 'ubicacion': 'Zona 1, Guatemala'} for i in range(8)]
+    refined = compiled.refine(rows)
+    assert [row['id'] for row in refined] == [100, 101, 102, 103, 104]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
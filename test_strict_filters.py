@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los filtros estrictos: _matches_strict_filters y la máscara de ColumnarIndex
+deben elegir las mismas propiedades, también con habitaciones o baños nulos (columnas nullable).
+Se ejecuta con pytest o directamente: python test_strict_filters.py
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.columnar_index_service import ColumnarIndex
+from app.services.property_search_service import PropertySearchService
+from app.services.query_parser_service import parse_query
+
+RECORDS = [
+    {'id': 1, 'tipo': 'casa', 'precio': 250000, 'habitaciones': 3, 'banos': 2, 'area_m2': 180, 'ubicacion': 'Zona 10'},
+    {'id': 2, 'tipo': 'terreno', 'precio': 90000, 'habitaciones': None, 'banos': None, 'area_m2': 500, 'ubicacion': 'Mixco'},
+    {'id': 3, 'tipo': 'casa', 'precio': 280000, 'habitaciones': None, 'banos': 2.5, 'area_m2': 220, 'ubicacion': 'Zona 10'},
+    {'id': 4, 'tipo': 'departamento', 'precio': 140000, 'habitaciones': 2, 'banos': None, 'area_m2': 90, 'ubicacion': 'Zona 14'},
+]
+
+QUERIES = [
+    "Terrenos en venta con precio entre $50,000 y $100,000",
+    "casa menores a 300 mil",
+    "casas mayores a 200 metros",
+    "Busco casas de 3 habitaciones en zona 10",
+    "Propiedades con más de 2 baños y al menos 150 metros cuadrados",
+    "departamento de 2 habitaciones",
+]
+
+
+def _python_ids(query: str) -> list:
+    service = PropertySearchService(None)
+    filters = parse_query(query).to_dict()
+    return [prop['id'] for prop in RECORDS if service._matches_strict_filters(prop, filters)]
+
+
+def _mask_ids(query: str) -> list:
+    index = ColumnarIndex(RECORDS, 1)
+    return [RECORDS[row]['id'] for row, keep in enumerate(index.mask(parse_query(query))) if keep]
+
+
+def test_nulos_solo_fallan_sus_propios_filtros():
+    assert _python_ids("Terrenos en venta con precio entre $50,000 y $100,000") == [2]
+    assert _python_ids("casa menores a 300 mil") == [1, 3]
+    assert _python_ids("casas mayores a 200 metros") == [3]
+    assert _python_ids("Busco casas de 3 habitaciones en zona 10") == [1]
+    assert _python_ids("Propiedades con más de 2 baños y al menos 150 metros cuadrados") == [1, 3]
+
+
+def test_lista_y_mascara_coinciden():
+    for query in QUERIES:
+        assert _python_ids(query) == _mask_ids(query), query
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
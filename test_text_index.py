@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Pruebas del índice invertido BM25 (TextIndex): tokenización, orden de resultados,
+top-k y cambios incrementales (sync, upsert, remove).
+Se ejecuta con pytest o directamente: python test_text_index.py
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.text_index_service import TextIndex, tokenize
+
+CATALOG = [
+    {'id': 1, 'titulo': 'Casa con piscina', 'tipo': 'casa', 'ubicacion': 'Zona 10', 'descripcion': 'jardín amplio'},
+    {'id': 2, 'titulo': 'Apartamento', 'tipo': 'departamento', 'ubicacion': 'Zona 14', 'descripcion': 'con piscina'},
+    {'id': 3, 'titulo': 'Terreno', 'tipo': 'terreno', 'ubicacion': 'Mixco', 'descripcion': 'plano'},
+    {'id': 4, 'titulo': 'Casa', 'tipo': 'casa', 'ubicacion': 'Mixco', 'descripcion': 'jardín'},
+]
+
+
+def _ids(results):
+    return [record['id'] for record, _ in results]
+
+
+def test_tokenize_sin_tildes_ni_plurales():
+    assert tokenize('Casas con Jardines y Habitaciones') == ['casa', 'jardin', 'habitacion']
+
+
+def test_el_titulo_pesa_mas_que_la_descripcion():
+    index = TextIndex.from_records(CATALOG)
+    results = index.search(['piscina'])
+    assert _ids(results) == [1, 2]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_top_k_y_empates_en_orden_del_catalogo():
+    index = TextIndex.from_records(CATALOG)
+    full = index.search(['casa jardín'])
+    assert _ids(full) == _ids(index.search(['casa jardín'], k=10))
+    assert _ids(index.search(['casa jardín'], k=1)) == _ids(full)[:1]
+    assert _ids(index.search(['mixco'])) == [3, 4]
+    assert index.search(['inexistente']) == [] and index.search([]) == []
+
+
+def test_sync_aplica_solo_los_cambios():
+    index = TextIndex.from_records(CATALOG)
+    changed = [dict(CATALOG[0], titulo='Casa con terraza')] + CATALOG[1:3]
+    assert index.sync(changed) == {'added': 0, 'updated': 1, 'unchanged': 2, 'removed': 1}
+    assert _ids(index.search(['piscina'])) == [2]
+    assert _ids(index.search(['terraza'])) == [1]
+    assert index.size == 3
+
+
+def test_upsert_y_remove():
+    index = TextIndex.from_records(CATALOG)
+    before = index.get_stats()
+    assert index.upsert({'id': 5, 'titulo': 'Bodega', 'tipo': 'local'}) == 'added'
+    assert index.upsert({'id': 5, 'titulo': 'Bodega', 'tipo': 'local'}) == 'unchanged'
+    assert _ids(index.search(['bodega'])) == [5]
+    assert index.remove(5) and not index.remove(5)
+    assert index.search(['bodega']) == []
+    # Quitar el documento también limpia sus postings y términos
+    assert index.get_stats() == dict(before, searches=index.searches)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
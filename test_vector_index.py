@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Pruebas del índice vectorial (VectorIndex.search) sobre candidatos:
+candidatos sin id y límite de embeddings por petición con embedder remoto.
+No llama al LLM: usa el embedder de hashing y un embedder remoto simulado.
+Se ejecuta con pytest o directamente: python test_vector_index.py
+"""
+import tempfile
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.vector_index_service import HashingEmbedder, VectorIndex
+
+CATALOG = [
+    {'id': 1, 'titulo': 'Casa con jardín', 'tipo': 'casa', 'ubicacion': 'Zona 10', 'descripcion': 'amplia'},
+    {'id': 2, 'titulo': 'Apartamento moderno', 'tipo': 'departamento', 'ubicacion': 'Zona 14', 'descripcion': 'vista'},
+    {'id': 3, 'titulo': 'Terreno plano', 'tipo': 'terreno', 'ubicacion': 'Mixco', 'descripcion': 'lote'},
+]
+
+
+class RemoteEmbedder(HashingEmbedder):
+    """Embedder de hashing que se declara remoto y cuenta los textos que calcula"""
+
+    def __init__(self):
+        super().__init__(dim=64)
+        self.remote = True
+        self.embedded = 0
+
+    def embed(self, texts):
+        self.embedded += len(texts)
+        return super().embed(texts)
+
+
+def test_candidato_sin_id_no_toma_el_vector_de_otra_fila():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex(HashingEmbedder(dim=64), directory=tmp)
+        index.sync(CATALOG)
+        # En la posición 0, pero no es la propiedad de la fila 0 del catálogo
+        terreno = {key: value for key, value in CATALOG[2].items() if key != 'id'}
+        results = index.search('terreno plano en mixco', 1, candidates=[terreno])
+        expected = index.search('terreno plano en mixco', 1, candidates=[CATALOG[2]])
+        assert results[0][1] == expected[0][1] > 0.5
+        assert index.stats['request_embedded'] == 0
+
+
+def test_embedder_remoto_acota_los_embeddings_por_peticion():
+    with tempfile.TemporaryDirectory() as tmp:
+        embedder = RemoteEmbedder()
+        index = VectorIndex(embedder, directory=tmp)
+        index.request_embed_limit = 2
+        index.sync(CATALOG)
+        embedder.embedded = 0
+        candidates = [{'id': 100 + i, 'titulo': f'Casa nueva {i}', 'tipo': 'casa'} for i in range(5)]
+        results = index.search('casa nueva', 5, candidates=candidates)
+        assert len(results) == 5
+        assert embedder.embedded == 1 + 2  # la consulta y dos candidatos
+        assert index.stats['request_skipped'] == 3
+        assert sum(1 for _, score in results if score == 0.0) == 3
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")